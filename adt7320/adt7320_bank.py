@@ -0,0 +1,135 @@
+"""
+A bank of emulated ADT7320 chips on read_adt7320's SPI bus.
+
+Adt7320Bank.run() is one coroutine that serves every chip select: it
+wakes only when 'cs' changes, looks the new 'cs' code up in 'decode'
+to find the selected chip (see adt7320_model.py), and forks one SPI
+transaction that follows 'sclk' until 'cs' is deasserted.
+read_adt7320 drives one active-low 'cs' line per chip (110, 101, 011,
+and 111 for none), which is the default 'decode'; a board that
+decodes the 3-bit 'cs' into eight selects needs only a different map.
+
+Each chip may replay a temperature waveform (Adt7320.set_waveform),
+taking one sample per temperature read.  The bank keeps, per chip,
+every word it sent and, on each deassertion of 'cs', the state of
+'result_ena' and (a clock later) of that chip's 'result'; check()
+compares the two sequences in one pass at the end of the run, so a
+long soak run costs nothing per transaction beyond the SPI shifting.
+"""
+
+import cocotb
+import numpy
+
+from cocotb.triggers import Edge, FallingEdge, RisingEdge
+
+from adt7320_model import TEMP
+
+
+class Adt7320Bank:
+
+    def __init__(self, tester, chips, decode=None):
+        self.tester = tester
+        self.chips = list(chips)
+        ra = tester.dut.ra
+        self.cs, self.sclk, self.din, self.dout = (
+            ra.cs, ra.sclk, ra.din, ra.dout)
+        self.ncs = len(self.cs)
+        self.idle = (1 << self.ncs) - 1  # 'cs' code selecting nothing
+        if decode is None:
+            # One active-low select line per chip
+            decode = {self.idle ^ 1 << k: k for k in range(len(self.chips))}
+        self.decode = decode
+        self.sent = [[] for _ in self.chips]  # result word per read
+        self.seen = [[] for _ in self.chips]  # 'result' after each read
+        self.ena = [[] for _ in self.chips]  # 'result_ena' at deselect
+        self.reading = None  # chip being read
+        self.pending = None  # chip whose 'result' is due to be read
+
+    async def run(self):
+        """serve all chip selects, forever"""
+        t = self.tester
+        xfer = None
+        self.dout <= 1
+        while True:
+            await Edge(self.cs)
+            if self.pending is not None:
+                self.read_result()
+            if xfer is not None:
+                xfer.kill()
+                xfer = None
+                self.dout <= 1
+            if self.reading is not None:
+                # read_adt7320 writes 'result' on this clock
+                self.ena[self.reading].append(t.rdint("ra.result_ena"))
+                self.pending, self.reading = self.reading, None
+            cs = self.cs.value.integer
+            if cs == self.idle:
+                continue
+            k = self.decode.get(cs)
+            if k is None:
+                print("adt7320 : cs={:0{}b} selects no single chip".format(
+                    cs, self.ncs))
+                t.check(False)
+                continue
+            xfer = cocotb.fork(self.transaction(k))
+
+    def read_result(self):
+        """record 'result' of the chip deselected on the last edge"""
+        k, self.pending = self.pending, None
+        self.seen[k].append(self.tester.rdint("result{}".format(k)))
+
+    async def shift_in(self, nbits):
+        """shift in an 'nbits' word from 'din', on rising edges of
+        'sclk', most significant bit first"""
+        word = 0
+        for _ in range(nbits):
+            await RisingEdge(self.sclk)
+            word = (word << 1) | self.din.value.integer
+        return word
+
+    async def shift_out(self, word, nbits):
+        """shift out an 'nbits' word onto 'dout', on falling edges of
+        'sclk', most significant bit first"""
+        for i in reversed(range(nbits)):
+            await FallingEdge(self.sclk)
+            self.dout <= word >> i & 1
+
+    async def transaction(self, k):
+        """one command byte and one register transfer with chip k"""
+        chip = self.chips[k]
+        self.dout <= 0
+        cmd = await self.shift_in(8)
+        addr = cmd >> 3 & 7
+        nbits = chip.width(addr)
+        if cmd >> 6 & 1:
+            if addr == TEMP:
+                chip.convert(self.tester.ns())
+            word = chip.read(addr)
+            self.sent[k].append(word << 16 - nbits & 0xffff)
+            self.reading = k
+            await self.shift_out(word, nbits)
+            # Clocks past the end of the register read as 0
+            await FallingEdge(self.sclk)
+            self.dout <= 0
+        else:
+            chip.write(addr, await self.shift_in(nbits))
+
+    def check(self, maxprint=10):
+        """compare each chip's 'result' sequence with the words sent"""
+        t = self.tester
+        if self.pending is not None:
+            self.read_result()
+        for k in range(len(self.chips)):
+            seen = numpy.array(self.seen[k], dtype=numpy.int64)
+            sent = numpy.array(self.sent[k][:len(seen)], dtype=numpy.int64)
+            ena = numpy.array(self.ena[k], dtype=bool)
+            # The last word sent may still be on its way
+            t.check(len(self.sent[k]) - len(seen) in (0, 1))
+            bad = numpy.flatnonzero(seen != sent)
+            for i in bad[:maxprint]:
+                print("adt7320 {} : read {} result {:04x} expected {:04x}"
+                      .format(k, i, seen[i], sent[i]))
+            t.check(len(bad) == 0)
+            t.check(ena.all())
+            print("adt7320 {} : {} reads, {} bad, {} without result_ena"
+                  .format(k, len(seen), len(bad), (~ena).sum()))
@@ -0,0 +1,181 @@
+"""
+Register-level model of one ADT7320 temperature sensor.
+
+The ADT7320's SPI interface is a command byte followed by the contents
+of one register, 8 or 16 bits, most significant bit first:
+
+  command byte  0 R/W* a a a C 0 0
+                R/W* = 1 to read; 'aaa' = register address;
+                C = continuous read (not modelled)
+
+The chip samples DIN on rising edges of SCLK and changes DOUT on
+falling edges.  Adt7320Bank (adt7320_bank.py) does the shifting, a
+whole word at a time, and calls read() and write() here.
+
+Registers (address, width, power-on value):
+
+  0  status       8  0x80  7: RDY*, 6: T_CRIT, 5: T_HIGH, 4: T_LOW
+  1  config       8  0x00  7: resolution (1 = 16 bits)
+  2  temperature 16  0x0000
+  3  ID           8  0xc3
+  4  T_CRIT      16  0x4980  147 C
+  5  T_HYST       8  0x05    5 C
+  6  T_HIGH      16  0x2000  64 C
+  7  T_LOW       16  0x0500  10 C
+
+Temperatures are two's complement.  In 13-bit mode (the default) the
+temperature register holds 1/16 C units in bits 15:3 and the T_CRIT,
+T_HIGH, T_LOW flags in bits 2:0; in 16-bit mode it holds 1/128 C
+units.  The limit registers are always in 13-bit format.  The flags
+follow the comparator, with T_HYST of hysteresis, rather than being
+cleared when read.  RDY* goes low when set_temp() finishes a
+conversion and high again when the temperature register is read.
+
+A chip may also replay a temperature waveform, a NumPy array of
+temperatures in C (set_waveform): either one sample per conversion,
+'stride' samples apart, to compress hours of thermal history into a
+short run, or sampled every 'dt_ns' of simulation time and linearly
+interpolated at the time of each conversion.  The bench calls
+convert() at the start of each temperature read.
+"""
+
+import numpy
+
+STATUS, CONFIG, TEMP, ID, T_CRIT, T_HYST, T_HIGH, T_LOW = range(8)
+REG_NAMES = ("status", "config", "temp", "id",
+             "t_crit", "t_hyst", "t_high", "t_low")
+REG_WIDTH = (8, 8, 16, 8, 16, 8, 16, 16)
+POWER_ON = (0x80, 0x00, 0x0000, 0xc3, 0x4980, 0x05, 0x2000, 0x0500)
+READ_ONLY = (STATUS, TEMP, ID)
+
+# Bits of the status register
+RDY_BAR = 0x80
+FLAG_CRIT = 0x40
+FLAG_HIGH = 0x20
+FLAG_LOW = 0x10
+
+
+def celsius_to_raw(celsius):
+    """16-bit (1/128 C) two's-complement code for 'celsius'"""
+    return int(round(celsius * 128)) & 0xffff
+
+
+def raw_to_celsius(raw):
+    """inverse of celsius_to_raw"""
+    if raw & 0x8000:
+        raw -= 0x10000
+    return raw / 128.0
+
+
+class Adt7320:
+
+    def __init__(self, celsius=25.0):
+        self.reset()
+        self.set_temp(celsius)
+        self.waveform = None
+
+    def reset(self):
+        """restore power-on register contents"""
+        self.regs = list(POWER_ON)
+        self.raw = 0  # last conversion, 1/128 C, two's complement
+        self.nreads = 0
+        self.nwrites = 0
+
+    def width(self, addr):
+        return REG_WIDTH[addr & 7]
+
+    def set_temp(self, celsius):
+        """finish a conversion at 'celsius': update the temperature,
+        the flags, and RDY*"""
+        self.raw = celsius_to_raw(celsius)
+        self.update_flags()
+        self.regs[STATUS] &= ~RDY_BAR
+
+    def set_waveform(self, celsius, stride=1, dt_ns=None):
+        """replay the temperatures in array 'celsius': each conversion
+        takes the sample 'stride' after the last one, holding the
+        final sample at the end; or, if 'dt_ns' is given, the one at
+        its simulation time (samples being 'dt_ns' apart)"""
+        self.waveform = numpy.asarray(celsius, dtype=numpy.float64)
+        self.isample = numpy.arange(len(self.waveform))
+        self.stride = stride
+        self.dt_ns = dt_ns
+        self.nconv = 0
+
+    def waveform_at(self, n, now_ns):
+        """waveform temperature for conversion number 'n', made at
+        simulation time 'now_ns'"""
+        w = self.waveform
+        if self.dt_ns is None:
+            return w[min(n * self.stride, len(w) - 1)]
+        return numpy.interp(now_ns / self.dt_ns, self.isample, w)
+
+    def convert(self, now_ns):
+        """make a conversion, if replaying a waveform"""
+        if self.waveform is None:
+            return
+        self.set_temp(self.waveform_at(self.nconv, now_ns))
+        self.nconv += 1
+
+    def update_flags(self):
+        """compare the temperature with the limits (in 1/16 C)"""
+        t = self.signed16(self.raw) >> 3
+        hyst = (self.regs[T_HYST] & 0xf) << 4
+        flags = self.regs[STATUS]
+        crit = self.signed16(self.regs[T_CRIT]) >> 3
+        high = self.signed16(self.regs[T_HIGH]) >> 3
+        low = self.signed16(self.regs[T_LOW]) >> 3
+        if t >= crit:
+            flags |= FLAG_CRIT
+        elif t < crit - hyst:
+            flags &= ~FLAG_CRIT
+        if t >= high:
+            flags |= FLAG_HIGH
+        elif t < high - hyst:
+            flags &= ~FLAG_HIGH
+        if t <= low:
+            flags |= FLAG_LOW
+        elif t > low + hyst:
+            flags &= ~FLAG_LOW
+        self.regs[STATUS] = flags
+
+    @staticmethod
+    def signed16(x):
+        return x - 0x10000 if x & 0x8000 else x
+
+    def celsius(self):
+        """temperature of the last conversion"""
+        return raw_to_celsius(self.raw)
+
+    def peek(self, addr):
+        """contents of register 'addr', without a read's side effects"""
+        addr &= 7
+        if addr == TEMP:
+            if self.regs[CONFIG] & 0x80:
+                return self.raw
+            # Status bits 6:4 are the flags in bits 2:0
+            return self.raw & 0xfff8 | self.regs[STATUS] >> 4 & 7
+        return self.regs[addr]
+
+    def read(self, addr):
+        """contents of register 'addr', as read over SPI"""
+        value = self.peek(addr)
+        if addr & 7 == TEMP:
+            self.regs[STATUS] |= RDY_BAR
+        self.nreads += 1
+        return value
+
+    def write(self, addr, value):
+        """write 'value' to register 'addr' over SPI; writes to
+        read-only registers are ignored"""
+        addr &= 7
+        self.nwrites += 1
+        if addr in READ_ONLY:
+            return
+        self.regs[addr] = value & ((1 << REG_WIDTH[addr]) - 1)
+        self.update_flags()
+
+    def result(self, addr):
+        """16-bit word that read_adt7320 should collect for a read of
+        register 'addr' (8-bit registers arrive in the upper byte)"""
+        return self.peek(addr) << 16 - self.width(addr) & 0xffff
@@ -1,131 +1,54 @@
 
 import cocotb
-import inspect
+import numpy
 import os
-import random
-
-from collections import deque
-from types import SimpleNamespace
-
-
-class Tester:
-
-    def __init__(self, dut):
-        self.dut = dut
-        self.verbose = False
-        self.nchecks_ok = 0
-        self.nchecks_failed = 0
-
-    def check(self, expr):
-        if expr:
-            self.nchecks_ok += 1
-            return
-        self.nchecks_failed += 1
-        callerframerecord = inspect.stack()[1]
-        frame = callerframerecord[0]
-        info = inspect.getframeinfo(frame)
-        where = "{}:{}:{} :: {}".format(
-            info.function, os.path.basename(info.filename),
-            info.lineno, info.code_context[0].strip())
-        # https://stackoverflow.com/questions/6810999/
-        #   how-to-determine-file-function-and-line-number
-        ns = self.ns()
-        print("CHECKFAIL@{:.0f}:".format(ns), where)
-
-    def ns(self):
-        """return current simulation time in nanoseconds"""
-        return cocotb.utils.get_sim_time(units="ns")
-        
-    async def wclk(self, nclk=1, rising=True):
-        """shortcut for await ClockCycles(self.dut.clk, ...)"""
-        await cocotb.triggers.ClockCycles(self.dut.clk, nclk, rising=rising)
+
+from cocotb.triggers import Edge
+
+from adt7320_bank import Adt7320Bank
+from adt7320_model import Adt7320, REG_NAMES
+from tbcommon import TesterBase
+
+# Duration of one read_adt7320 transaction (one chip): 76 ticks of 1 MHz
+TRANSACTION_NS = 76000
+
+
+def thermal_waveforms(nchips, nsamples):
+    """'nsamples' of board temperature (C) per chip, one per second:
+    each chip warms up from room temperature with a 20-minute time
+    constant towards its own operating point, plus a slow oscillation
+    that takes the hottest chip across T_HIGH and back"""
+    t = numpy.arange(nsamples)
+    w = numpy.zeros((nchips, nsamples))
+    for k in range(nchips):
+        top = 45.0 + 10*k
+        w[k] = 22.0 + (top - 22.0)*(1 - numpy.exp(-t/1200.0))
+        w[k] += 4.0*k*numpy.sin(2*numpy.pi*t/3600.0)
+    return w
+
+
+class Tester(TesterBase):
 
     async def wait_resp_ena(self):
         """wait for next update of 'result'"""
-        while self.dut.ra.result_ena.value.integer == 1:
-            await self.wclk()
-        while self.dut.ra.result_ena.value.integer == 0:
-            await self.wclk()
-        while self.dut.ra.result_ena.value.integer == 1:
-            await self.wclk()
-        
-    async def adt7320_emulator(self):
-        """emulate one ADT7320 chip"""
-        IDLE = 0
-        CMD = 1
-        CMD1 = 2
-        PRERESP = 3
-        RESP = 4
-        RESP1 = 5
-        POSTRESP = 6
+        # 'result' is written on the same clock as 'cs' is deasserted
         ra = self.dut.ra
-        # Create a place to store this coroutine's internal state, so
-        # that it can be accessed from the enclosing 'Tester'
-        # instance.  I'll give it the absurdly short name 'o' (short
-        # for "object") to avoid clutter below.
-        o = SimpleNamespace()
-        o.state = IDLE
-        o.count = 0
-        o.cmd = 0
-        while True:
-            await self.wclk()  # This loop executes once per clk cycle
-            if o.state==IDLE:
-                ra.dout <= 1
-                if ra.cs.value.integer != 7:
-                    o.state = CMD
-                    o.count = 0
-                    o.cmd = 0
-            elif o.state==CMD:
-                ra.dout <= 0
-                if ra.sclk.value.integer == 0:
-                    o.state = CMD1
-                    o.count += 1
-            elif o.state==CMD1:
-                if ra.sclk.value.integer == 1:
-                    o.cmd = (o.cmd<<1) | ra.din.value.integer
-                    if o.count==8:
-                        o.state = PRERESP
-                    else:
-                        o.state = CMD
-            elif o.state==PRERESP:
-                o.respout = 0
-                r_wbar = o.cmd>>6 & 1
-                addr = o.cmd>>3 & 7
-                if r_wbar and addr==0:
-                    # status
-                    o.respout = 0x8000
-                    o.state = RESP
-                elif r_wbar and addr==1:
-                    # config
-                    o.respout = 0x0000
-                    o.state = RESP
-                elif r_wbar and addr==2:
-                    # temperature
-                    o.respout = 0x4230 | (ra.cs.value.integer ^ 7)
-                    o.state = RESP
-                elif r_wbar and addr==3:
-                    # id
-                    o.respout = 0xc300
-                    o.state = RESP
-                else:
-                    o.state = IDLE
-            elif o.state==RESP:
-                if ra.sclk.value.integer == 0:
-                    ra.dout <= o.respout>>15 & 1
-                    o.state = RESP1
-                    o.count += 1
-            elif o.state==RESP1:
-                if ra.sclk.value.integer == 1:
-                    o.respout = (o.respout << 1) & 0xffff
-                    if o.count==24:
-                        o.state = POSTRESP
-                    else:
-                        o.state = RESP
-            elif o.state==POSTRESP:
-                o.count += 1
-                if o.count==100:
-                    o.state = IDLE
-                
+        while ra.cs.value.integer == 7:
+            await Edge(ra.cs)
+        while ra.cs.value.integer != 7:
+            await Edge(ra.cs)
+        await self.wclk()
+
+    def check_results(self, addr):
+        """check each chip's 'result' for a read of register 'addr'"""
+        for k, chip in enumerate(self.chips):
+            got = self.rdint("result{}".format(k))
+            want = chip.result(addr)
+            if got != want:
+                print("adt7320 : result{} {:04x} expected {:04x}".format(
+                    k, got, want))
+            self.check(got == want)
+
     async def run_test1(self):
         """initial very simple test of read_adt7320 module"""
         dut = self.dut
@@ -146,27 +69,50 @@ class Tester:
         dut.reset <= 0
         await self.wclk(10)
 
-        # Instantiate emulated ADT7320 chip
-        self.adt7320 = cocotb.fork(self.adt7320_emulator())
+        # Instantiate emulated ADT7320 chips, one per chip-select,
+        # each replaying a temperature waveform, from ADT7320_WAVEFORM
+        # (a .npy file of shape (nchips, nsamples)) if set; by default
+        # four hours of thermal history, compressed into
+        # ADT7320_NREADS temperature reads per chip
+        nreads = int(os.environ.get("ADT7320_NREADS", 20))
+        self.chips = [Adt7320() for _ in range(3)]
+        wavefile = os.environ.get("ADT7320_WAVEFORM")
+        if wavefile:
+            waves = numpy.load(wavefile)
+        else:
+            waves = thermal_waveforms(len(self.chips), 4*3600)
+        nsamples = waves.shape[1]
+        for k, chip in enumerate(self.chips[:-1]):
+            chip.set_waveform(waves[k], stride=max(nsamples // nreads, 1))
+        # ... the last chip interpolating its waveform in simulation time
+        self.chips[-1].set_waveform(
+            waves[len(self.chips)-1],
+            dt_ns=TRANSACTION_NS*len(self.chips)*nreads / nsamples)
+        self.bank = Adt7320Bank(self, self.chips)
+        self.adt7320 = cocotb.fork(self.bank.run())
 
         for _ in range(5):
             await self.wait_resp_ena()
+        self.check_results(3)
 
         dut.addr <= 2  # read the temperature register
-        for _ in range(5):
+        for _ in range(nreads * len(self.chips)):
             await self.wait_resp_ena()
+        self.check_results(2)
 
         await self.wclk(1000)
+        for k, chip in enumerate(self.chips):
+            print("adt7320 {} : {} reads, {:.4g} C, {}".format(
+                k, chip.nreads, chip.celsius(), ", ".join(
+                    "{} {:x}".format(n, chip.peek(a))
+                    for a, n in enumerate(REG_NAMES))))
         
         # Now kill off the coroutines we forked earlier
         self.adt7320.kill()
         await self.wclk(5)
+        self.bank.check()
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
+        self.report_checks()
 
 
 @cocotb.test()
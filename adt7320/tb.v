@@ -38,9 +38,29 @@ module tb;
     // This is needed to create a (compressed) Value Change Dump file
     // in Icarus Verilog, so that we can view the simulation results
     // with gtkwave.  In commercial simulators, this is not necessary.
+    // Dump control (see python/tbcommon/dump.py): +dumpdepth=n dumps
+    // only signals within n levels of 'tb' (default 0: all levels);
+    // +dumpscope=s: (one per scope, e.g. +dumpscope=tb: for tb's own
+    // signals) dumps only the named scopes below, each to depth n;
+    // +dumpoff starts with dumping off; after that, the dump is on
+    // while cocotb holds 'dump_on' high.
+    reg dump_on = 1;
+    integer dumpdepth = 0;
     initial begin
+        if (!$value$plusargs("dumpdepth=%d", dumpdepth)) dumpdepth = 0;
+        if ($test$plusargs("dumpoff")) dump_on = 0;
         $dumpfile("tb.lxt");
-        $dumpvars(0, tb);
+        if ($test$plusargs("dumpscope=")) begin
+            if ($test$plusargs("dumpscope=tb:")) $dumpvars(1, tb);
+            if ($test$plusargs("dumpscope=ra:")) $dumpvars(dumpdepth, tb.ra);
+        end else begin
+            $dumpvars(dumpdepth, tb);
+        end
+        if (!dump_on) $dumpoff;
+    end
+    always @ (dump_on) begin
+        if (dump_on) $dumpon;
+        else $dumpoff;
     end
 endmodule
 
@@ -0,0 +1,165 @@
+"""
+NumPy reference model of the 'coinc' module in mcu_logic.v.
+
+The model works on whole per-clock streams at once.  Element c of each
+input array is what cable A or B presents to 'coinc' on clock c (its
+'single' and 'offset'); element c of each output array is coinc's
+response to that single (pcoinc or ncoinc, and the 'coincdiff' it
+records).  The register arithmetic is reproduced exactly: 6-bit
+offsets sign-extended to 8 bits, the +/-32 adjustment for matches one
+clock apart, 8-bit wraparound of the differences, and the order of
+the tests.  Only clocks with a single on either cable are evaluated,
+so the cost grows with the number of singles, not of clocks.
+
+The same model serves three purposes: tape.py uses it for the expected
+responses on a stimulus tape, tb.py's coinc_scoreboard() compares it
+with the DUT clock by clock, and running this file directly projects
+prompt and accidental coincidence rates at realistic singles rates,
+without simulating any HDL:
+
+    python3 coinc_model.py --rates 1e5 1e6 3e6 --nclk 100000000
+"""
+
+import argparse
+import numpy
+import time
+
+from types import SimpleNamespace
+
+CLK_NS = 10  # 'clk' period
+
+
+def sext6(offset):
+    """sign-extend 6-bit offsets to 8 bits, as 'oAd1' etc. in coinc"""
+    offset = numpy.asarray(offset, dtype=numpy.int16) & 0x3f
+    return offset | numpy.where(offset & 0x20, 0xc0, 0).astype(numpy.int16)
+
+
+def abs8(diff):
+    """'absdiff' of 8-bit 'diff', as in coinc (so abs8(0x80) == 0x80)"""
+    diff = diff & 0xff
+    return numpy.where(diff & 0x80, -diff & 0xff, diff)
+
+
+def coinc_model(singleA, offsetA, singleB, offsetB, diffmax):
+    """model coinc's responses to per-clock single/offset streams
+
+    'diffmax' is either one value or an array of the value in effect
+    when coinc tests each clock's single(s).  Returns a namespace of arrays, one element per clock:
+
+      pcoincA, ncoincA, pcoincB, ncoincB : bool, response to the single
+                                           on that clock
+      coincdiff : int16, the value coinc records for that clock's
+                  single(s), or -1 if it keeps its previous value
+    """
+    sA = numpy.asarray(singleA, dtype=bool)
+    sB = numpy.asarray(singleB, dtype=bool)
+    n = len(sA)
+    ev = numpy.flatnonzero(sA | sB)
+    # Pad by one clock at each end; a cable's offset reads as 0 on
+    # clocks without a single
+    SA = numpy.pad(sA, 1)
+    SB = numpy.pad(sB, 1)
+    OA = numpy.pad(sext6(numpy.where(sA, offsetA, 0)), 1)
+    OB = numpy.pad(sext6(numpy.where(sB, offsetB, 0)), 1)
+    # Slot 1 is this clock, slot 0 the next one, slot 2 the previous
+    # one, as in the 'srA'/'srB' shift registers
+    now, nxt, prv = ev + 1, ev + 2, ev
+    dm = numpy.asarray(diffmax) & 0xff
+    if dm.ndim:
+        dm = dm[ev]
+    oAd1 = OA[now]
+    absdiff1 = abs8(OB[now] - oAd1)
+    absdiff0 = abs8(OB[nxt] + 32 - oAd1)
+    absdiff2 = abs8(OB[prv] - 32 - oAd1)
+    absdiffs = [absdiff1, absdiff0, absdiff2]
+    ok1, ok0, ok2 = absdiff1 <= dm, absdiff0 <= dm, absdiff2 <= dm
+    # coinc uses the same three differences for both sides, tested in
+    # this order; the first match sets 'coincdiff'
+    condA = [SB[now] & ok1, SB[nxt] & ok0, SB[prv] & ok2]
+    condB = [SA[now] & ok1, SA[nxt] & ok0, SA[prv] & ok2]
+    matchA = condA[0] | condA[1] | condA[2]
+    matchB = condB[0] | condB[1] | condB[2]
+    diffA = numpy.select(condA, absdiffs, 0)
+    diffB = numpy.select(condB, absdiffs, 0)
+    m = SimpleNamespace()
+    m.pcoincA = numpy.zeros(n, dtype=bool)
+    m.ncoincA = numpy.zeros(n, dtype=bool)
+    m.pcoincB = numpy.zeros(n, dtype=bool)
+    m.ncoincB = numpy.zeros(n, dtype=bool)
+    m.pcoincA[ev] = sA[ev] & matchA
+    m.ncoincA[ev] = sA[ev] & ~matchA
+    m.pcoincB[ev] = sB[ev] & matchB
+    m.ncoincB[ev] = sB[ev] & ~matchB
+    # B's assignment comes later in the always block, so it wins
+    m.coincdiff = numpy.full(n, -1, dtype=numpy.int16)
+    m.coincdiff[ev] = numpy.where(sB[ev], diffB, diffA)
+    return m
+
+
+def make_singles(rng, nclk, single_rate, coinc_rate, jitter=2.0):
+    """random single/offset streams for cables A and B: independent
+    singles at 'single_rate' Hz on each, of which 'coinc_rate' Hz are
+    true coincidences (same clock and phase, plus Gaussian 'jitter' in
+    offset units); return (sA, oA, sB, oB, true)"""
+    p_single = single_rate * CLK_NS * 1e-9
+    p_coinc = coinc_rate * CLK_NS * 1e-9
+    true = rng.random(nclk) < p_coinc
+    itrue = numpy.flatnonzero(true)
+    phase = rng.integers(-16, 16, len(itrue))
+    streams = []
+    for side in "AB":
+        s = true | (rng.random(nclk) < p_single - p_coinc)
+        o = numpy.zeros(nclk, dtype=numpy.int16)
+        # Accidentals arrive at a random phase within the clock
+        iacc = numpy.flatnonzero(s & ~true)
+        o[iacc] = rng.integers(-16, 16, len(iacc))
+        o[itrue] = numpy.round(phase + rng.normal(0, jitter, len(itrue)))
+        streams += [s, numpy.clip(o, -32, 31) & 0x3f]
+    return streams + [true]
+
+
+def project_rates(single_rate, coinc_rate, diffmax, nclk, seed=None,
+                  chunk=10000000, jitter=2.0):
+    """simulate 'nclk' clocks of singles through the model (in
+    independent chunks); return a dict of rates, in Hz, for cable A"""
+    rng = numpy.random.default_rng(seed)
+    n = dict(singles=0, prompt=0, true_prompt=0, accidental=0)
+    for start in range(0, nclk, chunk):
+        sA, oA, sB, oB, true = make_singles(
+            rng, min(chunk, nclk - start), single_rate, coinc_rate, jitter)
+        m = coinc_model(sA, oA, sB, oB, diffmax)
+        n["singles"] += sA.sum()
+        n["prompt"] += m.pcoincA.sum()
+        n["true_prompt"] += (m.pcoincA & true).sum()
+        n["accidental"] += (m.pcoincA & ~true).sum()
+    seconds = nclk * CLK_NS * 1e-9
+    return {k: v / seconds for k, v in n.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="project coinc rates with the mcu_logic coinc model")
+    parser.add_argument("--rates", type=float, nargs="+",
+                        default=[1e5, 1e6, 3e6], help="singles rates, Hz")
+    parser.add_argument("--coinc-fraction", type=float, default=0.1)
+    parser.add_argument("--diffmax", type=int, default=16)
+    parser.add_argument("--jitter", type=float, default=2.0)
+    parser.add_argument("--nclk", type=int, default=100000000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print("{:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "singles", "true", "prompt", "trueprompt", "accidental",
+        "Mclk/s"))
+    for rate in args.rates:
+        t0 = time.time()
+        r = project_rates(rate, rate * args.coinc_fraction, args.diffmax,
+                          args.nclk, seed=args.seed, jitter=args.jitter)
+        speed = args.nclk / (time.time() - t0) / 1e6
+        print("{:10.4g} {:10.4g} {:10.4g} {:10.4g} {:10.4g} {:10.1f}".format(
+            r["singles"], rate * args.coinc_fraction, r["prompt"],
+            r["true_prompt"], r["accidental"], speed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Symbols on the rocstar <-> MCU cables, as lookup tables.
+
+Each cable carries an 8-bit word per clock from rocstar to MCU
+('to_mcu' in rocstar_mcu_link.v, 'A1in' etc. in tb.v) and a 4-bit word
+per clock from MCU to rocstar ('out' of mcu_logic's 'cable', 'A1out'
+etc.).  The symbol values are the localparams of those two modules.
+
+Rather than testing a received word against each symbol in turn, look
+it up: IN_* tables have 256 entries, one per 8-bit word, and OUT_*
+tables have 16, one per 4-bit word.  They are numpy arrays, for
+decoding whole captured streams at once (e.g. OUT_KIND[stream]),
+except for the *_LIST copies and OUT_RESPONSE, which are plain lists
+for a fast per-clock lookup in a cocotb coroutine.
+
+rocstar -> MCU (8 bits):
+
+  1oooooo0  single trigger, 'oooooo' = 6-bit offset w.r.t. clk edge
+  01ab00cd  IDLE0, 'abcd' = bits 3:0 of the rocstar's IDLE counter
+  01ab01cd  IDLE1, bits 7:4
+  01ab10cd  IDLE2, bits 11:8
+  01ab11cd  IDLE3, bits 15:12; the counter increments after IDLE3
+
+MCU -> rocstar (4 bits): the K_* values below.  A special word is
+K_SPECL followed by the word's four nibbles, most significant first.
+"""
+
+import numpy
+
+# Symbols sent by MCU, as in mcu_logic.v
+K_IDLE0 = 0b0111  # cycle through 4 IDLE words
+K_IDLE1 = 0b1011
+K_IDLE2 = 0b1101
+K_IDLE3 = 0b1110
+K_NCOIN = 0b1001  # no coincidence
+K_PCOIN = 0b0011  # prompt coincidence
+K_DCOIN = 0b0110  # delayed coincidence
+K_SPECL = 0b1100  # begin "special word" sequence
+K_IDLES = (K_IDLE0, K_IDLE1, K_IDLE2, K_IDLE3)
+SPECL_LEN = 5  # K_SPECL plus four nibbles
+
+# Symbols sent by rocstar, as in rocstar_mcu_link.v / mcu_logic.v
+I_TRIGMASK = 0b10000000
+I_IDLEMASK = 0b11001100
+I_IDLES = (0b01000000, 0b01000100, 0b01001000, 0b01001100)
+
+# Kinds of MCU symbol (OUT_KIND); everything else is a test pattern
+IDLE, NCOIN, PCOIN, DCOIN, SPECL, OTHER = range(6)
+KIND_NAMES = ("IDLE", "NCOIN", "PCOIN", "DCOIN", "SPECL", "OTHER")
+
+
+def _out_tables():
+    kind = numpy.full(16, OTHER, dtype=numpy.int8)
+    kind[list(K_IDLES)] = IDLE
+    kind[K_NCOIN] = NCOIN
+    kind[K_PCOIN] = PCOIN
+    kind[K_DCOIN] = DCOIN
+    kind[K_SPECL] = SPECL
+    idle = numpy.full(16, -1, dtype=numpy.int8)
+    idle[list(K_IDLES)] = range(4)
+    return kind, idle
+
+
+def _in_tables():
+    w = numpy.arange(256)
+    trig = (w & I_TRIGMASK) != 0
+    offset = numpy.where(trig, w >> 1 & 0x3f, 0).astype(numpy.uint8)
+    idle = numpy.full(256, -1, dtype=numpy.int8)
+    for k, sym in enumerate(I_IDLES):
+        idle[(w & I_IDLEMASK) == sym] = k
+    nibble = numpy.where(idle >= 0, (w >> 4 & 3) << 2 | w & 3, 0)
+    return trig, offset, idle, nibble.astype(numpy.uint8)
+
+
+# OUT_KIND[s]: kind of MCU symbol s; OUT_IDLE[s]: 0-3 for IDLE0-3,
+# else -1
+OUT_KIND, OUT_IDLE = _out_tables()
+# OUT_RESPONSE[s]: True for PCOIN, False for NCOIN, None otherwise
+OUT_RESPONSE = [{K_PCOIN: True, K_NCOIN: False}.get(s) for s in range(16)]
+OUT_KIND_LIST = OUT_KIND.tolist()
+
+# IN_TRIG[w]: single trigger?  IN_OFFSET[w]: its offset;
+# IN_IDLE[w]: 0-3 for IDLE0-3, else -1; IN_NIBBLE[w]: IDLE counter bits
+IN_TRIG, IN_OFFSET, IN_IDLE, IN_NIBBLE = _in_tables()
+
+
+def encode_trig(offset):
+    """rocstar word for a single trigger at 6-bit 'offset' (an int or
+    an array of them; negative offsets are taken modulo 64)"""
+    return I_TRIGMASK | (numpy.asarray(offset) & 0x3f) << 1
+
+
+def encode_idles(count, n, phase=0):
+    """the 'n' rocstar IDLE words sent from IDLE'phase' onward, when
+    the IDLE counter holds 'count' (it increments after each IDLE3)"""
+    k = numpy.arange(phase, phase + n)
+    counts = (count + k // 4) & 0xffff
+    nib = counts >> 4 * (k % 4) & 0xf
+    idle = numpy.array(I_IDLES)[k % 4]
+    return (idle | (nib >> 2) << 4 | nib & 3).astype(numpy.uint8)
+
+
+def decode_in(words):
+    """decode a stream of rocstar words: return (trig, offset, idle,
+    nibble) arrays, as for the IN_* tables"""
+    w = numpy.asarray(words, dtype=numpy.uint8)
+    return IN_TRIG[w], IN_OFFSET[w], IN_IDLE[w], IN_NIBBLE[w]
+
+
+def idle_counts(words):
+    """(index, count) arrays for each complete IDLE0..IDLE3 run in a
+    stream of rocstar words, 'index' being that of its IDLE0"""
+    w = numpy.asarray(words, dtype=numpy.uint8)
+    idle, nib = IN_IDLE[w].astype(int), IN_NIBBLE[w].astype(int)
+    n = len(w) - 3
+    if n <= 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    run = numpy.ones(n, dtype=bool)
+    count = numpy.zeros(n, dtype=int)
+    for k in range(4):
+        run &= idle[k:k+n] == k
+        count |= nib[k:k+n] << 4 * k
+    index = numpy.flatnonzero(run)
+    return index, count[index]
+
+
+def decode_out(symbols):
+    """decode a stream of MCU symbols: return (kind, special) where
+    'kind' is OUT_KIND of each symbol, except that the four nibbles
+    of each special word count as SPECL too, and 'special' is a list
+    of (index, word) for each special word"""
+    s = numpy.asarray(symbols, dtype=numpy.uint8)
+    kind = OUT_KIND[s]
+    special = []
+    end = 0  # index just past the last special word
+    for i in numpy.flatnonzero(kind == SPECL).tolist():
+        if i < end:
+            continue  # a nibble of the previous special word
+        if i + SPECL_LEN > len(s):
+            break
+        a, b, c, d = s[i+1:i+SPECL_LEN].tolist()
+        special.append((i, a << 12 | b << 8 | c << 4 | d))
+        end = i + SPECL_LEN
+    for i, word in special:
+        kind[i+1:i+SPECL_LEN] = SPECL
+    return kind, special
@@ -0,0 +1,190 @@
+"""
+Vectorized emulator of the rocstar boards on all eight MCU cables.
+
+Tester.fake_rocstar runs one coroutine per board, each making its own
+random.random() calls and keeping its own deque of history.  Here one
+coroutine drives all eight boards at once: per-clock state is kept as
+8-bit masks (bit k is cable CABLES[k]), and the random numbers for a
+whole block of clocks are drawn in one numpy batch.  tb.v provides
+packed 'singles', 'offsets', 'mcu_outs', and 'runmodes' nets, so that
+each clock costs at most four signal accesses however many boards
+there are.  The per-board rules (coincidence delays, jitter, minimum
+idle time, MCU_LATENCY response checks, special-word masking) are the
+same as in fake_rocstar.
+"""
+
+import numpy
+
+from collections import deque
+from types import SimpleNamespace
+
+# Cable order of the bits of the packed nets in tb.v
+CABLES = ("A1", "A2", "A3", "A4", "B1", "B2", "B3", "B4")
+NCABLES = len(CABLES)
+OFFSET_BITS = 6  # width of each cable's field in 'offsets'
+
+
+def field_masks(width):
+    """for each 8-bit cable mask, the mask of the matching 'width'-bit
+    fields of a packed word"""
+    field = (1 << width) - 1
+    return [sum(field << (width*k) for k in range(NCABLES) if m >> k & 1)
+            for m in range(1 << NCABLES)]
+
+
+def nibble_masks(symbols):
+    """for each 16-bit word of four 4-bit MCU symbols, the 4-bit mask
+    of the symbols that are in 'symbols'"""
+    w = numpy.arange(1 << 16)
+    mask = numpy.zeros(len(w), dtype=int)
+    for k in range(4):
+        mask |= numpy.isin((w >> 4*k) & 0xf, symbols) << k
+    return mask.tolist()
+
+
+class MultiRocstar:
+
+    def __init__(self, tester, single_probability=0.03,
+                 coinc_probability=0.02, coinc_cables=("A1", "B1"),
+                 block=4096, seed=None):
+        self.tester = tester
+        self.single_probability = single_probability
+        self.coinc_probability = coinc_probability
+        # mcu_logic only forms coincidences for these cables so far;
+        # the others should never see an NCOIN or PCOIN
+        self.coinc_mask = sum(1 << CABLES.index(c) for c in coinc_cables)
+        self.block = block  # clocks of random numbers drawn at once
+        self.rng = numpy.random.default_rng(seed)
+        self.fields = field_masks(OFFSET_BITS)
+        self.resp = nibble_masks([tester.MCU_NCOIN, tester.MCU_PCOIN])
+        self.specl = nibble_masks([tester.MCU_SPECL])
+        self.prev_coinc_offset = 0
+        # Trigger and response masks for each clock of the current block
+        self.trigs = []
+        self.resps = []
+        # Counts per cable, updated by tally()
+        self.o = SimpleNamespace(nclk=0,
+                                 ntrig=numpy.zeros(NCABLES, dtype=int),
+                                 nresp=numpy.zeros(NCABLES, dtype=int))
+
+    def tally(self):
+        """add the masks recorded so far to the per-cable counts in 'o'"""
+        o = self.o
+        bits = numpy.arange(NCABLES)
+        if self.trigs:
+            o.nclk += len(self.trigs)
+            o.ntrig += (numpy.array(self.trigs)[:, None] >> bits & 1).sum(0)
+            o.nresp += (numpy.array(self.resps)[:, None] >> bits & 1).sum(0)
+        del self.trigs[:]
+        del self.resps[:]
+        return o
+
+    def draw_block(self):
+        """draw the random numbers for the next 'block' clocks; return
+        per-clock lists (coinc?, coinc offset, single mask, delay mask,
+        packed offsets if prompt, packed offsets if delayed)"""
+        rng, n, p = self.rng, self.block, self.tester
+        bits = 1 << numpy.arange(NCABLES)
+        shifts = (OFFSET_BITS * numpy.arange(NCABLES)).astype(numpy.uint64)
+        coinc = rng.random(n) < self.coinc_probability
+        # we may expand (-15,15) to a larger range later
+        coinc_offset = numpy.where(coinc, rng.integers(-15, 16, n), 0)
+        single = rng.random((n, NCABLES)) < self.single_probability
+        delay = rng.random((n, NCABLES)) < p.COINC_DELAY_FRACTION
+        jitter = rng.integers(-3, 4, (n, NCABLES))
+        # A delayed coincidence uses the previous clock's offset, - 32
+        prev = numpy.concatenate(([self.prev_coinc_offset],
+                                  coinc_offset[:-1]))
+        self.prev_coinc_offset = coinc_offset[-1]
+
+        def packed(base):
+            ofs = numpy.clip(base[:, None] + jitter, -32, 31) & 0x3f
+            return (ofs.astype(numpy.uint64) << shifts).sum(axis=1)
+
+        return (coinc.tolist(), coinc_offset.tolist(),
+                (single * bits).sum(axis=1).tolist(),
+                (delay * bits).sum(axis=1).tolist(),
+                packed(coinc_offset).tolist(), packed(prev - 32).tolist())
+
+    async def run(self):
+        """drive all eight boards, one clock at a time, forever"""
+        t = self.tester
+        dut = t.dut
+        singles_net = dut.singles
+        offsets_net = dut.offsets
+        mcu_outs = dut.mcu_outs
+        runmodes = dut.runmodes
+        coinc_net = dut.coinc_t_offset
+        for c in CABLES:
+            getattr(dut, "clkcnt_"+c) <= int(self.rng.integers(0, 65536))
+        fields, resp_tab, specl_tab = self.fields, self.resp, self.specl
+        LATENCY = t.MCU_LATENCY
+        MIN_IDLE = t.MIN_IDLE_BETWEEN_TRIG
+        # Trigger masks of the most recent clocks, newest last
+        hist = deque(max(LATENCY, MIN_IDLE)*[0],
+                     maxlen=max(LATENCY, MIN_IDLE))
+        # Cables on which a special word began in each of the last 4
+        # clocks: responses are not checked during a special word
+        specl_hist = deque(4*[0], maxlen=4)
+        pending = 0  # cables with a coincidence delayed to this clock
+        prev_trig = prev_offsets = prev_coinc = 0
+        while True:
+            (coinc, coinc_offset, smask, dmask,
+             offsets_now, offsets_del) = self.draw_block()
+            trigs = self.trigs
+            resps = self.resps
+            for i in range(self.block):
+                await t.wclk()
+                # Monitor MCU output on all cables
+                mouts = mcu_outs.value.integer
+                lo, hi = mouts & 0xffff, mouts >> 16
+                resp = resp_tab[lo] | resp_tab[hi] << 4
+                window = (specl_hist[0] | specl_hist[1] |
+                          specl_hist[2] | specl_hist[3])
+                start = (specl_tab[lo] | specl_tab[hi] << 4) & ~window
+                specl_hist.append(start)
+                # We should have a response exactly where we issued a
+                # single trigger LATENCY ago (on coincidence cables)
+                expect = hist[-LATENCY] & self.coinc_mask
+                bad = (resp ^ expect) & ~(window | start)
+                if bad:
+                    for k, c in enumerate(CABLES):
+                        if bad >> k & 1:
+                            print("rs{}@{:.0f} : resp {} expected {}".
+                                  format(c, t.ns(), resp >> k & 1,
+                                         expect >> k & 1))
+                            t.check(False)
+                else:
+                    t.check(True)
+                resps.append(resp)
+                # Decide which boards trigger on this clock
+                run = runmodes.value.integer
+                pend = pending
+                if coinc[i]:
+                    # New coincidence: each board either notices it
+                    # now or (sometimes) one clock late, unless it is
+                    # still busy with a delayed one
+                    pending = dmask[i] & ~pend & run
+                    do_coinc = (pend | ~dmask[i]) & run
+                else:
+                    pending = 0
+                    do_coinc = pend & run
+                busy = 0
+                for k in range(1, MIN_IDLE+1):
+                    busy |= hist[-k]
+                trig = (smask[i] & run | do_coinc) & ~busy & 0xff
+                offsets = ((offsets_now[i] & fields[trig & ~pend]) |
+                           (offsets_del[i] & fields[trig & pend]))
+                hist.append(trig)
+                trigs.append(trig)
+                if trig != prev_trig:
+                    singles_net <= trig
+                    prev_trig = trig
+                if offsets != prev_offsets:
+                    offsets_net <= offsets
+                    prev_offsets = offsets
+                if coinc_offset[i] != prev_coinc:
+                    # Make 'coinc_t_offset' visible in the waveform viewer
+                    coinc_net <= coinc_offset[i]
+                    prev_coinc = coinc_offset[i]
+            self.tally()
@@ -0,0 +1,144 @@
+"""
+Verification of the special-word (SPWORD) protocol on all eight cables.
+
+SpwordEngine.send() writes a special word to mcu_logic's 'spword'
+register, captures the MCU's output on all cables (tb.v 'mcu_outs')
+for a short window, and decodes the K_SPECL sequence on each cable
+with link_codec.decode_out.  The clock 'e' on which each cable's
+rocstar_mcu_link saw K_SPECL fixes when it acts on the word:
+
+  e+5  'spword', 'runmode', 'sync_clk', 'save_clk' registered
+  e+6  tb.v zeroes 'clkcnt' (SYNCH) or copies it to 'clksav' (SVCLK)
+
+so that, read on clock n (see Tester.tclk), 'runmode' and 'spword'
+show the new values from n = e+6 on, and 'clkcnt' reads n - (e+7)
+after a SYNCH.  Rather than count clocks in Python, the engine keeps
+one 'anchor' per cable, the clock on which that cable's 'clkcnt' read
+(or would have read) 0; the expected count on any clock n is then just
+n - anchor.  The anchors come from reading the counters once, before
+the first word, and from each SYNCH.  Counters, 'clksav' after SVCLK,
+'runmode', and the link's 'spword' are checked after every word, on
+all cables, and the anchors of the cables that were synchronized
+together are checked against each other.
+"""
+
+import cocotb
+import link_codec
+
+from multi_rocstar import CABLES
+
+# Clocks from K_SPECL (as read on 'mcu_outs') to each effect
+SPWORD_LATENCY = 6  # 'spword' and 'runmode' read the new value
+SYNCH_LATENCY = 7   # 'clkcnt' reads 0
+
+
+class SpwordEngine:
+
+    def __init__(self, tester, window=16):
+        self.tester = tester
+        self.window = window  # clocks of 'mcu_outs' captured per word
+        self.anchors = None  # per cable: clock on which clkcnt read 0
+        self.runmode = [0] * len(CABLES)  # expected 'runmode'
+        self.nwords = {}  # count of each special word sent
+        self.width = None  # bits of tb.v 'clkcnt_*'
+
+    def expected_count(self, k, n):
+        """expected value of cable k's 'clkcnt', read on clock n"""
+        return (n - self.anchors[k]) & ((1 << self.width) - 1)
+
+    def anchor(self):
+        """set each cable's anchor from its current 'clkcnt'"""
+        t = self.tester
+        self.width = len(t.handle("clkcnt_A1"))
+        now = t.tclk()
+        self.anchors = [now - t.rdint("clkcnt_"+c) for c in CABLES]
+
+    async def capture(self, nclk):
+        """read 'mcu_outs' on each of the next 'nclk' clocks; return
+        (clock of first sample, list of samples)"""
+        t = self.tester
+        net = t.dut.mcu_outs
+        samples = []
+        await t.wclk()
+        t0 = t.tclk()
+        for i in range(nclk):
+            samples.append(net.value.integer)
+            await t.wclk()
+        return t0, samples
+
+    async def send(self, word):
+        """send special word 'word' to all boards and verify that each
+        of them acts on it"""
+        t = self.tester
+        if self.anchors is None:
+            self.anchor()
+        self.nwords[word] = self.nwords.get(word, 0) + 1
+        cap = cocotb.fork(self.capture(self.window))
+        await t.wr("spword", word)
+        t0, samples = await cap
+        now = t.tclk()
+        seen = []  # (cable index, clock of K_SPECL)
+        for k, c in enumerate(CABLES):
+            symbols = [s >> 4*k & 0xf for s in samples]
+            kind, special = link_codec.decode_out(symbols)
+            if [w for i, w in special] != [word]:
+                print("spword {:04x} : rs{} decoded {}".format(
+                    word, c, ["{:04x}".format(w) for i, w in special]))
+                t.check(False)
+                continue
+            e = t0 + special[0][0]
+            if now < e + SYNCH_LATENCY:
+                await t.wuntil(e + SYNCH_LATENCY)
+                now = t.tclk()
+            seen.append((k, e))
+        for k, e in seen:
+            self.verify_word(k, e, word, now)
+        self.verify_counts(now)
+        if word == t.SPWORD_SYNCH:
+            # Boards that saw K_SPECL on the same clock must now agree
+            for e in set(e for k, e in seen):
+                counts = set(t.rdint("clkcnt_"+CABLES[k])
+                             for k, e1 in seen if e1 == e)
+                t.check(len(counts) == 1)
+
+    def verify_word(self, k, e, word, now):
+        """check cable k's reaction to 'word', whose K_SPECL it saw on
+        clock 'e'; it is now clock 'now'"""
+        t = self.tester
+        c = CABLES[k]
+        t.check(t.rdint("spword_"+c) == word)
+        if word == t.SPWORD_START:
+            self.runmode[k] = 1
+        elif word == t.SPWORD_END:
+            self.runmode[k] = 0
+        elif word == t.SPWORD_SVCLK:
+            # 'clksav' got the count read on clock e+6
+            want = self.expected_count(k, e + SPWORD_LATENCY)
+            got = t.rdint("clksav_"+c)
+            if got != want:
+                print("spword SVCLK : rs{} clksav {} expected {}".format(
+                    c, got, want))
+            t.check(got == want)
+        elif word == t.SPWORD_SYNCH:
+            self.anchors[k] = e + SYNCH_LATENCY
+        t.check(t.rdint("runmode_"+c) == self.runmode[k])
+
+    def verify_counts(self, now):
+        """check every cable's 'clkcnt' against its anchor"""
+        t = self.tester
+        for k, c in enumerate(CABLES):
+            got = t.rdint("clkcnt_"+c)
+            want = self.expected_count(k, now)
+            if got != want:
+                print("spword : rs{} clkcnt {} expected {}".format(
+                    c, got, want))
+                # Follow the counter from here on, to report each
+                # slip only once
+                self.anchors[k] = now - got
+            t.check(got == want)
+
+    def report(self):
+        """print how many of each special word were sent and verified"""
+        counts = sorted(self.nwords.items())
+        print("spwords sent: {}".format(", ".join(
+            "{:04x} x{}".format(w, n) for w, n in counts)))
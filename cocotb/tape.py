@@ -0,0 +1,239 @@
+"""
+Precomputed stimulus "tapes" for the MCU bench, and their replay.
+
+A tape holds every random choice that fake_rocstar and
+throw_coincidences would make during a run: coincidence times and
+offsets, per-board singles, the one-clock coincidence delays, the
++/-3 jitter, and MIN_IDLE_BETWEEN_TRIG gating.  It also holds the
+PCOIN/NCOIN response that the MCU should send for each single,
+according to coinc_model.py.  It is one row per clock on which any
+cable triggers (see TAPE_DTYPE), in the packed form of tb.v's
+'singles' and 'offsets' nets.
+
+replay() drives a tape onto those nets, sleeping between rows, and
+checks each expected response MCU_LATENCY clocks later.  As in
+fake_rocstar_ev, a response due while the MCU sends a special word
+counts as masked, not failed.  The same tape can be replayed in any
+number of simulator runs, for bit-exact reruns while chasing a
+failure.
+
+Run this file directly to compile a tape ahead of time:
+
+    python3 tape.py --nclk 1000000 --seed 1 --out tape.npz
+"""
+
+import argparse
+import numpy
+import os
+import sys
+
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# tbcommon is on PYTHONPATH in the simulator (see the Makefile), but
+# not necessarily when compiling a tape from the command line
+sys.path.insert(0, os.path.join(HERE, "..", "python"))
+
+from coinc_model import coinc_model
+from multi_rocstar import CABLES, NCABLES, OFFSET_BITS
+from tbcommon.results import load_records, save_npz
+
+TAPE_DTYPE = numpy.dtype([
+    ("clk", numpy.int64),       # clock, counted from start of replay
+    ("singles", numpy.uint8),   # cables with a single (bit k: CABLES[k])
+    ("offsets", numpy.uint64),  # their 6-bit offsets, as tb.v 'offsets'
+    ("pcoinc", numpy.uint8),    # cables whose single should get PCOIN,
+    ("ncoinc", numpy.uint8),    # .. or NCOIN, MCU_LATENCY clocks later
+])
+
+
+def arrivals(rng, p, nclk):
+    """sorted clocks in [0, nclk) of something that happens with
+    probability 'p' on each clock (geometric inter-arrival times)"""
+    t = numpy.cumsum(rng.geometric(p, int(nclk*p*1.1) + 100)) - 1
+    while t[-1] < nclk:
+        more = numpy.cumsum(rng.geometric(p, int(nclk*p*0.1) + 100))
+        t = numpy.concatenate((t, t[-1] + more))
+    return t[t < nclk]
+
+
+def cable_triggers(single_t, coinc_t, coinc_offset, delayed, min_idle):
+    """apply fake_rocstar's per-clock rules to one cable's candidate
+    clocks; return (trigger clocks, offsets before jitter)"""
+    S, C = single_t.tolist(), coinc_t.tolist()
+    O, D = coinc_offset.tolist(), delayed.tolist()
+    out_t, out_base = [], []
+    i = j = 0
+    pend_t = None  # clock to which a coincidence has been delayed
+    pend_base = 0
+    last = -min_idle - 1
+    while i < len(S) or j < len(C) or pend_t is not None:
+        t = min(x for x in (S[i] if i < len(S) else None,
+                            C[j] if j < len(C) else None,
+                            pend_t) if x is not None)
+        do_single = i < len(S) and S[i] == t
+        if do_single:
+            i += 1
+        coinc_now = j < len(C) and C[j] == t
+        if coinc_now:
+            offset, delay = O[j], D[j]
+            j += 1
+        if pend_t == t:
+            # A pending delayed coincidence wins over a new one
+            do_coinc, base = True, pend_base
+            pend_t = None
+        elif coinc_now and delay:
+            do_coinc, base = False, offset
+            pend_t, pend_base = t + 1, offset - 32
+        elif coinc_now:
+            do_coinc, base = True, offset
+        else:
+            do_coinc, base = False, 0
+        if (do_single or do_coinc) and t - last > min_idle:
+            out_t.append(t)
+            out_base.append(base)
+            last = t
+    return numpy.array(out_t, dtype=int), numpy.array(out_base, dtype=int)
+
+
+def compile_tape(nclk, seed=None, single_probability=0.03,
+                 coinc_probability=0.02, diffmax=16,
+                 coinc_delay_fraction=0.2, min_idle=1,
+                 coinc_cables=("A1", "B1")):
+    """compile a tape of 'nclk' clocks; return (tape, metadata dict)"""
+    rng = numpy.random.default_rng(seed)
+    coinc_t = arrivals(rng, coinc_probability, nclk)
+    # we may expand (-15,15) to a larger range later
+    coinc_offset = rng.integers(-15, 16, len(coinc_t))
+    single = numpy.zeros((NCABLES, nclk), dtype=bool)
+    offset = numpy.zeros((NCABLES, nclk), dtype=numpy.uint8)
+    for k in range(NCABLES):
+        delayed = rng.random(len(coinc_t)) < coinc_delay_fraction
+        t, base = cable_triggers(arrivals(rng, single_probability, nclk),
+                                 coinc_t, coinc_offset, delayed, min_idle)
+        keep = t < nclk
+        t, base = t[keep], base[keep]
+        jitter = rng.integers(-3, 4, len(t))
+        single[k, t] = True
+        offset[k, t] = numpy.clip(base + jitter, -32, 31) & 0x3f
+    # Expected responses, for the cables between which mcu_logic
+    # forms coincidences; other cables should get none
+    a, b = (CABLES.index(c) for c in coinc_cables)
+    pcoinc = numpy.zeros((NCABLES, nclk), dtype=bool)
+    ncoinc = numpy.zeros((NCABLES, nclk), dtype=bool)
+    m = coinc_model(single[a], offset[a], single[b], offset[b], diffmax)
+    pcoinc[a], ncoinc[a] = m.pcoincA, m.ncoincA
+    pcoinc[b], ncoinc[b] = m.pcoincB, m.ncoincB
+    # One row per clock on which any cable triggers
+    clocks = numpy.flatnonzero(single.any(axis=0))
+    tape = numpy.zeros(len(clocks), dtype=TAPE_DTYPE)
+    tape["clk"] = clocks
+    for k in range(NCABLES):
+        tape["singles"] |= single[k, clocks].astype(numpy.uint8) << k
+        tape["offsets"] |= (offset[k, clocks].astype(numpy.uint64) <<
+                            numpy.uint64(OFFSET_BITS*k))
+        tape["pcoinc"] |= pcoinc[k, clocks].astype(numpy.uint8) << k
+        tape["ncoinc"] |= ncoinc[k, clocks].astype(numpy.uint8) << k
+    meta = dict(nclk=nclk, seed=seed, single_probability=single_probability,
+                coinc_probability=coinc_probability, diffmax=diffmax,
+                coinc_delay_fraction=coinc_delay_fraction,
+                min_idle=min_idle, coinc_cables=list(coinc_cables))
+    return tape, meta
+
+
+def load_tape(filename):
+    """return (tape, metadata dict) saved by save_npz"""
+    return load_records(filename, dtype=TAPE_DTYPE)
+
+
+async def replay(tester, tape, meta, o=None):
+    """drive 'tape' onto tb.v's packed 'singles'/'offsets' nets,
+    starting at the next clock, and check the MCU's responses"""
+    t = tester
+    dut = t.dut
+    singles_net = dut.singles
+    offsets_net = dut.offsets
+    mcu_outs = dut.mcu_outs
+    LATENCY = t.MCU_LATENCY
+    if o is None:
+        o = SimpleNamespace()
+    o.nrows = len(tape)
+    o.nresp = 0    # expected responses seen
+    o.nmasked = 0  # responses due while MCU sent a special word
+    # The expected responses depend on the coincidence window
+    t.check(t.rdint("ml.diffmax") & 0xff == meta["diffmax"] & 0xff)
+    clk = tape["clk"].tolist()
+    singles = tape["singles"].tolist()
+    offsets = tape["offsets"].tolist()
+    pcoinc = tape["pcoinc"].tolist()
+    ncoinc = tape["ncoinc"].tolist()
+    await t.wclk()
+    t0 = t.tclk()
+    checks = []  # (clock, row) of responses due, oldest first
+    ncheck = 0
+    i = 0
+    t_release = None  # clock on which to drop 'singles'
+    while i < len(clk) or ncheck < len(checks) or t_release is not None:
+        now = min(x for x in (clk[i] + t0 if i < len(clk) else None,
+                              checks[ncheck][0] if ncheck < len(checks)
+                              else None,
+                              t_release) if x is not None)
+        await t.wuntil(now)
+        if now == t_release:
+            singles_net <= 0
+            offsets_net <= 0
+            t_release = None
+        if ncheck < len(checks) and checks[ncheck][0] == now:
+            row = checks[ncheck][1]
+            ncheck += 1
+            mouts = mcu_outs.value.integer
+            for k, c in enumerate(CABLES):
+                if not (pcoinc[row] | ncoinc[row]) >> k & 1:
+                    continue
+                want = t.MCU_PCOIN if pcoinc[row] >> k & 1 else t.MCU_NCOIN
+                got = mouts >> 4*k & 0xf
+                if got == want:
+                    o.nresp += 1
+                    t.check(True)
+                elif (got in t.MCU_IDLES or
+                      got in (t.MCU_PCOIN, t.MCU_NCOIN)):
+                    print("rs{}@{:.0f} : tape row {} clk {} : "
+                          "got {:04b} expected {:04b}".format(
+                              c, t.ns(), row, clk[row], got, want))
+                    t.check(False)
+                else:
+                    o.nmasked += 1
+        if i < len(clk) and clk[i] + t0 == now:
+            singles_net <= singles[i]
+            offsets_net <= offsets[i]
+            if pcoinc[i] | ncoinc[i]:
+                checks.append((now + LATENCY, i))
+            t_release = now + 1
+            i += 1
+    return o
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="compile a stimulus tape for the MCU bench")
+    parser.add_argument("--nclk", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--diffmax", type=int, default=16)
+    parser.add_argument("--single-probability", type=float, default=0.03)
+    parser.add_argument("--coinc-probability", type=float, default=0.02)
+    parser.add_argument("--out", default="tape.npz")
+    args = parser.parse_args()
+    tape, meta = compile_tape(args.nclk, seed=args.seed,
+                              single_probability=args.single_probability,
+                              coinc_probability=args.coinc_probability,
+                              diffmax=args.diffmax)
+    save_npz(tape, args.out, meta=meta)
+    print("{} clocks, {} rows, {} PCOIN, {} NCOIN -> {}".format(
+        args.nclk, len(tape),
+        sum(bin(x).count("1") for x in tape["pcoinc"].tolist()),
+        sum(bin(x).count("1") for x in tape["ncoinc"].tolist()), args.out))
+
+
+if __name__ == "__main__":
+    main()
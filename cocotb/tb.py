@@ -1,91 +1,73 @@
 
 import cocotb
-import inspect
+import math
+import numpy
 import os
 import random
 
 from collections import deque
 from types import SimpleNamespace
 
+from tbcommon import (CounterMonitor, Reg, RegMap, Scoreboard, TesterBase,
+                      save_npz)
 
-class Tester:
+import link_codec
+
+from coinc_model import coinc_model
+from multi_rocstar import CABLES, MultiRocstar
+from spword import SpwordEngine
+from tape import compile_tape, load_tape, replay
+
+
+class Tester(TesterBase):
 
     # values for special words sent from MCU to rocstar boards
     SPWORD_SYNCH = 0x1111  # synchronize clock counters to 0
     SPWORD_START = 0x2222  # start data taking
     SPWORD_END   = 0x3333  # end data taking
     SPWORD_SVCLK = 0x4444  # save current clock counter to a register
-        
-    def __init__(self, dut):
-        self.dut = dut
-        self.verbose = False
-        self.nchecks_ok = 0
-        self.nchecks_failed = 0
-
-    def check(self, expr):
-        if expr:
-            self.nchecks_ok += 1
-            return
-        self.nchecks_failed += 1
-        callerframerecord = inspect.stack()[1]
-        frame = callerframerecord[0]
-        info = inspect.getframeinfo(frame)
-        where = "{}:{}:{} :: {}".format(
-            info.function, os.path.basename(info.filename),
-            info.lineno, info.code_context[0].strip())
-        # https://stackoverflow.com/questions/6810999/
-        #   how-to-determine-file-function-and-line-number
-        ns = self.ns()
-        print("CHECKFAIL@{:.0f}:".format(ns), where)
-
-    def ns(self):
-        """return current simulation time in nanoseconds"""
-        return cocotb.utils.get_sim_time(units="ns")
-        
-    async def wclk(self, nclk=1, rising=True):
-        """shortcut for await ClockCycles(self.dut.clk, ...)"""
-        await cocotb.triggers.ClockCycles(self.dut.clk, nclk, rising=rising)
 
-    async def wr(self, addr, data, check=None, verbose=None):
-        """write 'addr' := 'data' on register-file bus"""
-        dut = self.dut
-        if verbose is None: verbose = self.verbose
-        await self.wclk()
-        dut.baddr <= addr
-        dut.bwrdata <= data
-        dut.bwr <= 1
-        dut.bstrobe <= 1
-        await self.wclk()
-        dut.baddr <= 0
-        dut.bwrdata <= 0
-        dut.bwr <= 0
-        dut.bstrobe <= 0
-        await self.wclk()
-        if verbose:
-            print("wr {:04x} := {:04x}".format(addr, data))
-        if check is not None:
-            self.check(check.value.integer == data)
+    # Symbol values output by MCU (see link_codec.py)
+    MCU_IDLE0 = link_codec.K_IDLE0 ; MCU_IDLE1 = link_codec.K_IDLE1
+    MCU_IDLE2 = link_codec.K_IDLE2 ; MCU_IDLE3 = link_codec.K_IDLE3
+    MCU_PCOIN = link_codec.K_PCOIN ; MCU_DCOIN = link_codec.K_DCOIN
+    MCU_NCOIN = link_codec.K_NCOIN ; MCU_SPECL = link_codec.K_SPECL
+    MCU_TEST0 = 0b0000 ; MCU_TEST1 = 0b0001
+    MCU_TEST2 = 0b0010 ; MCU_TEST4 = 0b0100
+    MCU_TEST5 = 0b0101 ; MCU_TEST8 = 0b1000
+    MCU_TESTA = 0b1010 ; MCU_TESTF = 0b1111
+    MCU_IDLES = link_codec.K_IDLES
 
-    async def rd(self, addr, check=None, verbose=None):
-        """read from regsiter-file bus at address 'addr'"""
-        dut = self.dut
-        if verbose is None: verbose = self.verbose
-        await self.wclk()
-        dut.baddr <= addr
-        dut.bwr <= 0
-        dut.bstrobe <= 0
-        await self.wclk()
-        dut.bstrobe <= 1
-        await self.wclk()
-        data = dut.brddata.value.integer
-        dut.bstrobe <= 0
-        dut.baddr <= 0
-        await self.wclk()
-        if verbose:
-            print("rd {:04x} -> {:04x}".format(addr, data))
-        if check is not None:
-            self.check(data == check)
-        return data
+    # Latency (in clock cycles) of rocstar <-> MCU round trip;
+    # this will be much longer in real life
+    MCU_LATENCY = 9
+    # Enforce minimum delay between triggers from a given rocstar.
+    # Do we do this in real life?!
+    MIN_IDLE_BETWEEN_TRIG = 1
+    # Some fraction of the time, insert a one-clock delay before noticing
+    # the coincidence, so that we test the MCU's intended ability to find
+    # coincidences that are shifted in time by one clock cycle.
+    COINC_DELAY_FRACTION = 0.2
+
+    # tb.v makes a 100 MHz 'clk', with rising edges at 5, 15, 25, ... ns
+    CLK_NS = 10
+
+    # Registers on mcu_logic's register-file 'bus'
+    REGMAP = RegMap([
+        Reg("id", 0x0000, value=0x1234, ro=True),
+        Reg("q0001", 0x0001, q="ml.q0001"),  # dummy read/write register
+        Reg("spword", 0x0002, q="ml.spword"),
+        Reg("testpatt", 0x0003, 4, q="ml.testpatt"),
+        Reg("do_testpatt", 0x0004, q="ml.do_testpatt"),
+        Reg("diffmax", 0x0005, q="ml.diffmax"),
+    ] + [Reg("badidle_"+c, 0x0010+k, ro=True)  # counters
+         for k, c in enumerate(CABLES)])
+
+    # Clocks from sampling a single on coinc's input (tb.v
+    # 'coinc_probe') to sampling coinc's response to it: 'srA' etc.
+    # register it on the next edge, 'pcoincA' etc. on the one after,
+    # and we see each register's new value on the edge after that
+    COINC_LAG = 3
 
     async def throw_coincidences(self, coinc_probability=0.02):
         """randomly generate coincidences (observed by fake_rocstar)"""
@@ -125,72 +107,40 @@ class Tester:
         single_net = getattr(self.dut, "single_"+whoami)
         offset_net = getattr(self.dut, "offset_"+whoami)
         runmode_net = getattr(self.dut, "runmode_"+whoami)
-        # I spread the clk_counter bits out like this because mcu_in bits
-        # 7:4 are on one wire and bits 3:0 are on another wire.  I want to
-        # use the idle patterns to check the signal integrity of both wires.
-        IDLE0 = 0b01000000  # bits 5,4,1,0 -> clk_counter bits 3:0
-        IDLE1 = 0b01000100  # bits 5,4,1,0 -> clk_counter bits 7:4
-        IDLE2 = 0b01001000  # bits 5,4,1,0 -> clk_counter bits 11:8
-        IDLE3 = 0b01001100  # bits 5,4,1,0 -> clk_counter bits 15:12
-        TRIG  = 0b10000000  # bits 6:0 -> time offset wrt rising clk edge
-        idle = [IDLE0, IDLE1, IDLE2, IDLE3]
-        NIDLE = len(idle)
-        # Symbol values output by MCU: these belong somewhere else
-        MCU_IDLE0 = 0b0111 ; MCU_IDLE1 = 0b1011
-        MCU_IDLE2 = 0b1101 ; MCU_IDLE3 = 0b1110
-        MCU_PCOIN = 0b0011 ; MCU_DCOIN = 0b0110
-        MCU_NCOIN = 0b1001 ; MCU_SPECL = 0b1100
-        MCU_TEST0 = 0b0000 ; MCU_TEST1 = 0b0001
-        MCU_TEST2 = 0b0010 ; MCU_TEST4 = 0b0100
-        MCU_TEST5 = 0b0101 ; MCU_TEST8 = 0b1000
-        MCU_TESTA = 0b1010 ; MCU_TESTF = 0b1111
-        # Keep track of most recent N transmitted words
-        NKEEP = 20
-        o.trig_history = deque(iterable=NKEEP*[0], maxlen=NKEEP)
-        # Enforce minimum delay between triggers from a given rocstar.
-        # Do we do this in real life?!
-        MIN_IDLE_BETWEEN_TRIG = 1
-        # Some fraction of the time, insert a one-clock delay before noticing
-        # the coincidence, so that we test the MCU's intended ability to find
-        # coincidences that are shifted in time by one clock cycle.
-        COINC_DELAY_FRACTION = 0.2
+        # The encoding of our IDLE and TRIG words to the mcu (which
+        # spreads the clk_counter bits over both wires of mcu_in, to
+        # check the signal integrity of each) is in link_codec.py;
+        # here we only decode what the mcu sends back, by table lookup
+        response = link_codec.OUT_RESPONSE
+        # Match MCU responses to our triggers by clock number
+        o.sb = Scoreboard(self.checker, "rs"+whoami, self.MCU_LATENCY)
+        MIN_IDLE_BETWEEN_TRIG = self.MIN_IDLE_BETWEEN_TRIG
+        COINC_DELAY_FRACTION = self.COINC_DELAY_FRACTION
         do_coinc_next_clk = False
-        # Latency (in clock cycles) of rocstar <-> MCU round trip;
-        # this will be much longer in real life
-        MCU_LATENCY = 9
         # Keep track of what state the event loop is in
         ticks_since_specl = 0
         # Begin main event loop
         prev_coinc_t_offset = 0
+        now = self.tclk()
         while True:
             do_trigger_now = 0
             await self.wclk()  # This loop executes once per clk cycle
+            now += 1
             # Monitor MCU output
             mout = mcu_out.value.integer
             if ticks_since_specl>0 and ticks_since_specl<5:
                 ticks_since_specl += 1
-            elif mout==MCU_SPECL:
+                # The MCU drops responses while sending a special word
+                o.sb.lose(now)
+            elif mout==self.MCU_SPECL:
                 ticks_since_specl = 1
-            elif mout==MCU_NCOIN:
-                print("rs{}@{:.0f} : NCOIN {} whist={}".
-                      format(whoami, self.ns(),
-                             o.trig_history[-MCU_LATENCY], o.trig_history))
-                # We should have issued a single trigger LATENCY ago
-                self.check(o.trig_history[-MCU_LATENCY])
-            elif mout==MCU_PCOIN:
-                print("rs{}@{:.0f} : PCOIN {} whist={}".
-                      format(whoami, self.ns(),
-                             o.trig_history[-MCU_LATENCY], o.trig_history))
-                # We should have issued a single trigger LATENCY ago
-                self.check(o.trig_history[-MCU_LATENCY])
+                o.sb.lose(now)
+            elif response[mout] is not None:
+                # PCOIN (accept) or NCOIN (reject)
+                o.sb.observe(now, accept=response[mout])
             else:
-                # We should NOT have issued a single trigger LATENCY ago
-                if o.trig_history[-MCU_LATENCY]:
-                    print("rs{}@{:.0f} : uhoh {} whist={}".
-                          format(whoami, self.ns(),
-                                 o.trig_history[-MCU_LATENCY],
-                                 o.trig_history))
-                self.check(not o.trig_history[-MCU_LATENCY])
+                # Any trigger whose response is overdue is missing
+                o.sb.expire(now)
             time_offset = 0  # may be overridden below
             # Next 2 lines are to make the if statement more readable
             do_single = random.random() < single_probability
@@ -233,12 +183,293 @@ class Tester:
             else:
                 # Issue an IDLE word
                 o.nclk_since_trigger += 1
-            o.trig_history.append(do_trigger_now)
+            if do_trigger_now:
+                o.sb.expect(now)
             single_net <= do_trigger_now
             offset_net <= time_offset
             # save this value of coinc_t_offset for next time
             prev_coinc_t_offset = self.coinc_t_offset
-                
+
+    def tclk(self):
+        """current time in 'clk' cycles (number of rising edges so far)"""
+        return int(self.ns() // self.CLK_NS)
+
+    async def wuntil(self, t):
+        """wait until rising edge number 't' of 'clk' (see tclk)"""
+        n = t - self.tclk()
+        if n > 0:
+            await self.wclk(n)
+
+    def geometric(self, p):
+        """number of clocks (>= 1) until the next occurrence of something
+        that happens with probability 'p' on each clock"""
+        return int(math.log(1.0 - random.random()) / math.log(1.0 - p)) + 1
+
+    def coinc_at(self, k):
+        """(clock, offset) of the k'th coincidence scheduled by
+        throw_coincidences_ev, drawing more of them as needed"""
+        sched = self.coinc_schedule
+        while len(sched) <= k:
+            t = sched[-1][0] if sched else self.coinc_t0
+            t += self.geometric(self.coinc_probability)
+            # we may expand (-15,15) to a larger range later
+            sched.append((t, random.randint(-15,15)))
+        return sched[k]
+
+    async def throw_coincidences_ev(self, coinc_probability=0.02):
+        """event-driven throw_coincidences: the clock of each coincidence
+        is drawn ahead of time (geometric inter-arrival times), into a
+        schedule that each fake_rocstar_ev reads independently"""
+        self.coinc_probability = coinc_probability
+        self.coinc_schedule = []
+        self.coinc_t0 = self.tclk()
+        # Make 'coinc_t_offset' visible in the waveform viewer, for the
+        # one clock of each coincidence; otherwise just sleep
+        net = self.dut.coinc_t_offset
+        k = 0
+        t_clear = None
+        while True:
+            t, t_offset = self.coinc_at(k)
+            k += 1
+            if t_clear is not None and t_clear < t:
+                await self.wuntil(t_clear)
+                net <= 0
+            await self.wuntil(t)
+            net <= t_offset
+            t_clear = t + 1
+
+    async def fake_rocstar_ev(self, whoami, mcu_in, mcu_out,
+                              single_probability=0.03):
+        """event-driven fake_rocstar: sleep until the next clock on which
+        this board triggers, drops 'single', or expects a response
+
+        The gap to each next single trigger is drawn ahead of time, and
+        coincidences come from the schedule kept by
+        throw_coincidences_ev, so nothing happens on most clocks.
+        'mcu_out' is only examined MCU_LATENCY clocks after each trigger,
+        where an NCOIN or PCOIN is due.  Two watchers stand in for
+        fake_rocstar's look at every clock: one finds the K_SPECL of
+        each special word (waking on mcu_logic's 'do_spword'), so that
+        responses due during the word are dropped as fake_rocstar drops
+        them, and one wakes on each response that the board's
+        rocstar_mcu_link decodes, and fails any that was not due.
+        """
+        o = SimpleNamespace()
+        self.fr[whoami] = o
+        o.ntrig = 0    # triggers sent to MCU
+        o.nresp = 0    # responses seen when due
+        o.nmasked = 0  # responses due while MCU sent a special word
+        o.nextra = 0   # responses that nobody asked for
+        o.specl = None     # clock of the last K_SPECL on 'mcu_out'
+        o.last_due = None  # clock of the last response due
+        # Look up self.dut.clkcnt_A1 or similar
+        tb_clkcnt = getattr(self.dut, "clkcnt_"+whoami)
+        tb_clkcnt <= random.randint(0,65535)
+        single_net = getattr(self.dut, "single_"+whoami)
+        offset_net = getattr(self.dut, "offset_"+whoami)
+        runmode_net = getattr(self.dut, "runmode_"+whoami)
+        await self.wclk()
+        now = self.tclk()
+        next_single = now + self.geometric(single_probability)
+        kcoinc = 0         # index into self.coinc_schedule
+        next_coinc = None  # (clock, offset) of next coinc we notice
+        due = deque()      # clocks on which responses are due
+        t_release = None   # clock on which to drop 'single'
+        last_trig = None   # clock of our most recent trigger
+        o.watchers = [cocotb.fork(self.specl_watch(o, mcu_out)),
+                      cocotb.fork(self.response_watch(o, whoami, due))]
+        while True:
+            while next_coinc is None:
+                t, t_offset = self.coinc_at(kcoinc)
+                kcoinc += 1
+                if random.random() < self.COINC_DELAY_FRACTION:
+                    # Notice this coincidence one clock late
+                    t, t_offset = t+1, t_offset-32
+                if t > now:
+                    # (otherwise it collided with one we already took)
+                    next_coinc = (t, t_offset)
+            now = min(next_single, next_coinc[0])
+            if due: now = min(now, due[0])
+            if t_release is not None: now = min(now, t_release)
+            await self.wuntil(now)
+            if now == t_release:
+                single_net <= 0
+                offset_net <= 0
+                t_release = None
+            if due and due[0] == now:
+                due.popleft()
+                o.last_due = now
+                mout = mcu_out.value.integer
+                if mout==self.MCU_SPECL or (
+                        o.specl is not None and
+                        o.specl <= now < o.specl + link_codec.SPECL_LEN):
+                    # MCU drops responses while sending a special word
+                    o.nmasked += 1
+                elif mout==self.MCU_NCOIN or mout==self.MCU_PCOIN:
+                    o.nresp += 1
+                else:
+                    # We issued a single trigger LATENCY ago
+                    print("rs{}@{:.0f} : no response, mout={:04b}".
+                          format(whoami, self.ns(), mout))
+                    self.check(False)
+            do_single = now == next_single
+            do_coinc = now == next_coinc[0]
+            t_offset = 0
+            if do_single:
+                next_single = now + self.geometric(single_probability)
+            if do_coinc:
+                t_offset = next_coinc[1]
+                next_coinc = None
+            if not (do_single or do_coinc):
+                continue
+            if (last_trig is not None and
+                now - last_trig <= self.MIN_IDLE_BETWEEN_TRIG):
+                continue
+            if runmode_net.value.integer==0:
+                # If we're not in data-taking mode, then we should not
+                # report triggers to the mcu
+                continue
+            # Issue a single-photon trigger, for one clock
+            time_offset = t_offset + random.randint(-3,+3)
+            if time_offset < -32: time_offset = -32
+            if time_offset > +31: time_offset = +31
+            single_net <= 1
+            offset_net <= time_offset & 0x3f
+            o.ntrig += 1
+            last_trig = now
+            t_release = now + 1
+            due.append(now + self.MCU_LATENCY)
+
+    async def specl_watch(self, o, mcu_out, search=8):
+        """for fake_rocstar_ev: after each write to 'spword', find the
+        clock on which 'mcu_out' sends K_SPECL (within 'search' clocks)
+        and keep it in o.specl; payload nibbles that happen to equal
+        K_SPECL are never taken for a new special word"""
+        do_spword = self.dut.ml.do_spword
+        while True:
+            await cocotb.triggers.RisingEdge(do_spword)
+            for i in range(search):
+                await self.wclk()
+                if mcu_out.value.integer == self.MCU_SPECL:
+                    o.specl = self.tclk()
+                    break
+
+    async def response_watch(self, o, whoami, due):
+        """for fake_rocstar_ev: fail each response decoded by this
+        board's rocstar_mcu_link that was not due (in data-taking
+        mode, outside special words, which is when the link decodes
+        them).  The link registers what it decodes, so its 'pcoinc'
+        etc. rise on the edge on which fake_rocstar_ev reads the
+        response on 'mcu_out'.  A response on the very next clock
+        leaves its net high, with no new edge, so after each edge the
+        nets are followed clock by clock for as long as any is high."""
+        nets = [getattr(self.dut, kind+"_"+whoami)
+                for kind in ("pcoinc", "dcoinc", "ncoinc")]
+
+        def response(now, ns):
+            if now == o.last_due or (due and due[0] == now):
+                return
+            o.nextra += 1
+            print("rs{}@{:.0f} : response nobody asked for".format(
+                whoami, ns))
+            self.check(False)
+
+        while True:
+            await cocotb.triggers.First(
+                *[cocotb.triggers.RisingEdge(net) for net in nets])
+            response(self.tclk(), self.ns())
+            # At each rising edge of 'clk', the nets still show what
+            # the link registered on the edge before
+            await self.wclk()
+            while True:
+                await self.wclk()
+                if not any(net.value.integer for net in nets):
+                    break
+                response(self.tclk() - 1, self.ns() - self.CLK_NS)
+
+    def tape(self):
+        """stimulus tape for ROCSTAR_MODE=tape: load $ROCSTAR_TAPE if it
+        exists, else compile one (ROCSTAR_NCLK clocks, RANDOM_SEED) and
+        save it there, so that later runs replay exactly the same one"""
+        filename = os.environ.get("ROCSTAR_TAPE", "tape.npz")
+        if os.path.exists(filename):
+            print("replaying tape", filename)
+            return load_tape(filename)
+        tape, meta = compile_tape(
+            int(os.environ.get("ROCSTAR_NCLK", 300)),
+            seed=cocotb.RANDOM_SEED,
+            coinc_delay_fraction=self.COINC_DELAY_FRACTION,
+            min_idle=self.MIN_IDLE_BETWEEN_TRIG)
+        save_npz(tape, filename, meta=meta)
+        return tape, meta
+
+    async def replay_tape(self, tape, meta, o):
+        """wait for data taking to start, then replay 'tape'"""
+        await cocotb.triggers.RisingEdge(self.dut.runmode_A1)
+        await replay(self, tape, meta, o)
+
+    async def coinc_scoreboard(self, o, block=4096):
+        """sample tb.v's 'coinc_probe' on every clock, and compare each
+        'block' of clocks with coinc_model.py (see coinc_compare)"""
+        probe = self.dut.coinc_probe
+        o.buf = []
+        o.nclk = o.nsingle = o.nfail = 0
+        while True:
+            for i in range(block):
+                await self.wclk()
+                o.buf.append(probe.value.integer)
+            self.coinc_compare(o)
+
+    def coinc_compare(self, o):
+        """check coinc's responses in the samples in 'o.buf' against
+        coinc_model, then keep just the samples that the next call
+        will need again"""
+        LAG = self.COINC_LAG
+        buf = numpy.array(o.buf, dtype=numpy.int64)
+        n = len(buf) - LAG  # clocks whose response has been sampled
+        if n < 2:
+            return o
+        t_end = self.tclk()
+
+        def field(lsb, width):
+            return (buf >> lsb & (1 << width) - 1).astype(numpy.int16)
+
+        sA, oA, sB, oB = field(0, 1), field(1, 6), field(7, 1), field(8, 6)
+        got = SimpleNamespace(pcoincA=field(14, 1), ncoincA=field(15, 1),
+                              pcoincB=field(16, 1), ncoincB=field(17, 1),
+                              coincdiff=field(18, 8))
+        # coinc tests the single(s) sampled on clock k on clock k+2
+        diffmax = field(26, 8)
+        diffmax = numpy.concatenate((diffmax[2:], diffmax[-2:]))
+        m = coinc_model(sA, oA, sB, oB, diffmax)
+        # The model needs the clocks either side of each single
+        want = slice(1, n)
+        seen = slice(1 + LAG, n + LAG)
+        bad = numpy.zeros(n - 1, dtype=bool)
+        for name in ("pcoincA", "ncoincA", "pcoincB", "ncoincB"):
+            bad |= getattr(m, name)[want] != getattr(got, name)[seen]
+        cd = m.coincdiff[want]
+        bad |= (cd >= 0) & (cd != got.coincdiff[seen])
+        o.nclk += n - 1
+        o.nsingle += int((sA[want] | sB[want]).sum())
+        for k in numpy.flatnonzero(bad) + 1:
+            t = t_end - (len(buf) - 1 - (k + LAG))
+            print("coinc@{} : sA={} oA={} sB={} oB={} : got p/n A {}{} "
+                  "B {}{} diff {}, expected A {}{} B {}{} diff {}".format(
+                      t * self.CLK_NS, sA[k], oA[k], sB[k], oB[k],
+                      got.pcoincA[k+LAG], got.ncoincA[k+LAG],
+                      got.pcoincB[k+LAG], got.ncoincB[k+LAG],
+                      got.coincdiff[k+LAG],
+                      int(m.pcoincA[k]), int(m.ncoincA[k]),
+                      int(m.pcoincB[k]), int(m.ncoincB[k]),
+                      m.coincdiff[k]))
+            o.nfail += 1
+            self.check(False)
+        if not bad.any():
+            self.check(True)
+        del o.buf[:n-1]
+        return o
+
     async def run_test1(self):
         """initial very simple test of mcu_logic module"""
         dut = self.dut
@@ -254,72 +485,144 @@ class Tester:
         dut.ml.rst <= 0
         await self.wclk(10)
 
-        # Instantiate emulated rocstar boards
-        self.throw_coinc = cocotb.fork(self.throw_coincidences())
+        # Special words go out through a protocol engine that checks
+        # every board's reaction (see spword.py)
+        self.spword = SpwordEngine(self)
+
+        # Poll the eight 'badidle_*' link-error counters in one bus
+        # burst every BADIDLE_PERIOD clocks (0 to disable)
+        self.badidle = None
+        period = int(os.environ.get("BADIDLE_PERIOD", 1000))
+        if period > 0:
+            self.badidle = CounterMonitor(
+                self, ["badidle_"+c for c in CABLES], period,
+                clk_ns=self.CLK_NS, name="badidle")
+            self.badidle.forked_coroutine = cocotb.fork(self.badidle.run())
+
+        # COINC_SCOREBOARD=1 checks mcu_logic's coinc on every clock
+        # against the reference model in coinc_model.py
+        self.coinc_sb = None
+        if os.environ.get("COINC_SCOREBOARD", "0") == "1":
+            self.coinc_sb = SimpleNamespace()
+            self.coinc_sb.forked_coroutine = cocotb.fork(
+                self.coinc_scoreboard(self.coinc_sb))
+
+        # Instantiate emulated rocstar boards.  ROCSTAR_MODE=event
+        # selects the event-driven emulators, which only wake up on
+        # clocks where something happens, for long runs;
+        # ROCSTAR_MODE=multi emulates all eight cables' boards in one
+        # vectorized coroutine (see multi_rocstar.py);
+        # ROCSTAR_MODE=tape replays a precomputed tape (see tape.py).
+        mode = os.environ.get("ROCSTAR_MODE", "clock")
         self.fr = {}  # dict of info about fake_rocstar instances
-        _ = cocotb.fork(
-            self.fake_rocstar("A1", mcu_in=dut.A1in, mcu_out=dut.A1out))
-        self.fr["A1"].forked_coroutine = _
-        _ = cocotb.fork(
-            self.fake_rocstar("B1", mcu_in=dut.B1in, mcu_out=dut.B1out))
-        self.fr["B1"].forked_coroutine = _
+        self.throw_coinc = None
+        if mode == "multi":
+            self.multi = MultiRocstar(self, seed=cocotb.RANDOM_SEED)
+            self.fr["all"] = self.multi.o
+            self.fr["all"].forked_coroutine = cocotb.fork(self.multi.run())
+        elif mode == "tape":
+            tape, meta = self.tape()
+            self.fr["tape"] = SimpleNamespace()
+            self.fr["tape"].forked_coroutine = cocotb.fork(
+                self.replay_tape(tape, meta, self.fr["tape"]))
+        else:
+            if mode == "event":
+                throw_coincidences = self.throw_coincidences_ev
+                fake_rocstar = self.fake_rocstar_ev
+            else:
+                throw_coincidences = self.throw_coincidences
+                fake_rocstar = self.fake_rocstar
+            self.throw_coinc = cocotb.fork(throw_coincidences())
+            _ = cocotb.fork(
+                fake_rocstar("A1", mcu_in=dut.A1in, mcu_out=dut.A1out))
+            self.fr["A1"].forked_coroutine = _
+            _ = cocotb.fork(
+                fake_rocstar("B1", mcu_in=dut.B1in, mcu_out=dut.B1out))
+            self.fr["B1"].forked_coroutine = _
 
         # Initialize 'diffmax' value
         await self.wclk(20)
         diffmax = 16  # maybe this will vary from run to run later
-        await self.wr(0x0005, diffmax, check=dut.ml.diffmax)
+        await self.wr("diffmax", diffmax)
         
         # Run for a while, then tell mcu to transmit special commands
         # to rocstar boards to save the current values of their clock
         # counters, then synchronize their clock counters and start
         # data collection.
         await self.wclk(20)
-        await self.wr(0x0002, self.SPWORD_SVCLK, check=dut.ml.spword)
+        await self.spword.send(self.SPWORD_SVCLK)
         await self.wclk(20)
-        await self.wr(0x0002, self.SPWORD_SYNCH, check=dut.ml.spword)
+        await self.spword.send(self.SPWORD_SYNCH)
         await self.wclk(10)
-        await self.wr(0x0002, self.SPWORD_START, check=dut.ml.spword)
+        await self.spword.send(self.SPWORD_START)
         await self.wclk(20)
-        await self.wr(0x0002, self.SPWORD_SVCLK, check=dut.ml.spword)
+        await self.spword.send(self.SPWORD_SVCLK)
 
         # Let everything run for a while, then tell mcu to transmit
         # the "stop data collection" special command to the rocstar
-        # boards.
-        await self.wclk(300)
-        await self.wr(0x0002, self.SPWORD_END, check=dut.ml.spword)
+        # boards.  ROCSTAR_NCLK sets how long "a while" is, except
+        # that a tape runs to its end.
+        if mode == "tape":
+            await self.fr["tape"].forked_coroutine
+        else:
+            await self.wclk(int(os.environ.get("ROCSTAR_NCLK", 300)))
+        await self.spword.send(self.SPWORD_END)
         await self.wclk(10)
 
-        # Try some register-file "bus" I/O
+        # Try some register-file "bus" I/O, in bursts of back-to-back
+        # transactions.  The first burst goes to the hardware; later
+        # reads of registers that we know are served from the shadow
+        # register file (and checked against their contents signals),
+        # until scrub() reads them all back at the end.
         self.verbose = True
-        await self.wr(0x0001, 0x0000, check=dut.ml.q0001)
-        d = await self.rd(0x0000, check=0x1234)
-        d = await self.rd(0x0001, check=0x0000)
-        d = await self.rd(0x0000, check=0x1234)
-        await self.wr(0x0001, 0x4321, check=dut.ml.q0001)
-        d = await self.rd(0x0000, check=0x1234)
-        d = await self.rd(0x0001, check=0x4321)
-        await self.wr(0x0001, 0x2341, check=dut.ml.q0001)
-        d = await self.rd(0x0001, check=0x2341)
-        d = await self.rd(0x0000, check=0x1234)
-        d = await self.rd(0x0001, check=0x2341)
+        await self.wr(0x0001, 0x0000)
+        await self.rd_burst([0x0000, 0x0001, 0x0000],
+                            check=[0x1234, 0x0000, 0x1234], hw=True)
+        await self.wr(0x0001, 0x4321)
+        await self.rd_burst([0x0000, 0x0001], check=[0x1234, 0x4321])
+        await self.wr(0x0001, 0x2341)
+        await self.rd_burst([0x0001, 0x0000, 0x0001],
+                            check=[0x2341, 0x1234, 0x2341])
+        await self.rd_burst([reg.addr for reg in self.REGMAP])
+        await self.scrub()
         await self.wclk(20)
-        await self.wr(0x0002, self.SPWORD_SVCLK, check=dut.ml.spword)
+        await self.spword.send(self.SPWORD_SVCLK)
         await self.wclk(20)
 
-        # Now kill off the coroutines we forked earlier
-        self.throw_coinc.kill()
+        self.spword.verify_counts(self.tclk())
+        self.spword.report()
+
+        # Take a last sample of the link-error counters, then kill off
+        # the coroutines we forked earlier
+        if self.badidle is not None:
+            await self.badidle.poll()
+            self.badidle.forked_coroutine.kill()
+            self.badidle.report()
+            if os.environ.get("BADIDLE_OUT"):
+                self.badidle.save(os.environ["BADIDLE_OUT"],
+                                  meta=dict(seed=cocotb.RANDOM_SEED))
+        if self.throw_coinc is not None:
+            self.throw_coinc.kill()
+        if mode == "multi":
+            self.multi.tally()
         for fr_name in self.fr:
             fr = self.fr[fr_name]
             print("killing off fake_rocstar instance {} : {}".
                   format(fr_name, fr))
             fr.forked_coroutine.kill()
+            for watcher in getattr(fr, "watchers", []):
+                watcher.kill()
+            if hasattr(fr, "sb"):
+                fr.sb.report()
+        if self.coinc_sb is not None:
+            self.coinc_sb.forked_coroutine.kill()
+            self.coinc_compare(self.coinc_sb)
+            print("coinc scoreboard: {} clocks, {} singles, {} failed".
+                  format(self.coinc_sb.nclk, self.coinc_sb.nsingle,
+                         self.coinc_sb.nfail))
         await self.wclk(5)
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
+        self.report_checks()
 
 
 @cocotb.test()
@@ -12,9 +12,8 @@ module tb;
     reg  [15:0] baddr=0, bwrdata=0;
     wire [15:0] brddata;
     reg         bwr=0, bstrobe=0;
-    wire [7:0]  A1in, B1in;
-    reg  [7:0]  A2in=0, A3in=0, A4in=0;
-    reg  [7:0]  B2in=0, B3in=0, B4in=0;
+    wire [7:0]  A1in, A2in, A3in, A4in;
+    wire [7:0]  B1in, B2in, B3in, B4in;
     wire [3:0]  A1out, A2out, A3out, A4out;
     wire [3:0]  B1out, B2out, B3out, B4out;
     mcu_logic ml
@@ -37,56 +36,144 @@ module tb;
     reg [47:0] clksav_A1=0, clksav_A2=0, clksav_A3=0, clksav_A4=0;
     reg [47:0] clksav_B1=0, clksav_B2=0, clksav_B3=0, clksav_B4=0;
 
-    // Instantiate just one instance (corresponding to just one
-    // rocstar board for now) of 'rocstar_mcu_link' logic that we will
-    // soon embed into the rocstar board's firmware.
+    // Instantiate one instance (corresponding to one rocstar board)
+    // per cable of the 'rocstar_mcu_link' logic that we will soon
+    // embed into the rocstar board's firmware.
     reg single_A1 = 0, single_A2 = 0, single_A3 = 0, single_A4 = 0;
     reg single_B1 = 0, single_B2 = 0, single_B3 = 0, single_B4 = 0;
     reg [5:0] offset_A1 = 0, offset_A2 = 0, offset_A3 = 0, offset_A4 = 0;
     reg [5:0] offset_B1 = 0, offset_B2 = 0, offset_B3 = 0, offset_B4 = 0;
-    wire [15:0] spword_A1, spword_B1;
+    // The multi-board emulator (multi_rocstar.py) drives all eight
+    // boards' single/offset inputs at once through these packed
+    // copies, in cable order A1,A2,A3,A4,B1,B2,B3,B4 from the LSB.
+    // Only one emulator runs at a time, so they are simply OR'd with
+    // the per-board regs above.
+    reg [7:0] singles = 0;
+    reg [47:0] offsets = 0;
+    wire [15:0] spword_A1, spword_A2, spword_A3, spword_A4;
+    wire [15:0] spword_B1, spword_B2, spword_B3, spword_B4;
     wire runmode_A1, sync_clk_A1, save_clk_A1;
-    wire pcoinc_A1, dcoinc_A1, ncoinc_A1;
+    wire runmode_A2, sync_clk_A2, save_clk_A2;
+    wire runmode_A3, sync_clk_A3, save_clk_A3;
+    wire runmode_A4, sync_clk_A4, save_clk_A4;
     wire runmode_B1, sync_clk_B1, save_clk_B1;
+    wire runmode_B2, sync_clk_B2, save_clk_B2;
+    wire runmode_B3, sync_clk_B3, save_clk_B3;
+    wire runmode_B4, sync_clk_B4, save_clk_B4;
+    wire pcoinc_A1, dcoinc_A1, ncoinc_A1;
+    wire pcoinc_A2, dcoinc_A2, ncoinc_A2;
+    wire pcoinc_A3, dcoinc_A3, ncoinc_A3;
+    wire pcoinc_A4, dcoinc_A4, ncoinc_A4;
     wire pcoinc_B1, dcoinc_B1, ncoinc_B1;
+    wire pcoinc_B2, dcoinc_B2, ncoinc_B2;
+    wire pcoinc_B3, dcoinc_B3, ncoinc_B3;
+    wire pcoinc_B4, dcoinc_B4, ncoinc_B4;
     wire rst = ml.rst;  // We can do this in test bench code!
     reg [7:0] testpatt = 0;
-    reg do_testp_A1 = 0, do_testp_B1 = 0;
-    wire [15:0] badidle_A1, badidle_B1;
-    wire [15:0] numsingl_A1, numsingl_B1;
-    wire [15:0] numcoinc_A1, numcoinc_B1;
-    wire [7:0] latency_A1, latency_B1;
+    reg do_testp_A1 = 0, do_testp_A2 = 0, do_testp_A3 = 0, do_testp_A4 = 0;
+    reg do_testp_B1 = 0, do_testp_B2 = 0, do_testp_B3 = 0, do_testp_B4 = 0;
+    wire [15:0] badidle_A1, badidle_A2, badidle_A3, badidle_A4;
+    wire [15:0] badidle_B1, badidle_B2, badidle_B3, badidle_B4;
+    wire [15:0] numsingl_A1, numsingl_A2, numsingl_A3, numsingl_A4;
+    wire [15:0] numsingl_B1, numsingl_B2, numsingl_B3, numsingl_B4;
+    wire [15:0] numcoinc_A1, numcoinc_A2, numcoinc_A3, numcoinc_A4;
+    wire [15:0] numcoinc_B1, numcoinc_B2, numcoinc_B3, numcoinc_B4;
+    wire [7:0] latency_A1, latency_A2, latency_A3, latency_A4;
+    wire [7:0] latency_B1, latency_B2, latency_B3, latency_B4;
     rocstar_mcu_link rmA1
       (.clk(clk), .rst(rst), .from_mcu(A1out), .to_mcu(A1in),
        .badidle(badidle_A1), .testpatt(testpatt), .do_testp(do_testp_A1),
        .numsingl(numsingl_A1), .numcoinc(numcoinc_A1), .latency(latency_A1),
-       .single(single_A1), .offset(offset_A1),
+       .single(single_A1 | singles[0]), .offset(offset_A1 | offsets[5:0]),
        .spword(spword_A1), .runmode(runmode_A1),
        .sync_clk(sync_clk_A1), .save_clk(save_clk_A1),
        .pcoinc(pcoinc_A1), .dcoinc(dcoinc_A1), .ncoinc(ncoinc_A1));
+    rocstar_mcu_link rmA2
+      (.clk(clk), .rst(rst), .from_mcu(A2out), .to_mcu(A2in),
+       .badidle(badidle_A2), .testpatt(testpatt), .do_testp(do_testp_A2),
+       .numsingl(numsingl_A2), .numcoinc(numcoinc_A2), .latency(latency_A2),
+       .single(single_A2 | singles[1]), .offset(offset_A2 | offsets[11:6]),
+       .spword(spword_A2), .runmode(runmode_A2),
+       .sync_clk(sync_clk_A2), .save_clk(save_clk_A2),
+       .pcoinc(pcoinc_A2), .dcoinc(dcoinc_A2), .ncoinc(ncoinc_A2));
+    rocstar_mcu_link rmA3
+      (.clk(clk), .rst(rst), .from_mcu(A3out), .to_mcu(A3in),
+       .badidle(badidle_A3), .testpatt(testpatt), .do_testp(do_testp_A3),
+       .numsingl(numsingl_A3), .numcoinc(numcoinc_A3), .latency(latency_A3),
+       .single(single_A3 | singles[2]), .offset(offset_A3 | offsets[17:12]),
+       .spword(spword_A3), .runmode(runmode_A3),
+       .sync_clk(sync_clk_A3), .save_clk(save_clk_A3),
+       .pcoinc(pcoinc_A3), .dcoinc(dcoinc_A3), .ncoinc(ncoinc_A3));
+    rocstar_mcu_link rmA4
+      (.clk(clk), .rst(rst), .from_mcu(A4out), .to_mcu(A4in),
+       .badidle(badidle_A4), .testpatt(testpatt), .do_testp(do_testp_A4),
+       .numsingl(numsingl_A4), .numcoinc(numcoinc_A4), .latency(latency_A4),
+       .single(single_A4 | singles[3]), .offset(offset_A4 | offsets[23:18]),
+       .spword(spword_A4), .runmode(runmode_A4),
+       .sync_clk(sync_clk_A4), .save_clk(save_clk_A4),
+       .pcoinc(pcoinc_A4), .dcoinc(dcoinc_A4), .ncoinc(ncoinc_A4));
     rocstar_mcu_link rmB1
       (.clk(clk), .rst(rst), .from_mcu(B1out), .to_mcu(B1in),
        .badidle(badidle_B1), .testpatt(testpatt), .do_testp(do_testp_B1),
        .numsingl(numsingl_B1), .numcoinc(numcoinc_B1), .latency(latency_B1),
-       .single(single_B1), .offset(offset_B1),
+       .single(single_B1 | singles[4]), .offset(offset_B1 | offsets[29:24]),
        .spword(spword_B1), .runmode(runmode_B1),
        .sync_clk(sync_clk_B1), .save_clk(save_clk_B1),
        .pcoinc(pcoinc_B1), .dcoinc(dcoinc_B1), .ncoinc(ncoinc_B1));
+    rocstar_mcu_link rmB2
+      (.clk(clk), .rst(rst), .from_mcu(B2out), .to_mcu(B2in),
+       .badidle(badidle_B2), .testpatt(testpatt), .do_testp(do_testp_B2),
+       .numsingl(numsingl_B2), .numcoinc(numcoinc_B2), .latency(latency_B2),
+       .single(single_B2 | singles[5]), .offset(offset_B2 | offsets[35:30]),
+       .spword(spword_B2), .runmode(runmode_B2),
+       .sync_clk(sync_clk_B2), .save_clk(save_clk_B2),
+       .pcoinc(pcoinc_B2), .dcoinc(dcoinc_B2), .ncoinc(ncoinc_B2));
+    rocstar_mcu_link rmB3
+      (.clk(clk), .rst(rst), .from_mcu(B3out), .to_mcu(B3in),
+       .badidle(badidle_B3), .testpatt(testpatt), .do_testp(do_testp_B3),
+       .numsingl(numsingl_B3), .numcoinc(numcoinc_B3), .latency(latency_B3),
+       .single(single_B3 | singles[6]), .offset(offset_B3 | offsets[41:36]),
+       .spword(spword_B3), .runmode(runmode_B3),
+       .sync_clk(sync_clk_B3), .save_clk(save_clk_B3),
+       .pcoinc(pcoinc_B3), .dcoinc(dcoinc_B3), .ncoinc(ncoinc_B3));
+    rocstar_mcu_link rmB4
+      (.clk(clk), .rst(rst), .from_mcu(B4out), .to_mcu(B4in),
+       .badidle(badidle_B4), .testpatt(testpatt), .do_testp(do_testp_B4),
+       .numsingl(numsingl_B4), .numcoinc(numcoinc_B4), .latency(latency_B4),
+       .single(single_B4 | singles[7]), .offset(offset_B4 | offsets[47:42]),
+       .spword(spword_B4), .runmode(runmode_B4),
+       .sync_clk(sync_clk_B4), .save_clk(save_clk_B4),
+       .pcoinc(pcoinc_B4), .dcoinc(dcoinc_B4), .ncoinc(ncoinc_B4));
+    // Packed copies of all eight cables' MCU outputs and run modes, so
+    // that the multi-board emulator can read each with one access
+    wire [31:0] mcu_outs = {B4out, B3out, B2out, B1out,
+                            A4out, A3out, A2out, A1out};
+    wire [7:0] runmodes = {runmode_B4, runmode_B3, runmode_B2, runmode_B1,
+                           runmode_A4, runmode_A3, runmode_A2, runmode_A1};
+    // Inputs and outputs of mcu_logic's 'coinc' for cables A1 and B1,
+    // packed into one net for tb.py's coinc_scoreboard
+    wire [33:0] coinc_probe = {ml.diffmax[7:0], ml.coinc.coincdiff,
+                               ml.ncB1, ml.pcB1, ml.ncA1, ml.pcA1,
+                               ml.offsetB1, ml.sB1, ml.offsetA1, ml.sA1};
     always @ (posedge clk) begin
         // This stuff will be in the rocstar firmware, but not inside
         // rocstar_mcu_link.
-        if (sync_clk_A1) begin
-            clkcnt_A1 <= 0;
-        end else begin
-            clkcnt_A1 <= clkcnt_A1 + 1;
-        end
-        if (sync_clk_B1) begin
-            clkcnt_B1 <= 0;
-        end else begin
-            clkcnt_B1 <= clkcnt_B1 + 1;
-        end
+        clkcnt_A1 <= sync_clk_A1 ? 0 : clkcnt_A1 + 1;
+        clkcnt_A2 <= sync_clk_A2 ? 0 : clkcnt_A2 + 1;
+        clkcnt_A3 <= sync_clk_A3 ? 0 : clkcnt_A3 + 1;
+        clkcnt_A4 <= sync_clk_A4 ? 0 : clkcnt_A4 + 1;
+        clkcnt_B1 <= sync_clk_B1 ? 0 : clkcnt_B1 + 1;
+        clkcnt_B2 <= sync_clk_B2 ? 0 : clkcnt_B2 + 1;
+        clkcnt_B3 <= sync_clk_B3 ? 0 : clkcnt_B3 + 1;
+        clkcnt_B4 <= sync_clk_B4 ? 0 : clkcnt_B4 + 1;
         if (save_clk_A1) clksav_A1 <= clkcnt_A1;
+        if (save_clk_A2) clksav_A2 <= clkcnt_A2;
+        if (save_clk_A3) clksav_A3 <= clkcnt_A3;
+        if (save_clk_A4) clksav_A4 <= clkcnt_A4;
         if (save_clk_B1) clksav_B1 <= clkcnt_B1;
+        if (save_clk_B2) clksav_B2 <= clkcnt_B2;
+        if (save_clk_B3) clksav_B3 <= clkcnt_B3;
+        if (save_clk_B4) clksav_B4 <= clkcnt_B4;
     end
 
     // Create a 100 MHz clock on the 'clk' net, since I've always
@@ -103,9 +190,64 @@ module tb;
     // This is needed to create a (compressed) Value Change Dump file
     // in Icarus Verilog, so that we can view the simulation results
     // with gtkwave.  In commercial simulators, this is not necessary.
+    // Dump control (see python/tbcommon/dump.py): +dumpdepth=n dumps
+    // only signals within n levels of 'tb' (default 0: all levels);
+    // +dumpscope=s: (one per scope, e.g. +dumpscope=tb: for tb's own
+    // signals) dumps only the named scopes below, each to depth n;
+    // +dumpoff starts with dumping off; after that, the dump is on
+    // while cocotb holds 'dump_on' high.
+    reg dump_on = 1;
+    integer dumpdepth = 0;
     initial begin
+        if (!$value$plusargs("dumpdepth=%d", dumpdepth)) dumpdepth = 0;
+        if ($test$plusargs("dumpoff")) dump_on = 0;
         $dumpfile("tb.lxt");
-        $dumpvars(0, tb);
+        if ($test$plusargs("dumpscope=")) begin
+            // (the trailing colon stops "ml:" from matching "ml.coinc:")
+            if ($test$plusargs("dumpscope=tb:")) $dumpvars(1, tb);
+            if ($test$plusargs("dumpscope=ml:")) $dumpvars(dumpdepth, tb.ml);
+            if ($test$plusargs("dumpscope=ml.coinc:"))
+                $dumpvars(dumpdepth, tb.ml.coinc);
+            if ($test$plusargs("dumpscope=ml.A1:"))
+                $dumpvars(dumpdepth, tb.ml.A1);
+            if ($test$plusargs("dumpscope=ml.A2:"))
+                $dumpvars(dumpdepth, tb.ml.A2);
+            if ($test$plusargs("dumpscope=ml.A3:"))
+                $dumpvars(dumpdepth, tb.ml.A3);
+            if ($test$plusargs("dumpscope=ml.A4:"))
+                $dumpvars(dumpdepth, tb.ml.A4);
+            if ($test$plusargs("dumpscope=ml.B1:"))
+                $dumpvars(dumpdepth, tb.ml.B1);
+            if ($test$plusargs("dumpscope=ml.B2:"))
+                $dumpvars(dumpdepth, tb.ml.B2);
+            if ($test$plusargs("dumpscope=ml.B3:"))
+                $dumpvars(dumpdepth, tb.ml.B3);
+            if ($test$plusargs("dumpscope=ml.B4:"))
+                $dumpvars(dumpdepth, tb.ml.B4);
+            if ($test$plusargs("dumpscope=rmA1:"))
+                $dumpvars(dumpdepth, tb.rmA1);
+            if ($test$plusargs("dumpscope=rmA2:"))
+                $dumpvars(dumpdepth, tb.rmA2);
+            if ($test$plusargs("dumpscope=rmA3:"))
+                $dumpvars(dumpdepth, tb.rmA3);
+            if ($test$plusargs("dumpscope=rmA4:"))
+                $dumpvars(dumpdepth, tb.rmA4);
+            if ($test$plusargs("dumpscope=rmB1:"))
+                $dumpvars(dumpdepth, tb.rmB1);
+            if ($test$plusargs("dumpscope=rmB2:"))
+                $dumpvars(dumpdepth, tb.rmB2);
+            if ($test$plusargs("dumpscope=rmB3:"))
+                $dumpvars(dumpdepth, tb.rmB3);
+            if ($test$plusargs("dumpscope=rmB4:"))
+                $dumpvars(dumpdepth, tb.rmB4);
+        end else begin
+            $dumpvars(dumpdepth, tb);
+        end
+        if (!dump_on) $dumpoff;
+    end
+    always @ (dump_on) begin
+        if (dump_on) $dumpon;
+        else $dumpoff;
     end
 endmodule
 
@@ -0,0 +1,120 @@
+"""
+Emulated DS2411 (silicon serial number) on tb.v's 1-Wire line.
+
+The DS2411's 64-bit ROM is, least significant byte first, the family
+code (0x01), a 48-bit serial number, and the Dallas/Maxim CRC8 of
+those seven bytes.  Every byte goes out on the line least significant
+bit first, so bit i of the ROM is the i'th bit sent, and read_ds2411,
+which stores bit i in 'read_rom[i]', should latch the ROM value as is.
+
+Ds2411.run() answers read_ds2411 with only a few triggers per bit:
+it measures each low pulse on the line to find the master's reset
+pulse, answers with a presence pulse, samples the 8 command bits
+WRITE_SAMPLE into each write slot, and, for READ ROM, holds the line
+low for READ_HOLD at the start of each read slot whose bit is 0.  All
+times are in (scaled) microseconds of the bench's timing profile (see
+ds2411_timing.py).  Set 'rom' before each read to replay a list of
+ROMs in one simulation.
+"""
+
+from cocotb.triggers import FallingEdge, RisingEdge
+
+FAMILY = 0x01  # DS2411 family code
+READ_ROM = 0x33  # READ ROM command
+
+# Slave timing (us), within the 1-Wire standard-speed limits
+RESET_MIN = 480  # shortest low pulse taken as a reset
+PRESENCE_WAIT = 30  # from end of reset to presence pulse (15-60)
+PRESENCE_LEN = 120  # presence pulse (60-240)
+WRITE_SAMPLE = 30  # from start of write slot to sampling (15-60)
+READ_HOLD = 45  # line held low for a 0 in a read slot (15-60)
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = crc >> 1 ^ (0x8c if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """Dallas/Maxim 1-Wire CRC8 (x^8 + x^5 + x^4 + 1) of bytes 'data'"""
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def rom_code(serial, family=FAMILY):
+    """64-bit ROM for 48-bit 'serial', with its CRC8"""
+    rom = family & 0xff | (serial & 0xffffffffffff) << 8
+    return rom | crc8(rom.to_bytes(7, "little")) << 56
+
+
+def rom_crc_ok(rom):
+    """does the top byte of 'rom' hold the CRC8 of the rest?"""
+    return crc8((rom & (1 << 56) - 1).to_bytes(7, "little")) == rom >> 56
+
+
+def rom_fields(rom):
+    """(family, serial, crc) of 64-bit 'rom'"""
+    return rom & 0xff, rom >> 8 & 0xffffffffffff, rom >> 56
+
+
+class Ds2411:
+
+    def __init__(self, tester, rom=None, present=True):
+        self.tester = tester
+        self.rom = rom_code(0) if rom is None else rom
+        self.present = present  # answer resets with a presence pulse?
+        self.line = tester.dut.din
+        self.pull = tester.dut.slave_pull
+        self.nreset = 0
+        self.nread = 0
+        self.cmds = []  # command bytes received
+
+    async def low_pulse(self):
+        """wait for the line to go low and high again; return for how
+        long (us) it was low"""
+        t = self.tester
+        await FallingEdge(self.line)
+        t0 = t.ns()
+        await RisingEdge(self.line)
+        return t.timing.us(t.ns() - t0)
+
+    async def run(self):
+        """answer each reset pulse, and READ ROM with self.rom"""
+        t = self.tester
+        while True:
+            if await self.low_pulse() < RESET_MIN:
+                continue
+            self.nreset += 1
+            if not self.present:
+                continue
+            await t.wus(PRESENCE_WAIT)
+            self.pull <= 1
+            await t.wus(PRESENCE_LEN)
+            self.pull <= 0
+            cmd = 0
+            for i in range(8):
+                await FallingEdge(self.line)
+                await t.wus(WRITE_SAMPLE)
+                cmd |= self.line.value.integer << i
+            self.cmds.append(cmd)
+            if cmd != READ_ROM:
+                print("ds2411 : command {:02x} is not READ ROM".format(cmd))
+                continue
+            rom = self.rom
+            for i in range(64):
+                await FallingEdge(self.line)
+                if not rom >> i & 1:
+                    self.pull <= 1
+                    await t.wus(READ_HOLD)
+                    self.pull <= 0
+            self.nread += 1
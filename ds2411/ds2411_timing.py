@@ -0,0 +1,71 @@
+"""
+One 1-Wire timing profile for read_ds2411.v and its bench.
+
+read_ds2411 counts every 1-Wire interval in ticks of its 'tick_1MHz',
+which comes once every TICK_CLKS = 100 cycles of the 100 MHz clk, i.e.
+once per microsecond.  A bench that runs with DS2411_SPEEDUP = n sets
+TICK_CLKS to 100/n (tb.v's SPEEDUP parameter, from the Makefile), so
+every interval, in both directions, is n times shorter in simulation
+while the protocol, counted in ticks, is unchanged.  The bench states
+its own waits in microseconds and converts them with clks() (or
+Tester.wus), so that they shrink by the same factor.
+
+The interval lengths themselves are in ds2411_timing.vh, which
+read_ds2411.v includes; TICKS here is read from that file.
+"""
+
+import os
+import re
+
+CLK_NS = 10  # period of 'clk'
+CLKS_PER_US = 1000 // CLK_NS
+
+
+def read_vh(filename=None):
+    """{name: value} for the localparams in ds2411_timing.vh"""
+    if filename is None:
+        filename = os.path.join(os.path.dirname(__file__),
+                                "ds2411_timing.vh")
+    ticks = {}
+    with open(filename) as f:
+        for line in f:
+            m = re.match(r"\s*(\w+)\s*=\s*(\d+)", line)
+            if m:
+                ticks[m.group(1)] = int(m.group(2))
+    return ticks
+
+
+TICKS = read_vh()
+
+
+class Timing:
+
+    def __init__(self, speedup=1):
+        if speedup < 1 or CLKS_PER_US % speedup:
+            raise ValueError("DS2411 speedup {} must divide {}".format(
+                speedup, CLKS_PER_US))
+        self.speedup = speedup
+        self.tick_clks = CLKS_PER_US // speedup  # read_ds2411 TICK_CLKS
+        self.tick_ns = self.tick_clks * CLK_NS  # one (scaled) microsecond
+        self.ticks = TICKS
+
+    @classmethod
+    def from_env(cls):
+        """the profile that the Makefile built tb.v with"""
+        return cls(int(os.environ.get("DS2411_SPEEDUP", 1)))
+
+    def clks(self, us):
+        """clk cycles in 'us' microseconds of (scaled) 1-Wire time;
+        at least one"""
+        return max(int(round(us * self.tick_clks)), 1)
+
+    def us(self, ns):
+        """(scaled) 1-Wire microseconds in 'ns' of simulation time"""
+        return ns / self.tick_ns
+
+    def __getattr__(self, name):
+        # Interval lengths from ds2411_timing.vh, e.g. self.ZERO_TIME
+        try:
+            return self.ticks[name]
+        except KeyError:
+            raise AttributeError(name)
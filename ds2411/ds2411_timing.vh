@@ -0,0 +1,16 @@
+// ds2411_timing.vh
+//
+// 1-Wire timing of read_ds2411.v, in ticks of its 'tick_1MHz', which
+// is one microsecond unless the bench speeds time up (see TICK_CLKS in
+// read_ds2411.v and ds2411_timing.py).  ds2411_timing.py reads this
+// file too, so that the bench's waits follow the same profile: keep to
+// one 'NAME = value' per line.
+
+localparam
+  TRANS_START = 630,   // 'transaction start' signal time
+  TRANS_WAIT = 240,    // allowed response time after transaction start signal
+  DELAY = 40,          // general delay
+  SHORT_DELAY = 15,    // read & write delay between bits (for chargeup)
+  ZERO_TIME = 120,     // time for sending a zero
+  ONE_TIME = 15,       // time for sending a one
+  FLOAT_TIME = 5;      // time for which to let line float before sampling
@@ -10,6 +10,7 @@
 `default_nettype none
 
 module read_ds2411
+  #(parameter TICK_CLKS = 100)  // clk cycles per 'tick_1MHz' (1 us)
   (
    input  wire        go,      // pulse to start the bus cycle
    input  wire 	      clk,     // 100 MHz system-wide master clock
@@ -30,11 +31,15 @@ module read_ds2411
    end
    
    // Cause 'tick_1MHz' to go high for one clk cycle per microsecond
+   // (per TICK_CLKS clk cycles, for a bench that speeds time up; with
+   // TICK_CLKS = 1 it stays high, and the state machine, which is
+   // enabled by 'tick_1MHz_d1' rather than clocked by it, steps on
+   // every clk)
    reg tick_1MHz = 0;
    reg tick_1MHz_d1 = 0;
    reg [6:0] count_to_1MHz = 0;
    always @ (posedge clk) begin
-       if (count_to_1MHz == 99) begin
+       if (count_to_1MHz == TICK_CLKS-1) begin
            count_to_1MHz <= 0;
            tick_1MHz <= 1;
        end else begin
@@ -44,14 +49,10 @@ module read_ds2411
        tick_1MHz_d1 <= tick_1MHz;
    end
 
+   // Timing constants, in ticks, shared with the bench
+`include "ds2411_timing.vh"
+
    // Declare wires and regs
-   localparam
-     TRANS_START = 630,              // 'transaction start' signal time
-     TRANS_WAIT = 240,               // allowed response time after transaction start signal
-     DELAY = 40,                     // general delay
-     SHORT_DELAY = 15,               // read & write delay between bits (for chargeup)
-     ZERO_TIME = 120,                // time for sending a zero
-     ONE_TIME = 15;                  // time for sending a one
 
    reg [7:0]   READ_ROM_CMD = 8'b00110011;  // 0x33 READ ROM command 
    
@@ -73,7 +74,7 @@ module read_ds2411
      stm8=8, stm9=9, stm10=10, stm11=11,
      stm12=12, stm13=13;
    reg [4:0]   smtm = 0;
-   always @ (posedge tick_1MHz_d1) begin
+   always @ (posedge clk) if (tick_1MHz_d1) begin
       if (reset) begin
 	 done <= 0;
 	 error <= 0;
@@ -119,7 +120,7 @@ module read_ds2411
 	   // State 3: Wait for response
 	   stm3:
 	     begin
-	        if (count == 240) begin
+	        if (count == TRANS_WAIT) begin
 		   if (response_caught) begin
 		      count <= 0;
 		      response_caught <= 1'b0;
@@ -220,7 +221,7 @@ module read_ds2411
 	   // State 10: Let line float
 	   stm10:
 	     begin
-		if (count == 5) begin
+		if (count == FLOAT_TIME) begin
 		   count <= 0;
 		   smtm <= stm11;
 		end else begin
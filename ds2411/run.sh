@@ -3,6 +3,10 @@ if [ -e $HOME/.local/bin/cocotb-config ]; then
 fi
 export COCOTB_REDUCED_LOG_FMT=1
 export PYTHONDONTWRITEBYTECODE=1
-export IVERILOG_DUMPER=lxt2
+# DUMP=off (or window, trigger; see python/tbcommon/dump.py) to
+# dump less
+export IVERILOG_DUMPER=${IVERILOG_DUMPER:-lxt2}
 export PYTHON_BIN=$(which python3)
+# accelerated 1-Wire time, then a short full-timing conformance test
 make
+make DS2411_SPEEDUP=1 TESTCASE=conformance
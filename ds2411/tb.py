@@ -1,195 +1,297 @@
 import cocotb
-import inspect
+import numpy
 import os
-
-from types import SimpleNamespace
-
-class Tester:
+import random
+
+from cocotb.triggers import FallingEdge, First, RisingEdge
+
+from ds2411_model import (READ_ROM, Ds2411, rom_code, rom_crc_ok,
+                          rom_fields)
+from ds2411_timing import Timing
+from tbcommon import TesterBase, save_npz
+
+# The ROM that the old hand-coded responder meant to send: family
+# 0x01, serial number bytes 0x66, and (now) a valid CRC
+SAMPLE_ROM = rom_code(0x666666666666)
+
+# One row per ROM read by run_test_rom_inventory
+ROM_DTYPE = [
+    ("rom", numpy.uint64),     # ROM sent by the emulated DS2411
+    ("result", numpy.uint64),  # what read_ds2411 latched
+    ("done", bool),            # read_ds2411 finished without error
+    ("match", bool),           # result == rom
+    ("crc_ok", bool),          # result carries a valid CRC8
+    ("us", numpy.float64),     # (scaled) microseconds per read
+]
+
+
+def rom_inventory():
+    """ROMs for run_test_rom_inventory: serial numbers from the file
+    named by DS2411_SERIALS (.npy, or whitespace-separated text), or
+    else the sample ROM, some bit patterns, and DS2411_NROMS random
+    serial numbers"""
+    filename = os.environ.get("DS2411_SERIALS")
+    if filename:
+        if filename.endswith(".npy"):
+            serials = [int(s) for s in numpy.load(filename)]
+        else:
+            with open(filename) as f:
+                serials = [int(w, 0) for w in f.read().split()]
+        return [rom_code(s) for s in serials]
+    nroms = int(os.environ.get("DS2411_NROMS", 16))
+    rng = random.Random(2411)
+    roms = [SAMPLE_ROM, rom_code(0), rom_code(0xffffffffffff),
+            0xaaaaaaaaaaaaaaaa]
+    roms += [rom_code(rng.getrandbits(48)) for _ in range(nroms)]
+    return roms
+
+# Limits (us) on read_ds2411's pulses, from 1WireTech.txt
+WINDOWS = {
+    "reset": (480, 640),
+    "write 1": (1, 15),
+    "write 0": (60, 120),
+}
+RECOVERY_MIN = 5  # line high between slots (us)
+
+
+class Tester(TesterBase):
 
     def __init__(self, dut):
-        self.dut = dut
-        self.verbose = False
-        self.nchecks_ok = 0
-        self.nchecks_failed = 0
-
-    def check(self, expr):
-        if expr:
-            self.nchecks_ok += 1
-            return
-        self.nchecks_failed += 1
-        callerframerecord = inspect.stack()[1]
-        frame = callerframerecord[0]
-        info = inspect.getframeinfo(frame)
-        where = "{}:{}:{} :: {}".format(
-            info.function, os.path.basename(info.filename),
-            info.lineno, info.code_context[0].strip()
-        )
-        ns = self.ns()
-        print("CHECKFAIL@{:.0f}".format(ns), where)
-
-    def ns(self):
-        """return current simulation time in nanoseconds"""
-        return cocotb.utils.get_sim_time(units="ns")
-
-    async def wclk(self, nclk = 1, rising = True):
-        """shortcut for await ClockCycles"""
-        await cocotb.triggers.ClockCycles(self.dut.clk, nclk, rising = rising)
-
-    async def send_one(self):
-        await cocotb.triggers.Edge(self.dut.din)
-        await cocotb.triggers.Edge(self.dut.din)
-
-    async def send_zero(self):
-        await cocotb.triggers.Edge(self.dut.din)
-        await cocotb.triggers.Edge(self.dut.din)
-        self.dut.din <= 0;
-        await self.wclk(9000)
-        self.dut.din <= 1;
-
-    async def ROM_zeroes(self):
-        for i in range (64):
-            await self.send_zero()
-            await self.wclk(10)
-
-    async def ROM_zero_one_alternating(self):
-        for i in range (32):
-            await self.send_zero()
-            await self.wclk(10)
-            await self.send_one()
-            await self.wclk(10)
-
-    async def ROM_like_expected(self):
-        ## This test is sent the wrong way round
-        ## Sample CRC byte
-        for i in range (4):
-            await self.send_zero()
-            await self.wclk(10)
-            await self.send_one()
-            await self.wclk(10)
-
-        ## Sample serial code (6 bytes)
-        for i in range(12):
-            await self.send_zero()
-            await self.wclk(10)
-            await self.send_one()
-            await self.wclk(10)
-            await self.send_one()
-            await self.wclk(10)
-            await self.send_zero()
-            await self.wclk(10)
-
-        ## Sample family code byte
-        for i in range(7):
-            await self.send_zero()
-            await self.wclk(10)
-        await self.send_one()
-        await self.wclk(10)
-
-    async def run_test_sample_ROM(self):
+        super().__init__(dut)
+        # All waits below are in microseconds of 1-Wire time, which
+        # runs DS2411_SPEEDUP times faster than real time
+        self.timing = Timing.from_env()
+        self.pulses = []  # (start, length) in us, from line_monitor
+        self.ds2411 = Ds2411(self)
+        self.slave = None  # coroutine running self.ds2411
+
+    async def wus(self, us):
+        """wait 'us' microseconds of (scaled) 1-Wire time"""
+        await self.wclk(self.timing.clks(us))
+
+    async def line_monitor(self):
+        """record each interval for which read_ds2411 pulls the line
+        low, as (start, length) in (scaled) microseconds"""
+        en = self.dut.rd2411.din_enable
+        while True:
+            await RisingEdge(en)
+            t0 = self.ns()
+            await FallingEdge(en)
+            self.pulses.append((self.timing.us(t0),
+                                self.timing.us(self.ns() - t0)))
+
+    def expected_pulses(self, nwrite=8, nread=64):
+        """(name, length in us) of each low pulse of a READ ROM, with
+        the timing of ds2411_timing.vh; each lasts one tick longer
+        than its count, as the state machine enters the next state on
+        the tick after the count is reached"""
+        p = self.timing
+        pulses = [("reset", p.TRANS_START + 1)]
+        for i in range(nwrite):
+            if READ_ROM >> i & 1:
+                pulses.append(("write 1", p.ONE_TIME + 1))
+            else:
+                pulses.append(("write 0", p.ZERO_TIME + 1))
+        pulses += nread * [("read", p.SHORT_DELAY + 1)]
+        return pulses
+
+    def check_pulses(self, expected, windows=False):
+        """check the pulses seen since the last call against
+        'expected' (see expected_pulses); with 'windows', also report
+        any that fall outside the 1-Wire limits in WINDOWS"""
+        pulses, self.pulses = self.pulses, []
+        self.check(len(pulses) == len(expected))
+        nbad = 0
+        outside = {}  # name -> longest pulse outside its window
+        for (t0, length), (name, want) in zip(pulses, expected):
+            if round(length) != want:
+                nbad += 1
+                if nbad <= 5:
+                    print("ds2411 : {} pulse at {:.0f} us lasted {:.2f} us,"
+                          " expected {}".format(name, t0, length, want))
+            lo, hi = WINDOWS.get(name, (0, None))
+            if length < lo or hi is not None and length > hi:
+                outside[name] = max(length, outside.get(name, 0))
+        self.check(nbad == 0)
+        if windows:
+            for name, length in outside.items():
+                print("ds2411 : note: {} pulse lasted {:.0f} us, outside"
+                      " {}-{} us".format(name, length, *WINDOWS[name]))
+            gaps = [b[0] - (a[0] + a[1]) for a, b in zip(pulses, pulses[1:])]
+            if gaps and min(gaps) < RECOVERY_MIN:
+                print("ds2411 : note: recovery {:.0f} us, under {} us".format(
+                    min(gaps), RECOVERY_MIN))
+        print("ds2411 : {} pulses checked at {}x speed, {} bad".format(
+            len(pulses), self.timing.speedup, nbad))
+
+    def start_ds2411(self, present=True):
+        """(re)start the emulated DS2411, e.g. after the test has left
+        it halfway through a transaction"""
+        if self.slave is not None:
+            self.slave.kill()
+        self.dut.slave_pull <= 0
+        self.ds2411.present = present
+        self.slave = cocotb.fork(self.ds2411.run())
+
+    async def read_rom(self, rom):
+        """pulse 'go' and have the emulated DS2411 answer with 'rom';
+        return what read_ds2411 latched, or None if it flagged an
+        error"""
+        dut = self.dut
+        self.ds2411.rom = rom
+        dut.go <= 1
+        await self.wus(2)
+        dut.go <= 0
+        await First(RisingEdge(dut.done), RisingEdge(dut.error))
+        # 'result' is written on the same clock as 'done'
+        await self.wclk()
+        if dut.error.value.integer:
+            return None
+        return dut.result.value.integer
+
+    async def run_test_sample_ROM(self, windows=False):
         dut = self.dut
-        dt = dut.rd2411
-
-        await self.wclk(1000)
-
-        ## Start the logic
-        dut.go <= 1;
-
-        ## Respond
-        await self.wclk(80000)
-        dut.din <= 0;
-        dut.go <= 0;
-        await self.wclk(1000)
-        dut.din <= 1;
 
-        ## Wait for the HOST to send ROM command and initiate writing sequence
-        for i in range(26):
-            await cocotb.triggers.Edge(dt.smtm)
+        self.pulses = []
+        self.start_ds2411()
+        await self.wus(10)
 
-        ## Write ROM string
-        await self.ROM_like_expected()
+        ## Read the sample ROM and check the line's timing
+        got = await self.read_rom(SAMPLE_ROM)
+        if got != SAMPLE_ROM:
+            print("ds2411 : read {} expected {:016x}".format(
+                got if got is None else "{:016x}".format(got), SAMPLE_ROM))
+        self.check(got == SAMPLE_ROM)
+        self.check_pulses(self.expected_pulses(), windows)
 
         ## Reset the logic after a delay
-        await cocotb.triggers.Edge(dt.done)
-        await self.wclk(100000)
+        await self.wus(1000)
         dut.reset <= 1;
-        await self.wclk(1500)
+        await self.wus(15)
         dut.reset <= 0;
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
+        self.report_checks()
+
+    async def run_test_rom_inventory(self, roms):
+        """read each ROM in 'roms' in turn, in one simulation; print
+        a table of results, and save it to DS2411_RESULTS if set"""
+        self.start_ds2411()
+        r = numpy.zeros(len(roms), dtype=ROM_DTYPE)
+        for i, rom in enumerate(roms):
+            t0 = self.ns()
+            got = await self.read_rom(rom)
+            r["rom"][i] = rom
+            r["us"][i] = self.timing.us(self.ns() - t0)
+            if got is not None:
+                r["result"][i] = got
+                r["done"][i] = True
+                r["match"][i] = got == rom
+                r["crc_ok"][i] = rom_crc_ok(got)
+        self.check(r["match"].all())
+        self.print_rom_table(r)
+        if os.environ.get("DS2411_RESULTS"):
+            save_npz(r, os.environ["DS2411_RESULTS"],
+                     meta={"speedup": self.timing.speedup})
+        self.report_checks()
+
+    def print_rom_table(self, r, nprint=10):
+        """print the first 'nprint' rows of a ROM results table (see
+        ROM_DTYPE), and every row that failed"""
+        print("ds2411 : {:>3} {:>16} {:>6} {:>12} {:>3} {:>16} {:>5}"
+              .format("#", "rom", "family", "serial", "crc", "result", "ok"))
+        for i, row in enumerate(r):
+            if i >= nprint and row["match"]:
+                continue
+            family, serial, crc = rom_fields(int(row["rom"]))
+            print("ds2411 : {:3d} {:016x} {:6x} {:12x} {:3x} {:>16} {:>5}"
+                  .format(i, int(row["rom"]), family, serial, crc,
+                          "{:016x}".format(int(row["result"]))
+                          if row["done"] else "error",
+                          "ok" if row["match"] else "BAD"))
+        print("ds2411 : {} ROMs read, {} matched, {} errors, {} with bad"
+              " CRC, {:.0f} us per read".format(
+                  len(r), r["match"].sum(), (~r["done"]).sum(),
+                  (r["done"] & ~r["crc_ok"]).sum(), r["us"].mean()))
 
     async def run_test_reset(self):
         dut = self.dut
         dt = dut.rd2411
 
-        await self.wclk(1000)
+        self.start_ds2411()
+        await self.wus(10)
 
         ## Start the logic
         dut.go <= 1;
-
-        ## Respond
-        await self.wclk(80000)
-        dut.din <= 0;
+        await self.wus(2)
         dut.go <= 0;
-        await self.wclk(1000)
-        dut.din <= 1;
 
-        ## Wait for the HOST to send ROM command and initiate writing sequence
+        ## Wait for the end of the transaction start sequence
         await cocotb.triggers.Edge(dt.smtm)
         await cocotb.triggers.Edge(dt.smtm)
 
         ## Cut the logic off
         dut.reset <= 1;
-        await self.wclk(30000)
+        await self.wus(300)
         dut.reset <= 0;
-        await self.wclk(1500)
+        await self.wus(15)
 
-        await self.wclk(50000)
+        await self.wus(500)
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
+        self.report_checks()
 
     async def run_test_no_response(self):
         dut = self.dut
         dt = dut.rd2411
 
-        await self.wclk(1000)
+        self.pulses = []
+        self.start_ds2411(present=False)
+        await self.wus(10)
 
         ## Start the logic
         dut.go <= 1;
-        await self.wclk(10000)
+        await self.wus(100)
         dut.go <= 0;
 
         ## Wait for error to be announced
         await cocotb.triggers.Edge(dt.error)
+        self.check_pulses(self.expected_pulses(nwrite=0, nread=0))
 
         ## Reset the logic after a delay
-        await self.wclk(10000)
+        await self.wus(100)
         dut.reset <= 1;
-        await self.wclk(1500)
+        await self.wus(15)
         dut.reset <= 0;
 
-        await self.wclk(50000)
+        await self.wus(500)
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
+        self.report_checks()
 
 
 @cocotb.test()
 async def tests(dut):
     """instantiate Tester class then run its test(s)"""
     tester = Tester(dut)
+    tester.monitor = cocotb.fork(tester.line_monitor())
     await tester.run_test_sample_ROM()
-    await tester.wclk(100000)
+    await tester.wus(1000)
     await tester.run_test_reset()
-    await tester.wclk(100000)
+    await tester.wus(1000)
     await tester.run_test_no_response()
+    tester.monitor.kill()
+
+
+@cocotb.test()
+async def inventory(dut):
+    """read a whole inventory of ROMs (see rom_inventory)"""
+    tester = Tester(dut)
+    await tester.run_test_rom_inventory(rom_inventory())
+
+
+@cocotb.test(skip=Timing.from_env().speedup != 1)
+async def conformance(dut):
+    """one READ ROM at full 1-Wire timing ('make DS2411_SPEEDUP=1
+    TESTCASE=conformance'), checked against the 1-Wire limits"""
+    tester = Tester(dut)
+    tester.monitor = cocotb.fork(tester.line_monitor())
+    await tester.run_test_sample_ROM(windows=True)
+    tester.monitor.kill()
@@ -3,14 +3,18 @@
 
 module tb;
 
+   // Run 1-Wire time this many times faster than real time (see
+   // ds2411_timing.py); set by the Makefile from DS2411_SPEEDUP
+   parameter SPEEDUP = 1;
+
    // regs and wires go here
-   wire       go;
+   reg        go = 0;
    reg        clk;
-   wire       reset;
+   reg        reset = 0;
    
    wire       din;
 
-   reg [63:0] result;
+   wire [63:0] result;
 
    wire       GND;
     
@@ -21,11 +25,15 @@ module tb;
 
 
    assign GND = 1'b0;
-   assign reset = 1'b0;
-   assign go = 1'b0;
-   assign working = 1'b0;
+
+   // The 1-Wire line is open-drain: pulled up, and pulled low by
+   // read_ds2411 or by the emulated DS2411 (ds2411_model.py), which
+   // sets 'slave_pull' to drive it
+   reg        slave_pull = 0;
+   pullup (din);
+   assign din = slave_pull ? 1'b0 : 1'bz;
    
-   read_ds2411 rd2411
+   read_ds2411 #(.TICK_CLKS(100/SPEEDUP)) rd2411
      (.go(go),
       .clk(clk),
       .reset(reset),
@@ -44,8 +52,29 @@ module tb;
        end
     end
    
+   // Dump control (see python/tbcommon/dump.py): +dumpdepth=n dumps
+   // only signals within n levels of 'tb' (default 0: all levels);
+   // +dumpscope=s: (one per scope, e.g. +dumpscope=tb: for tb's own
+   // signals) dumps only the named scopes below, each to depth n;
+   // +dumpoff starts with dumping off; after that, the dump is on
+   // while cocotb holds 'dump_on' high.
+   reg dump_on = 1;
+   integer dumpdepth = 0;
    initial begin
+      if (!$value$plusargs("dumpdepth=%d", dumpdepth)) dumpdepth = 0;
+      if ($test$plusargs("dumpoff")) dump_on = 0;
       $dumpfile("tb.lxt");
-      $dumpvars(0, tb);
+      if ($test$plusargs("dumpscope=")) begin
+         if ($test$plusargs("dumpscope=tb:")) $dumpvars(1, tb);
+         if ($test$plusargs("dumpscope=rd2411:"))
+           $dumpvars(dumpdepth, tb.rd2411);
+      end else begin
+         $dumpvars(dumpdepth, tb);
+      end
+      if (!dump_on) $dumpoff;
+   end
+   always @ (dump_on) begin
+      if (dump_on) $dumpon;
+      else $dumpoff;
    end
 endmodule
@@ -0,0 +1,355 @@
+"""
+NumPy reference ("golden") model of the dynode timing pickoff.
+
+Two algorithms are modeled, vectorized over many independent 'adcdat'
+sample streams at once (one stream per row of an (N, T) array).  The
+models work on time-major (T, N) copies in chunks of CHUNK streams:
+the parts of each pipeline that only feed forward are computed for
+all clocks at once, and only the state that feeds back on itself is
+stepped clock by clock, so that a million pulses take a few seconds:
+
+  dt_model()       -- Ben's 'dynode_trigger' module (dynode_trigger.v):
+                      local-maximum detector, half-maximum pickoff
+                      level, and interpolation between the samples
+                      straddling it via the 'inverse_lookup' table,
+                      giving the 'single' and 'offset' outputs
+
+  eventdet_model() -- Roger's 'dynode_eventdet' module (via
+                      dynode_trigger_roger_version.v): 3-point smooth,
+                      first and second derivatives, second-derivative
+                      zero crossing interpolated via 'inverse_lookup',
+                      and the 'sdtim0adj' adjustment of the fraction
+                      and whole number (the calculation that tb.py's
+                      "PUT THIS IN VERILOG" comment describes), giving
+                      'event_whole_num' and 'event_frac'
+
+Both models assume a steady baseline; for eventdet_model(), that is
+the 'dynbl.currentvalue' that tb.py pokes before sending pulses.  The
+models reproduce the register arithmetic (bit widths, wraparound,
+table lookup) but not the absolute pipeline latency, which tb.py
+measures as the constant offset between DUT and model event times.
+
+Run this file directly to pre-screen a batch of pulses from pulses.py
+without the simulator.
+"""
+
+import argparse
+import numpy
+import time
+
+from types import SimpleNamespace
+
+# 'inverse_lookup' in dynode_trigger.v: 0x10000/value, saturated
+INVERSE = numpy.array([0xffff, 0xffff] + [0x10000 // v for v in range(2, 256)],
+                      dtype=numpy.int64)
+
+# localparams of dynode_eventdet
+SDTIM0ADJ = 0b001100001001  # time adjust for sd time
+INDETONLEVEL = 0b0000_0100_000000  # indet turn on level
+INDETOFFLEVEL = 0b0000_0010_000000  # indet turn off level
+FDONLEVEL = 0b0_0000_1000_000000  # fd minimum for event
+SDONLEVEL = 0b0_0000_0110_000000  # sd minimum for event
+PUDETWIDE = 0b100  # max clocks in SED1 before pileup dump
+SED0, SED1, SED2, SED3, SED4, SED5 = range(6)
+
+# Streams per pass of a model (see by_chunks)
+CHUNK = 8192
+
+
+def pad_streams(adcdat, quiescent, npre=4, npost=32):
+    """surround each row of pulse samples with quiescent samples"""
+    adcdat = numpy.asarray(adcdat)
+    n = len(adcdat)
+    pre = numpy.full((n, npre), quiescent, dtype=adcdat.dtype)
+    post = numpy.full((n, npost), quiescent, dtype=adcdat.dtype)
+    return numpy.hstack([pre, adcdat, post])
+
+
+def by_chunks(model, x, *args):
+    """run 'model' on CHUNK rows of 'x' at a time, so that its
+    temporaries stay in cache, and join the results"""
+    if len(x) <= CHUNK:
+        return model(x, *args)
+    parts = [model(x[i:i+CHUNK], *args) for i in range(0, len(x), CHUNK)]
+    return SimpleNamespace(**{k: numpy.concatenate([vars(p)[k] for p in parts])
+                              for k in vars(parts[0])})
+
+
+def time_major(x):
+    """(T, N) int32 copy of (N, T) streams 'x', so that each clock's
+    values for all streams are contiguous"""
+    return numpy.asarray(x).T.astype(numpy.int32, order="C")
+
+
+def delayed(a, k, fill=0):
+    """(T, N) array 'a' delayed by k clocks"""
+    d = numpy.full_like(a, fill)
+    d[k:] = a[:len(a)-k]
+    return d
+
+
+def last_before(mask):
+    """(T, N) index of the last clock before each clock at which 'mask'
+    was set, or -1"""
+    last = numpy.empty(mask.shape, dtype=numpy.int32)
+    last[0] = -1
+    for t in range(1, len(mask)):
+        # (a loop over clocks beats numpy.maximum.accumulate here)
+        numpy.copyto(last[t], last[t-1])
+        numpy.copyto(last[t], t-1, where=mask[t-1])
+    return last
+
+
+def pick(a, t, default=0):
+    """a[t[i], i] for each stream i, or 'default' where t[i] < 0"""
+    i = numpy.arange(a.shape[1])
+    return numpy.where(t >= 0, a[numpy.maximum(t, 0), i], default)
+
+
+def dt_model(x, energy_thresh_low):
+    """model 'dynode_trigger' on (N, T) streams 'x'
+
+    Returns a namespace of per-stream arrays for the first 'single'
+    of each stream: found, clock index 'tick' (at which 'single' and
+    'offset' are registered), 'offset', plus the intermediate values
+    max_val, diff0, diff1, and timing_value.
+    """
+    return by_chunks(_dt_model, numpy.asarray(x), energy_thresh_low)
+
+
+def _dt_model(x, energy_thresh_low):
+    x = time_major(x)
+    nt, n = x.shape
+    # Each (T, N) array below holds, in row t, a signal's value during
+    # clock cycle t.  Start from a settled pipeline, as if the stream's
+    # first sample (the quiescent level) had always been there:
+    # past(k) is the sample k clocks ago, i.e. data_delay[k-1]
+    xp = numpy.vstack([numpy.repeat(x[:1], 10, axis=0), x])
+    past = lambda k: xp[10-k:10-k+nt]
+    timing_data, timing_data_d = past(7), past(8)
+    # over_thresh_d, increasing, and increasing_d start out low
+    first = lambda k: numpy.arange(nt)[:, None] >= k
+    over_thresh_d = (past(2) > energy_thresh_low) & first(2)
+    increasing = (past(1) >= past(2)) & first(1)
+    increasing_d = (past(2) >= past(3)) & first(2)
+    new_max = ~increasing & increasing_d & over_thresh_d
+    last_max = last_before(new_max)
+    max_val = numpy.where(last_max >= 0, numpy.take_along_axis(
+        past(2), numpy.maximum(last_max, 0), axis=0), 0)
+    pickoff = max_val >> 1
+    timing_latch = (timing_data > pickoff) & (timing_data_d <= pickoff)
+    # 'latch_counter' bit k is 'timing_latch' k+1 clocks ago; 'single'
+    # fires when it reaches bit 5
+    n_latch = delayed(timing_latch, 5)
+    found_max_tick = delayed(new_max, 1)
+    found = timing_latch[:nt-6].any(axis=0)
+    fire = numpy.where(found, timing_latch[:nt-6].argmax(axis=0) + 6, -1)
+    # The only state that feeds back on itself: 'found_timing_value'
+    # and 'timeout', which decide on which clocks the interpolation
+    # registers load
+    run = numpy.zeros((nt, n), dtype=bool)
+    found_timing_value = numpy.zeros(n, dtype=bool)
+    timeout = numpy.zeros(n, dtype=numpy.int8)
+    for t in range(fire.max() if n else 0):
+        fmt = found_max_tick[t]
+        run[t] = ~fmt & ~found_timing_value
+        expired = timeout == 0
+        timeout = numpy.where(found_timing_value, 0, numpy.maximum(timeout-1, 0))
+        timeout[fmt] = 10
+        found_timing_value = ~fmt & (found_timing_value | n_latch[t] | expired)
+    # Each interpolation register holds what it loaded on the last
+    # clock that it ran, and that only matters at the clock on which
+    # 'single' fires, so follow the chain back from there, stream by
+    # stream: value_above/below -> diff0/1 -> diff0_inverse ->
+    # timing_value_large
+    last_run = last_before(run)
+    last_latch = last_before(run & timing_latch)
+    before = lambda t: pick(last_run, t, -1)
+    above = lambda t: pick(timing_data, pick(last_latch, t, -1))
+    below = lambda t: pick(timing_data_d, pick(last_latch, t, -1))
+    # diff0 and diff1 as loaded on clock t (0 for no load, t < 0)
+    diff0 = lambda t: numpy.where(t >= 0, (above(t) - below(t)) & 0xff, 0)
+    diff1 = lambda t: numpy.where(
+        t >= 0, (pick(pickoff, t) - below(t)) & 0xff, 0)
+    j1 = before(fire)  # last load before 'single' fires
+    j2 = before(j1)    # ... and the one before that
+    j3 = before(j2)
+    # diff0_inverse during cycle j1, then timing_value_large as
+    # loaded from it on clock j1
+    diff0_inverse = numpy.where(j2 >= 0, INVERSE[diff0(j3)], 0)
+    timing_value_large = numpy.where(
+        j1 >= 0, (diff1(j2) * diff0_inverse) & 0xffffff, 0)
+    timing_value = numpy.where(
+        (timing_value_large >> 10) & 0x3f == 0x3f, 0xf8,
+        (timing_value_large >> 8) & 0xff)
+    i64 = lambda a: numpy.where(found, a, 0).astype(numpy.int64)
+    return SimpleNamespace(found=found, tick=i64(fire),
+                           offset=i64(timing_value >> 2),
+                           max_val=i64(pick(max_val, fire)),
+                           diff0=i64(diff0(j1)), diff1=i64(diff1(j1)),
+                           timing_value=i64(timing_value))
+
+
+def sd_fraction(enesd_p, enesd_n):
+    """12-bit fraction of a clock tick at which the second derivative
+    crosses zero, as computed by dynode_eventdet's 'sd_timfrac'"""
+    dif = (enesd_p - enesd_n) & 0x7fff
+    shift = numpy.zeros_like(dif)
+    done = numpy.zeros(dif.shape, dtype=bool)
+    for bit in range(13, 7, -1):
+        sel = ~done & ((dif >> bit) & 1 == 1)
+        shift[sel] = bit - 7
+        done |= sel
+    delt = (dif >> shift) & 0xff
+    timfrac = (((enesd_p >> shift) & 0x1ff) * INVERSE[delt]) & 0x1ffffff
+    return (timfrac >> 4) & 0xfff
+
+
+def eventdet_model(x, baseline):
+    """model 'dynode_eventdet' on (N, T) streams 'x'
+
+    'baseline' is the baseline correction currentvalue[15:4], i.e. 16
+    times the quiescent ADC level.  Returns a namespace of per-stream
+    arrays for the first event of each stream: found, clock index
+    'tick' of the second-derivative zero crossing, 12-bit 'whole'
+    (tick relative to stream start, with the 'sdtim0adj' +/-1
+    correction applied) and 'frac' (units of 1/4096 tick), plus the
+    crossing values enesd_p and enesd_n.
+    """
+    return by_chunks(_eventdet_model, numpy.asarray(x), baseline)
+
+
+def since(a, mask):
+    """(T, N) value during each cycle of a register that loads
+    (a[t-1] - a[t-2]) & 'mask' at each clock edge (a is 0 before t=0)"""
+    a = delayed(a, 1)
+    return (a - delayed(a, 1)) & mask
+
+
+def _eventdet_model(x, baseline):
+    x = time_major(x)
+    nt, n = x.shape
+    # The smoothing and derivative pipeline only feeds forward, so it
+    # is computed for all clocks at once: row t of each (T, N) array
+    # is the register's value during clock cycle t (all start at 0)
+    blcor = delayed(numpy.maximum(16*x - baseline, 0) & 0xfff, 1)
+    blcor_d0, blcor_d1 = delayed(blcor, 1), delayed(blcor, 2)
+    enesmo = delayed(blcor + blcor_d0 + blcor_d1, 1) & 0x3fff
+    enefd = since(enesmo, 0x7fff)
+    enesd = since(enefd, 0x7fff)
+    enesd_d = delayed(enesd, 1)
+    fdpos = (enefd > FDONLEVEL) & (enefd < 0x4000)
+    sdpos = (enesd > SDONLEVEL) & (enesd < 0x4000)
+    sdneg = enesd >= 0x4000
+    # indet_on implies indet_off, so indet follows a simple OR below
+    indet_on = enesmo > INDETONLEVEL
+    indet_off = enesmo > INDETOFFLEVEL
+    blcor_up = blcor_d0 >= blcor_d1
+    # The state machine and its enables run clock by clock, on small
+    # arrays; the crossing arithmetic is left for the end, for only
+    # the clock at which each stream's 'sd_evnttim' is latched
+    b = lambda: numpy.zeros(n, dtype=bool)
+    z = lambda: numpy.zeros(n, dtype=numpy.int32)
+    indet, fden, sden, evnten = b(), b(), b(), b()
+    smed = numpy.zeros(n, dtype=numpy.int8)
+    pucnt = numpy.zeros(n, dtype=numpy.int8)
+    enesd_p, enesd_n, evnt_timsd = z(), z(), z()
+    found, up = b(), b()
+    tick, latched_p, latched_n = z(), z(), z()
+    for t in range(nt):
+        # combinational logic during clock cycle t (the enable
+        # "latches" hold their values, so use last cycle's evnten)
+        sed0 = smed == SED0
+        sed1 = smed == SED1
+        hold = indet & ~evnten
+        fden = (indet & fdpos[t] & sed0) | (hold & fden)
+        sden = (indet & sdpos[t] & sed0) | (hold & sden)
+        evnten = indet & ((fden & sden) | (sed1 & evnten))
+        # 'sd_evnttim' is latched at the clock edge ending SED3
+        latch = (smed == SED3) & ~found
+        if latch.any():
+            found |= latch
+            numpy.copyto(tick, evnt_timsd, where=latch)
+            numpy.copyto(latched_p, enesd_p, where=latch)
+            numpy.copyto(latched_n, enesd_n, where=latch)
+            numpy.copyto(up, blcor_up[t], where=latch)
+            if found.all():
+                break
+        # registers, updated from old values at the clock edge
+        numpy.copyto(enesd_p, enesd_d[t], where=evnten)
+        numpy.copyto(enesd_n, enesd[t], where=evnten)
+        numpy.copyto(evnt_timsd, t, where=evnten)
+        dump = sed1 & (pucnt >= PUDETWIDE)
+        nxt = smed + 1
+        numpy.copyto(nxt, evnten, where=sed0)
+        numpy.copyto(nxt, SED1 + sdneg[t], where=sed1)
+        numpy.copyto(nxt, SED0, where=dump | (smed == SED5))
+        smed = nxt
+        pucnt += 1
+        pucnt *= sed1
+        indet = indet_on[t] | (indet & indet_off[t])
+    f12 = sd_fraction(latched_p, latched_n)
+    low = f12 <= SDTIM0ADJ
+    fraction = numpy.where(low, SDTIM0ADJ - f12, 0x1000 + SDTIM0ADJ - f12)
+    whole = numpy.where(low, numpy.where(up, tick - 1, tick + 1), tick)
+    whole = whole + (fraction >> 12 & 1)
+    i64 = lambda a: numpy.where(found, a, 0).astype(numpy.int64)
+    return SimpleNamespace(found=found, tick=i64(tick), whole=i64(whole),
+                           frac=i64(fraction & 0xfff),
+                           enesd_p=i64(latched_p), enesd_n=i64(latched_n))
+
+
+def event_times(adcdat, quiescent, npre=4, npost=32):
+    """model event time (in ticks, relative to the first sample of
+    each pulse) for rows of 'adcdat'; NaN where no event was found"""
+    m = eventdet_model(pad_streams(adcdat, quiescent, npre, npost),
+                       16*quiescent)
+    times = m.whole - npre + m.frac / 4096.
+    return numpy.where(m.found, times, numpy.nan)
+
+
+def compare(dut_float, model_float, period=256, tol=0.5/4096):
+    """compare DUT and model event times (ticks) event by event
+
+    The two differ by the pipeline latency, which is estimated as the
+    median difference.  Returns (latency, indices of events that
+    disagree by more than 'tol' after removing the latency).
+    """
+    half = period // 2
+    diff = (dut_float - model_float + half) % period - half
+    ok = ~numpy.isnan(diff)
+    latency = numpy.median(diff[ok]) if ok.any() else 0.
+    bad = ~ok | (numpy.abs(diff - latency) > tol)
+    return latency, numpy.flatnonzero(bad)
+
+
+def main():
+    from pulses import NSTEPS, make_pulses, pulse_shape
+    parser = argparse.ArgumentParser(
+        description="pre-screen pulses with the dynode timing model")
+    parser.add_argument("--nevents", type=int, default=100000)
+    parser.add_argument("--quiescent", type=int, default=32)
+    parser.add_argument("--thresh-low", type=int, default=64)
+    parser.add_argument("--pulse", default="avg")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    pulses = make_pulses(args.nevents, args.quiescent, seed=args.seed,
+                         avg_pulse=pulse_shape(args.pulse))
+    t0 = time.time()
+    times = event_times(pulses.adcdat, args.quiescent)
+    dt = dt_model(pad_streams(pulses.adcdat, args.quiescent),
+                  args.thresh_low)
+    elapsed = time.time() - t0
+    found = ~numpy.isnan(times)
+    tdiff = pulses.offset[found] / NSTEPS - times[found]
+    print("{} pulses in {:.2f} s ({:.0f}/s)".format(
+        args.nevents, elapsed, args.nevents/elapsed))
+    print("eventdet: {} found, time difference mean {:.4f} rms {:.4f}"
+          .format(found.sum(), tdiff.mean(), tdiff.std()))
+    print("dynode_trigger: {} singles, offset mean {:.2f} rms {:.2f}"
+          .format(dt.found.sum(), dt.offset[dt.found].mean(),
+                  dt.offset[dt.found].std()))
+
+
+if __name__ == "__main__":
+    main()
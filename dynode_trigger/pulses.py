@@ -0,0 +1,72 @@
+"""
+Batched synthesis of test pulses for the dynode_trigger testbench.
+
+All N pulses for a run are generated up front as one (N, 8) array of
+'adcdat' samples, so that the cocotb coroutine only has to index into
+that array while it drives the ADC input.  Using a seeded numpy
+Generator makes a run reproducible from its seed alone.
+"""
+
+import numpy
+
+from types import SimpleNamespace
+
+# Sample pulses from real breast scanner PET detector
+PULSE1 = [1.10969387755102, 31.1466836734694, 122.091836734694, 206.825255102041,
+          228.071428571429, 187.141581632653, 107.823979591837, 31.4553571428571]
+PULSE2 = [1.46811224489796, 30.8405612244898, 119.411989795918, 201.660714285714,
+          222.081632653061, 180.992346938776, 103.591836734694, 29.6441326530612]
+PULSE3 = [1.14158163265306, 26.7321428571429, 108.859693877551, 188.739795918367,
+          211.290816326531, 173.734693877551, 100.732142857143, 30.0420918367347]
+
+PULSES = dict(pulse1=PULSE1, pulse2=PULSE2, pulse3=PULSE3)
+
+NSAMPLES = len(PULSE1)  # ADC samples (10ns clock ticks) per pulse
+NSTEPS = 1000           # interpolation steps per clock tick
+
+
+def average_pulse(names=None):
+    """interpolate the named sample pulses (default: all of them) to
+    NSTEPS per tick, then average them"""
+    if names is None:
+        names = sorted(PULSES)
+    x = numpy.linspace(0, NSAMPLES-1, NSAMPLES*NSTEPS)
+    xp = numpy.linspace(0, NSAMPLES-1, NSAMPLES)
+    interpolated = [numpy.interp(x, xp, PULSES[name]) for name in names]
+    return sum(interpolated) / len(interpolated)
+
+
+def pulse_shape(name="avg"):
+    """interpolated pulse shape: 'avg' or one of the names in PULSES"""
+    if name == "avg":
+        return average_pulse()
+    return average_pulse([name])
+
+
+def make_pulses(nevents, quiescent, seed=None, avg_pulse=None):
+    """generate 'nevents' pulses as 'adcdat' samples, plus their truth
+
+    Each pulse starts at a random fraction 'offset'/NSTEPS of a clock
+    tick (we will not necessarily sample the pulse right at the start
+    every time) and is scaled by a 'gain' factor drawn from a normal
+    distribution.  The returned namespace holds
+
+      adcdat : (nevents, NSAMPLES) uint8, quiescent level added, clipped
+      offset : (nevents,) true start offset, in units of 1/NSTEPS tick
+      gain   : (nevents,) scale factor applied to the average pulse
+      seed   : the seed that reproduces all of the above
+    """
+    if avg_pulse is None:
+        avg_pulse = average_pulse()
+    rng = numpy.random.default_rng(seed)
+    # Figure out the RMS and max of our average pulse
+    rms = 0.1 * numpy.sqrt(numpy.mean(avg_pulse**2))
+    maxpulse = avg_pulse.max()
+    offset = rng.integers(0, NSTEPS, size=nevents)
+    gauss = rng.normal(0, rms, size=nevents) * rng.integers(-1, 2, size=nevents)
+    gain = 1 + gauss/maxpulse
+    # Sample the average pulse once per clock tick, starting at 'offset'
+    idx = offset[:, None] + NSTEPS*numpy.arange(NSAMPLES)[None, :]
+    values = numpy.round(avg_pulse[idx] * gain[:, None]) + quiescent
+    adcdat = numpy.clip(values, 0, 255).astype(numpy.uint8)
+    return SimpleNamespace(adcdat=adcdat, offset=offset, gain=gain, seed=seed)
@@ -0,0 +1,88 @@
+"""
+Columnar capture of per-event results for dynode_trigger timing runs.
+
+One row per event lives in a preallocated numpy structured array.  The
+testbench fills the raw columns in place while the simulation runs;
+the derived columns (wraparound-corrected differences) are then
+computed for all events at once by finish().
+
+Results can be saved either as CrazyRMS.csv text (write_csv) or in a
+compact binary form (save_npz, from tbcommon.results), together with
+the run's metadata.  During a long run, ChunkWriter appends rows to a
+'.part' stream as they are filled, so that a crash does not lose
+everything.  Use load_results() to read back any of the binary forms.
+"""
+
+import numpy
+
+# save_npz and ChunkWriter are re-exported for scan.py and tb.py
+from tbcommon.results import ChunkWriter, load_records, save_npz
+
+TIMCNT_PERIOD = 256  # 'timcnt' is an 8-bit counter
+
+EVENT_DTYPE = numpy.dtype([
+    # filled in by the testbench, once per event
+    ("actual_eventtime", numpy.int32),    # timcnt when pulse was sent
+    ("actual_fraction", numpy.float64),   # true start, fraction of tick
+    ("event_whole_num", numpy.int32),     # DUT whole-number event time
+    ("event_frac", numpy.float64),        # DUT fractional event time
+    ("config", numpy.int16),              # index of run configuration
+    ("model_time", numpy.float64),        # model event time wrt pulse
+    # derived by finish()
+    ("actual_float", numpy.float64),      # true event time, in ticks
+    ("event_float", numpy.float64),       # DUT event time, in ticks
+    ("model_float", numpy.float64),       # model event time, in ticks
+    ("whole_num_diff", numpy.int32),      # |actual - DUT| whole ticks
+    ("time_difference", numpy.float64),   # actual - DUT, in ticks
+])
+
+
+def new_results(nevents):
+    """allocate a zeroed results array with one row per event"""
+    return numpy.zeros(nevents, dtype=EVENT_DTYPE)
+
+
+def wrap(diff, period=TIMCNT_PERIOD):
+    """fold timcnt differences into [-period/2, period/2)"""
+    half = period // 2
+    return (diff + half) % period - half
+
+
+def finish(r):
+    """fill in the derived columns of results array 'r', in place"""
+    r["actual_float"] = r["actual_eventtime"] + r["actual_fraction"]
+    r["event_float"] = r["event_whole_num"] + r["event_frac"]
+    r["model_float"] = r["actual_eventtime"] + r["model_time"]
+    r["whole_num_diff"] = numpy.abs(
+        wrap(r["actual_eventtime"] - r["event_whole_num"]))
+    r["time_difference"] = wrap(r["actual_float"] - r["event_float"])
+    return r
+
+
+def summarize(r):
+    """return (mean, rms about the mean) of the event time difference"""
+    dt = r["time_difference"]
+    return dt.mean(), dt.std()
+
+
+def summarize_configs(r):
+    """list of (config, mean, rms) for each configuration present"""
+    out = []
+    for k in numpy.unique(r["config"]):
+        dt = r["time_difference"][r["config"] == k]
+        out.append((int(k), dt.mean(), dt.std()))
+    return out
+
+
+def write_csv(r, filename="CrazyRMS.csv"):
+    """write actual time, DUT time, and their difference, one row/event"""
+    cols = ("actual_float", "event_float", "time_difference")
+    numpy.savetxt(filename, numpy.column_stack([r[c] for c in cols]),
+                  fmt="%.12g", delimiter=",")
+
+
+def load_results(filename):
+    """return (results array, metadata dict) from save_npz/ChunkWriter"""
+    r, meta = load_records(filename, dtype=EVENT_DTYPE)
+    # the chunks were written before finish() filled in derived columns
+    return finish(r), meta
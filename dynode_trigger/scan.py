@@ -0,0 +1,117 @@
+"""
+Run one dynode_trigger timing-resolution scan as K independent shards.
+
+The event budget is split across K simulator processes, each of which
+runs 'make' (iverilog + cocotb, exactly as run.sh does) in its own
+directory, so that each gets its own sim_build/ and CrazyRMS.npz.
+Shard k uses random seed (seed + k).  When all shards are done, their
+result arrays are merged into one dataset, and the RMS timing
+resolution of the merged dataset is printed.
+
+Shards write no waveform dump (DUMP=off, see the Makefile) unless DUMP
+is set in the environment or in 'extra_env'.
+
+Usage (from this directory):
+
+    python3 scan.py --nevents 100000 --nshards 32 --outdir scan
+"""
+
+import argparse
+import concurrent.futures
+import numpy
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# results.py needs the shared testbench code (see the Makefile)
+sys.path.insert(0, os.path.join(HERE, "..", "python"))
+
+from results import load_results, save_npz, summarize
+
+
+def split_events(nevents, nshards):
+    """divide 'nevents' as evenly as possible among 'nshards'"""
+    n, extra = divmod(nevents, nshards)
+    return [n + (k < extra) for k in range(nshards)]
+
+
+def shard_env(nevents, seed, extra_env=None):
+    """environment for one shard's 'make', mirroring run.sh"""
+    env = dict(os.environ)
+    localbin = os.path.expanduser("~/.local/bin")
+    if os.path.exists(os.path.join(localbin, "cocotb-config")):
+        env["PATH"] = localbin + os.pathsep + env["PATH"]
+    env["COCOTB_REDUCED_LOG_FMT"] = "1"
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env["IVERILOG_DUMPER"] = "lxt2"
+    # A full dump per shard would dominate the run time
+    env.setdefault("DUMP", "off")
+    env["PYTHON_BIN"] = sys.executable
+    # tb.py lives in HERE, but the simulator runs in the shard directory
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (HERE, env.get("PYTHONPATH")) if p)
+    env["RANDOM_SEED"] = str(seed)
+    env["NEVENTS"] = str(nevents)
+    env["DYNODE_OUTPUT"] = "npz"
+    if extra_env:
+        env.update({k: str(v) for k, v in extra_env.items()})
+    return env
+
+
+def run_shard(workdir, nevents, seed, extra_env=None):
+    """run one simulation in 'workdir'; return path of its results"""
+    os.makedirs(workdir, exist_ok=True)
+    # Override the Makefile's 'pwd' so that VERILOG_SOURCES still
+    # point here, while sim_build/ and all outputs land in 'workdir'
+    cmd = ["make", "-f", os.path.join(HERE, "Makefile"), "pwd="+HERE]
+    env = shard_env(nevents, seed, extra_env)
+    with open(os.path.join(workdir, "make.log"), "w") as log:
+        subprocess.run(cmd, cwd=workdir, env=env, stdout=log,
+                       stderr=subprocess.STDOUT, check=True)
+    return os.path.join(workdir, "CrazyRMS.npz")
+
+
+def merge(filenames):
+    """concatenate shard results; return (results, merged metadata)"""
+    parts = [load_results(fn) for fn in filenames]
+    r = numpy.concatenate([p[0] for p in parts])
+    meta = dict(parts[0][1])
+    meta["nevents"] = len(r)
+    meta["seed"] = [p[1]["seed"] for p in parts]
+    return r, meta
+
+
+def run_scan(nevents, nshards, seed=1, outdir="scan", extra_env=None,
+             max_workers=None):
+    """run a sharded scan; return (merged results, metadata)"""
+    outdir = os.path.abspath(outdir)
+    counts = split_events(nevents, nshards)
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as pool:
+        futures = [pool.submit(run_shard,
+                               os.path.join(outdir, "shard{:03d}".format(k)),
+                               n, seed+k, extra_env)
+                   for k, n in enumerate(counts) if n > 0]
+        filenames = [f.result() for f in futures]
+    r, meta = merge(filenames)
+    save_npz(r, os.path.join(outdir, "CrazyRMS.npz"), meta=meta)
+    return r, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--nevents", type=int, default=10000)
+    parser.add_argument("--nshards", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--outdir", default="scan")
+    args = parser.parse_args()
+    r, meta = run_scan(args.nevents, args.nshards, args.seed, args.outdir)
+    mean, rms = summarize(r)
+    print("{} events in {} shards: mean {:.4f} rms {:.4f} ticks".format(
+        len(r), args.nshards, mean, rms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Sweep dynode_trigger operating points on a parallel worker pool.
+
+Each point of the sweep is a dict of parameters (see PARAM_ENV) that
+tb.py reads from the environment: the energy thresholds written to
+registers 0x0e00/0x0e01, the quiescent ADC level, and the pulse shape
+(see pulses.py).  Points can be given as a grid (every combination of
+the listed values) or as an explicit list.
+
+Every point runs in its own directory, named by a hash of its
+parameters (plus event count and seed), under 'outdir'.  A point whose
+CrazyRMS.npz already exists there is not run again.  When all points
+are done, a summary table of timing mean/RMS versus the parameters is
+printed and written to 'outdir'/summary.csv.
+
+With --one-sim, all points instead run back to back in a single
+simulation (tb.py's DYNODE_CONFIGS mode), which avoids paying for
+elaboration and start-up once per point when points are short.
+
+Usage (from this directory):
+
+    python3 sweep.py --thresh-low 32 64 96 --thresh-high 160 192 \\
+                     --quiescent 32 --pulse avg pulse1 --nevents 2000
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+
+from scan import run_shard  # (also puts tbcommon on sys.path)
+from results import load_results, summarize, summarize_configs
+
+# Environment variable through which tb.py receives each parameter
+PARAM_ENV = dict(
+    energy_thresh_low="DYNODE_THRESH_LOW",
+    energy_thresh_high="DYNODE_THRESH_HIGH",
+    adcdat_quiescent="DYNODE_QUIESCENT",
+    pulse="DYNODE_PULSE",
+)
+
+
+def grid(**values):
+    """list of points for every combination of the given value lists"""
+    names = sorted(values)
+    return [dict(zip(names, combo))
+            for combo in itertools.product(*(values[n] for n in names))]
+
+
+def point_hash(point, nevents, seed):
+    """short, stable name for the results of one sweep point"""
+    key = dict(point, nevents=nevents, seed=seed)
+    text = json.dumps(key, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def check_point(point):
+    """raise ValueError if 'point' has a parameter tb.py can't take"""
+    for name in point:
+        if name not in PARAM_ENV:
+            raise ValueError("unknown sweep parameter '{}'".format(name))
+
+
+def run_point(point, nevents, seed, outdir):
+    """run one sweep point unless cached; return its results path"""
+    check_point(point)
+    workdir = os.path.join(outdir, point_hash(point, nevents, seed))
+    filename = os.path.join(workdir, "CrazyRMS.npz")
+    if os.path.exists(filename):
+        return filename
+    extra_env = {PARAM_ENV[name]: value for name, value in point.items()}
+    return run_shard(workdir, nevents, seed, extra_env)
+
+
+def run_sweep(points, nevents, seed=1, outdir="sweep", max_workers=None):
+    """run all 'points'; return a list of summary rows (dicts)"""
+    outdir = os.path.abspath(outdir)
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as pool:
+        futures = [pool.submit(run_point, p, nevents, seed, outdir)
+                   for p in points]
+        filenames = [f.result() for f in futures]
+    rows = []
+    for point, filename in zip(points, filenames):
+        r, meta = load_results(filename)
+        mean, rms = summarize(r)
+        rows.append(dict(point, nevents=len(r), mean=mean, rms=rms))
+    write_summary(rows, os.path.join(outdir, "summary.csv"))
+    return rows
+
+
+def run_sweep_one_sim(points, nevents, seed=1, outdir="sweep"):
+    """run all 'points' in one simulation; return summary rows"""
+    for point in points:
+        check_point(point)
+    outdir = os.path.abspath(outdir)
+    workdir = os.path.join(outdir, "one_sim")
+    os.makedirs(workdir, exist_ok=True)
+    configs = os.path.join(workdir, "configs.json")
+    with open(configs, "w") as f:
+        json.dump(points, f)
+    filename = run_shard(workdir, nevents, seed, {"DYNODE_CONFIGS": configs})
+    r, meta = load_results(filename)
+    rows = []
+    for k, mean, rms in summarize_configs(r):
+        rows.append(dict(points[k], nevents=int((r["config"] == k).sum()),
+                         mean=mean, rms=rms))
+    write_summary(rows, os.path.join(outdir, "summary.csv"))
+    return rows
+
+
+def write_summary(rows, filename):
+    """write summary rows as CSV, one line per sweep point"""
+    names = list(rows[0])
+    with open(filename, "w") as f:
+        f.write(",".join(names) + "\n")
+        for row in rows:
+            f.write(",".join(str(row[n]) for n in names) + "\n")
+
+
+def print_summary(rows):
+    """print summary rows as an aligned table"""
+    names = list(rows[0])
+    cells = [["{:.4f}".format(v) if isinstance(v, float) else str(v)
+              for v in (row[n] for n in names)] for row in rows]
+    widths = [max(len(c) for c in col) for col in zip(names, *cells)]
+    for line in [names] + cells:
+        print("  ".join(c.rjust(w) for c, w in zip(line, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--thresh-low", type=int, nargs="+", default=[64])
+    parser.add_argument("--thresh-high", type=int, nargs="+", default=[192])
+    parser.add_argument("--quiescent", type=int, nargs="+", default=[32])
+    parser.add_argument("--pulse", nargs="+", default=["avg"])
+    parser.add_argument("--nevents", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--outdir", default="sweep")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--one-sim", action="store_true")
+    args = parser.parse_args()
+    points = grid(energy_thresh_low=args.thresh_low,
+                  energy_thresh_high=args.thresh_high,
+                  adcdat_quiescent=args.quiescent,
+                  pulse=args.pulse)
+    if args.one_sim:
+        rows = run_sweep_one_sim(points, args.nevents, args.seed, args.outdir)
+    else:
+        rows = run_sweep(points, args.nevents, args.seed, args.outdir,
+                         args.workers)
+    print_summary(rows)
+
+
+if __name__ == "__main__":
+    main()
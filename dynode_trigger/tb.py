@@ -1,207 +1,96 @@
 import cocotb
-import inspect
+import json
 import os
-import numpy
 import random
 import matplotlib.pyplot
 
 from collections import deque
 from types import SimpleNamespace
 
+from tbcommon import Reg, RegMap, TesterBase
 
-class Tester:
-
-    def __init__(self, dut):
-        self.dut = dut
-        self.verbose = False
-        self.nchecks_ok = 0
-        self.nchecks_failed = 0
-
-    def parse_bin(s):
-        return int(s[:], 2) / 2. ** (len(s))
-
-    def strip0b(s):
-        return s[2:]
-
-    def twos_comp(s):
-        s = s[2:]
-        value = int(s,2) - (1 << len(s))
-        return abs(value)
-
-    def check(self, expr):
-        if expr:
-            self.nchecks_ok += 1
-            return
-        self.nchecks_failed += 1
-        callerframerecord = inspect.stack()[1]
-        frame = callerframerecord[0]
-        info = inspect.getframeinfo(frame)
-        where = "{}:{}:{} :: {}".format(
-            info.function, os.path.basename(info.filename),
-            info.lineno, info.code_context[0].strip())
-        # https://stackoverflow.com/questions/6810999/
-        #   how-to-determine-file-function-and-line-number
-        ns = self.ns()
-        print("CHECKFAIL@{:.0f}:".format(ns), where)
-
-    def ns(self):
-        """return current simulation time in nanoseconds"""
-        return cocotb.utils.get_sim_time(units="ns")
-
-    async def wclk(self, nclk=1, rising=True):
-        """shortcut for await ClockCycles(self.dut.clk, ...)"""
-        await cocotb.triggers.ClockCycles(self.dut.clk, nclk, rising=rising)
-
-    async def wr(self, addr, data, check=None, verbose=None):
-        """write 'addr' := 'data' on register-file bus"""
-        dut = self.dut
-        if verbose is None: verbose = self.verbose
-        await self.wclk()
-        dut.baddr <= addr
-        dut.bwrdata <= data
-        dut.bwr <= 1
-        dut.bstrobe <= 1
-        await self.wclk()
-        dut.baddr <= 0
-        dut.bwrdata <= 0
-        dut.bwr <= 0
-        dut.bstrobe <= 0
-        await self.wclk()
-        if verbose:
-            print("wr {:04x} := {:04x}".format(addr, data))
-        if check is not None:
-            self.check(check.value.integer == data)
+from model import compare, event_times
+from pulses import NSTEPS, make_pulses, pulse_shape
+from results import (ChunkWriter, finish, new_results, save_npz,
+                     summarize, summarize_configs, write_csv)
 
-    async def rd(self, addr, check=None, verbose=None):
-        """read from register-file bus at address 'addr'"""
-        dut = self.dut
-        if verbose is None: verbose = self.verbose
-        await self.wclk()
-        dut.baddr <= addr
-        dut.bwr <= 0
-        dut.bstrobe <= 0
-        await self.wclk()
-        dut.bstrobe <= 1
-        await self.wclk()
-        data = dut.brddata.value.integer
-        dut.bstrobe <= 0
-        dut.baddr <= 0
-        await self.wclk()
-        if verbose:
-            print("rd {:04x} -> {:04x}".format(addr, data))
-        if check is not None:
-            self.check(data == check)
-        return data
-
-    async def send_pulse(self, data):
-        """put list of samples in data[] onto 'adcdat'"""
-        assert type(data) == list
+
+class Tester(TesterBase):
+
+    # Registers on dynode_trigger's register-file 'bus'
+    REGMAP = RegMap([
+        Reg("energy_thresh_low", 0x0e00, 8, q="dt.energy_thresh_low"),
+        Reg("energy_thresh_high", 0x0e01, 8, q="dt.energy_thresh_high"),
+    ])
+
+    async def send_adcdat(self, samples):
+        """put precomputed 'adcdat' samples (e.g. a row of make_pulses)
+        onto 'adcdat', then return to the quiescent level"""
         dut = self.dut
-        for d in data:
+        for d in samples.tolist():
             await self.wclk()
-            d += self.adcdat_quiescent
-            if d < 0: d = 0
-            if d > 255: d = 255
             dut.adcdat <= d
         await self.wclk()
         dut.adcdat <= self.adcdat_quiescent
 
-    async def run_testSD(self):
-
-        f = open("CrazyRMS.csv", "w")
-
+    def operating_point(self, overrides=None):
+        """parameters for one run: environment (see sweep.py) or default,
+        then updated from dict 'overrides'"""
+        env = os.environ
+        cfg = dict(
+            # (what is the quiescent level in real life?)
+            adcdat_quiescent=int(env.get("DYNODE_QUIESCENT", 32)),
+            energy_thresh_low=int(env.get("DYNODE_THRESH_LOW", 64)),
+            energy_thresh_high=int(env.get("DYNODE_THRESH_HIGH", 192)),
+            pulse=env.get("DYNODE_PULSE", "avg"))  # see pulses.py
+        if overrides:
+            cfg.update(overrides)
+        return cfg
+
+    async def configure(self, cfg):
+        """reset the DUT, program operating point 'cfg', let it settle"""
         dut = self.dut
         # From cocotb's perspective, our 'tb' verilog module is the 'dut',
         # even though from our perspective the actual D.U.T. is the
         # 'read_adt7320' module instantiated therein.
         dt = dut.dt
-        self.adcdat_quiescent = 32  # what is this in real life?
-
-        # Sample pulses from real breast scanner PET detector
-        pulse1 = [1.10969387755102, 31.1466836734694, 122.091836734694, 206.825255102041,
-                  228.071428571429, 187.141581632653, 107.823979591837, 31.4553571428571]
-        pulse2 = [1.46811224489796, 30.8405612244898, 119.411989795918, 201.660714285714,
-                  222.081632653061, 180.992346938776, 103.591836734694, 29.6441326530612]
-        pulse3 = [1.14158163265306, 26.7321428571429, 108.859693877551, 188.739795918367,
-                  211.290816326531, 173.734693877551, 100.732142857143, 30.0420918367347]
-
-        # Interpolate data from pulses
-        x = numpy.linspace(0, 7, 8000)
-        xp = numpy.linspace(0, 7, 8)
-
-        interpolatedPulse1 = numpy.interp(x, xp, pulse1)
-        interpolatedPulse2 = numpy.interp(x, xp, pulse2)
-        interpolatedPulse3 = numpy.interp(x, xp, pulse3)
-
-        # Average out interpolated pulses
-        avgPulse = list((interpolatedPulse1 + interpolatedPulse2 + interpolatedPulse3) / 3)
-
+        self.adcdat_quiescent = cfg["adcdat_quiescent"]
 
         # Wait a while, then reset, then wait a while
-        dut.adcdat <= 0
         dut.adcdat <= self.adcdat_quiescent
         await self.wclk(20)
         dut.reset <= 1
         await self.wclk(5)
         dut.reset <= 0
         await self.wclk()
-        await self.wr(0x0e00, 64, check=dt.energy_thresh_low, verbose=True)
-        await self.wr(0x0e01, 192, check=dt.energy_thresh_high, verbose=True)
+        await self.wr_burst(
+            [("energy_thresh_low", cfg["energy_thresh_low"]),
+             ("energy_thresh_high", cfg["energy_thresh_high"])],
+            verbose=True)
         dut.adcdat <= self.adcdat_quiescent
         # speed up settling time for baseline average
         dut.dtr.dynbl.currentvalue <= 0x100 * self.adcdat_quiescent
-
-        # Number of samples to check
-        num_of_samples = 10000
-
-        # Instantiate arrays for plots
-        actual_eventtime = list()
-        calculated_eventtime = list()
-        actual_v_calculated_eventtime_diff = list()
-        actual_fraction = list()
-        calculated_fraction = list()
-        event_whole_num_list = list()
-        event_frac_list = list()
-        event_float_list = list()
-        event_actual_float_list = list()
-        event_time_difference_list = list()
-        event_time = list()
-
-        # Populate a list with N0 in order
-        num_list = list()
-        for i in range(0, num_of_samples):
-            num_list.append(i)
-
-        # Figure out the RMS and max of our data
-        rms = 0.1 * numpy.sqrt(numpy.mean([value ** 2 for value in avgPulse]))
-        maxOfAvgPulse = max(avgPulse)
-
-        # Generate pulses from the interpolated data in the following way:
-        # Figure out an offset that represents the fraction of the clock cycle at which the pulse actually starts
-        #    (we will not necessarily sample the pulse right at the start every time)
-        # Figure out a factor to scale the interpolation by (from a normal distribution)
-        #
-        # Append data relevant for plots to their respective lists
         await self.wclk(500)
-        for i in range(num_of_samples):
-            offset = numpy.random.randint(0, 1000)
-            gaussFactor = numpy.random.normal(0, rms, 1) * numpy.random.randint(-1, 2)
-            sentPulse = []
-            for j in range(0, 8000, 1000):
-                value = int(numpy.round(avgPulse[j + offset] * (1 + (gaussFactor / maxOfAvgPulse))))
-                sentPulse.append(value)
+
+    async def send_events(self, r, pulses, first=0, part=None):
+        """send each pulse in 'pulses' (see pulses.py), filling in rows
+        first, first+1, ... of results array 'r' (see results.py)"""
+        n = len(pulses.adcdat)
+        r["actual_fraction"][first:first+n] = pulses.offset / NSTEPS
+        # What the DUT should find, according to the model (model.py)
+        r["model_time"][first:first+n] = event_times(
+            pulses.adcdat, self.adcdat_quiescent)
+        for i in range(n):
+            row = r[first+i]
 
             # Find the actual clock tick at which we notice the pulse
-            current_actual_eventtime = int(str(dut.timcnt), 2)
-            actual_eventtime.append(current_actual_eventtime)
+            row["actual_eventtime"] = self.rdint("timcnt")
             
             # Send the pulse
-            await self.send_pulse(sentPulse)
+            await self.send_adcdat(pulses.adcdat[i])
             await self.wclk(3)
             await self.wclk(100)
 
-            actual_fraction.append((offset) / 1000) 
-
             ## THIS IS IMPORTANT: PUT THIS IN VERILOG!!!!!!
             """if sd_timAdjusted_int <= 0.19:
                 current_calculated_fraction = - sd_timAdjusted_int + 0.19
@@ -220,78 +109,130 @@ class Tester:
 
             # Take the 12 most significant bits which represent the whole number part
             #    and turn them into the corresponding int
-            event_whole_thing = int(str(dut.event_whole_num), 2)
-            event_whole_num_list.append(int(str(dut.event_whole_num), 2))
-            
-            event_frac_str = str(dut.event_frac)
-            event_frac_int = Tester.parse_bin(event_frac_str)
-            event_frac_list.append(event_frac_int)
-            
-            event_actual_float_list.append(current_actual_eventtime + ((offset) / 1000))
-
-            # Append the current difference in the tick at which we noticed the pulse
-            #    and the tick at which we sent the pulse
-            # Accounts for overflow
-            current_difference = abs(current_actual_eventtime - event_whole_thing)
-            if current_difference > 100:
-                actual_v_calculated_eventtime_diff.append(abs(current_difference - 256))
-            else:
-                actual_v_calculated_eventtime_diff.append(current_difference)
-
-        # Populate a list with the true form of the actual event time        
-        """for k in range(num_of_samples):
-            event_time.append(calculated_eventtime[k] + calculated_fraction[k])"""
-            
-        # Populate a list with the true form of the calculated event time
-        for k in range(num_of_samples):
-            event_float_list.append(event_whole_num_list[k] + event_frac_list[k])
-            
-        # Populate a list with the time difference between the
-        #    (true form) actual event time and calculated event time
-        # Accounts for overflow
-        for k in range(num_of_samples):
-            time_difference = event_actual_float_list[k] - event_float_list[k]
-            f.write(str(event_actual_float_list[k]) + "," + str(event_float_list[k]) + ",")
-            if abs(time_difference) > 100:
-                event_time_difference_list.append(time_difference - 256)
-                f.write(str(time_difference - 256) + "\n")
-            else:
-                event_time_difference_list.append(time_difference)
-                f.write(str(time_difference) + "\n")
-
-        f.close()
+            row["event_whole_num"] = self.rdint("event_whole_num")
+            row["event_frac"] = self.rdfrac("event_frac")
+            if part is not None:
+                part.update(first+i+1)
+
+    def save_results(self, r, meta, part=None):
+        """finish, save, and plot results array 'r'"""
+        # Compute the true and calculated event times and their
+        # differences (accounting for timcnt overflow) for all events
+        # at once, then save them
+        finish(r)
+        self.compare_model(r)
+        if part is not None:
+            save_npz(r, "CrazyRMS.npz", meta=meta)
+            part.close(remove=True)
+        else:
+            write_csv(r, "CrazyRMS.csv")
 
         # Plot data
-        if (len(actual_eventtime) == num_of_samples):
-
-            matplotlib.pyplot.scatter(actual_fraction, event_frac_list, s=5)
-            matplotlib.pyplot.xlabel("Actual Event Time Fraction")
-            matplotlib.pyplot.ylabel("Calculated Event Time Fraction")
-            matplotlib.pyplot.savefig("SD_ActualFractionvsCalculatedFraction(tickVtick).pdf")
-            matplotlib.pyplot.clf()
-
-            matplotlib.pyplot.scatter(actual_fraction, actual_v_calculated_eventtime_diff, s=4)
-            matplotlib.pyplot.xlabel("Calculated Event Time Fraction")
-            matplotlib.pyplot.ylabel("Whole Num Diff")
-            matplotlib.pyplot.savefig("ActualFractionVsWholeNumDiff.pdf")
-            matplotlib.pyplot.clf()
+        matplotlib.pyplot.scatter(r["actual_fraction"], r["event_frac"], s=5)
+        matplotlib.pyplot.xlabel("Actual Event Time Fraction")
+        matplotlib.pyplot.ylabel("Calculated Event Time Fraction")
+        matplotlib.pyplot.savefig("SD_ActualFractionvsCalculatedFraction(tickVtick).pdf")
+        matplotlib.pyplot.clf()
+
+        matplotlib.pyplot.scatter(r["actual_fraction"], r["whole_num_diff"], s=4)
+        matplotlib.pyplot.xlabel("Calculated Event Time Fraction")
+        matplotlib.pyplot.ylabel("Whole Num Diff")
+        matplotlib.pyplot.savefig("ActualFractionVsWholeNumDiff.pdf")
+        matplotlib.pyplot.clf()
+
+    def compare_model(self, r):
+        """compare DUT event times with the model, event by event"""
+        latency, bad = compare(r["event_float"], r["model_float"])
+        print("model: latency {:.4f} ticks, {} of {} events disagree".format(
+            latency, len(bad), len(r)))
+        for i in bad[:10]:
+            print("  event {} : dut {:.4f} model {:.4f}".format(
+                i, r["event_float"][i], r["model_float"][i]))
+        if os.environ.get("DYNODE_MODEL_CHECK"):
+            self.check(len(bad) == 0)
+
+    def alloc_results(self, nevents, meta):
+        """preallocate results, plus a ChunkWriter if output is binary"""
+        r = new_results(nevents)
+        part = None
+        # Write results as CrazyRMS.csv text ("csv") or as compact
+        # CrazyRMS.npz binary ("npz"); see results.py
+        if os.environ.get("DYNODE_OUTPUT", "csv") == "npz":
+            # Save completed rows as we go, in case the run dies
+            part = ChunkWriter(r, "CrazyRMS.part", meta=meta)
+        return r, part
 
-        # Calculate rms, shift histogram by mean of data, produce new histogram
-        mean_time_difference = numpy.mean(event_time_difference_list)
-        event_time_difference_mean = [(value - mean_time_difference) for value in event_time_difference_list]
-        rms_time_difference = numpy.sqrt(numpy.mean([value ** 2 for value in event_time_difference_mean]))
+    async def run_testSD(self):
+        """timing resolution for one operating point"""
+        cfg = self.operating_point()
+
+        # Number of samples to check (scan.py sets NEVENTS per shard)
+        num_of_samples = int(os.environ.get("NEVENTS", 10000))
+
+        # Preallocate one row per event for the results (see results.py)
+        meta = dict(cfg, seed=cocotb.RANDOM_SEED, nevents=num_of_samples)
+        r, part = self.alloc_results(num_of_samples, meta)
+
+        # Generate all of the test pulses up front (see pulses.py):
+        # each pulse starts at a random fraction of the clock cycle
+        # (we will not necessarily sample the pulse right at the start
+        # every time) and is scaled by a normally distributed factor.
+        pulses = make_pulses(num_of_samples, cfg["adcdat_quiescent"],
+                             seed=cocotb.RANDOM_SEED,
+                             avg_pulse=pulse_shape(cfg["pulse"]))
+        await self.configure(cfg)
+        await self.send_events(r, pulses, part=part)
+        self.save_results(r, meta, part)
+
+        # Calculate rms of time difference about its mean
+        mean_time_difference, rms_time_difference = summarize(r)
 
         print(rms_time_difference)
 
-        print("checks: {} ok, {} failed".format(
-            self.nchecks_ok, self.nchecks_failed))
-        if self.nchecks_failed:
-            raise cocotb.result.TestFailure(
-                "failed {} checks".format(self.nchecks_failed))
-
-
-@cocotb.test()
+        self.report_checks()
+
+    async def run_testSD_configs(self, configs):
+        """timing resolution for several operating points in turn
+
+        Each dict in 'configs' overrides some of the parameters of
+        operating_point().  Between configurations the DUT is reset,
+        reprogrammed, and its baseline re-seeded, so that all of them
+        share one simulator process.  Each event's 'config' column is
+        the index of its configuration in 'configs'.
+        """
+        configs = [self.operating_point(c) for c in configs]
+        # Number of samples to check, per configuration
+        nper = int(os.environ.get("NEVENTS", 10000))
+        # Pulses for configuration k use seed [RANDOM_SEED, k]
+        meta = dict(configs=configs, seed=cocotb.RANDOM_SEED,
+                    nevents=nper*len(configs))
+        r, part = self.alloc_results(nper*len(configs), meta)
+        for k, cfg in enumerate(configs):
+            pulses = make_pulses(nper, cfg["adcdat_quiescent"],
+                                 seed=[cocotb.RANDOM_SEED, k],
+                                 avg_pulse=pulse_shape(cfg["pulse"]))
+            r["config"][k*nper:(k+1)*nper] = k
+            await self.configure(cfg)
+            await self.send_events(r, pulses, first=k*nper, part=part)
+        self.save_results(r, meta, part)
+
+        for k, mean, rms in summarize_configs(r):
+            print("config {} {} : rms {}".format(k, configs[k], rms))
+
+        self.report_checks()
+
+
+@cocotb.test(skip="DYNODE_CONFIGS" in os.environ)
 async def tests(dut):
     """instantiate Tester class then run its test(s)"""
     tester = Tester(dut)
     await tester.run_testSD()
+
+
+@cocotb.test(skip="DYNODE_CONFIGS" not in os.environ)
+async def tests_configs(dut):
+    """run every configuration listed in JSON file $DYNODE_CONFIGS"""
+    with open(os.environ["DYNODE_CONFIGS"]) as f:
+        configs = json.load(f)
+    tester = Tester(dut)
+    await tester.run_testSD_configs(configs)
@@ -0,0 +1,20 @@
+"""
+Code shared by the cocotb testbenches in this repository.
+
+Each bench's Makefile puts this directory's parent on PYTHONPATH, so
+that its tb.py can simply 'import tbcommon'.  Each bench's Tester class
+derives from TesterBase, which holds the check engine (check.py), the
+clock helpers and register-file bus driver (tester.py); results.py
+saves and streams per-event result arrays, regmap.py describes the
+registers on the bus, counters.py polls counter registers on it in the
+background, scoreboard.py matches responses to requests by
+timestamp, and dump.py turns the waveform dump on and off.
+"""
+
+from .check import Checker
+from .counters import CounterMonitor
+from .dump import DumpControl
+from .regmap import Reg, RegMap
+from .results import ChunkWriter, load_records, save_npz
+from .scoreboard import Scoreboard
+from .tester import TesterBase
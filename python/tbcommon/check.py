@@ -0,0 +1,95 @@
+"""
+Cheap bookkeeping for testbench checks.
+
+A passing check just increments a counter.  A failing check records
+only (simulation time, site) in a bounded ring buffer, bumps a
+per-site counter, and notes the time of the site's first failure; the
+site is a (code object, line number) pair, and file names, function
+names, and source text are looked up only when a failure is printed
+or when report() is called.  Only the first few failures at each site
+are printed as they happen, so that a storm of failures (e.g. a bad
+link failing thousands of checks per microsecond) does not swamp the
+log or slow down the simulation; report() lists the most recent
+failures, in order, to show when and where such a storm ended.
+"""
+
+import cocotb
+import linecache
+import os
+import sys
+
+from collections import Counter, deque
+
+
+class Checker:
+
+    def __init__(self, maxkeep=1000, maxprint=10):
+        self.nchecks_ok = 0
+        self.nchecks_failed = 0
+        self.maxprint = maxprint  # failures printed per site
+        self.failures = deque(maxlen=maxkeep)  # most recent failures
+        self.sites = Counter()  # number of failures per site
+        self.first = {}  # sim time of first failure per site
+        # Called with the sim time of each failure (e.g. to trigger a
+        # waveform dump, see dump.py)
+        self.listeners = []
+
+    def check(self, expr, depth=1, site=None, detail=None):
+        """count 'expr' as a passed or failed check; the failure site
+        is the caller 'depth' frames up, unless 'site' names it (e.g.
+        for a helper reached from several places in a bench); 'detail'
+        is printed after the site, but does not tell sites apart"""
+        if expr:
+            self.nchecks_ok += 1
+            return True
+        self.nchecks_failed += 1
+        if site is None:
+            frame = sys._getframe(depth)
+            site = (frame.f_code, frame.f_lineno)
+        steps = cocotb.utils.get_sim_time()
+        self.failures.append((steps, site))
+        self.sites[site] += 1
+        if site not in self.first:
+            self.first[site] = steps
+        for listener in self.listeners:
+            listener(steps)
+        if self.sites[site] <= self.maxprint:
+            where = self.where(site)
+            if detail:
+                where = "{} {}".format(where, detail)
+            print("CHECKFAIL@{:.0f}:".format(self.ns(steps)), where)
+            if self.sites[site] == self.maxprint:
+                print("(further failures at this site are only counted)")
+        return False
+
+    @staticmethod
+    def ns(steps):
+        """convert simulator time steps to nanoseconds"""
+        return cocotb.utils.get_time_from_sim_steps(steps, units="ns")
+
+    @staticmethod
+    def where(site):
+        """describe a failure site as function:file:line :: source"""
+        if isinstance(site, str):
+            return site
+        code, lineno = site
+        source = linecache.getline(code.co_filename, lineno).strip()
+        return "{}:{}:{} :: {}".format(
+            code.co_name, os.path.basename(code.co_filename), lineno, source)
+
+    def report(self, nlast=20):
+        """print check counts, a table of failures per site, and the
+        last 'nlast' failures"""
+        print("checks: {} ok, {} failed".format(
+            self.nchecks_ok, self.nchecks_failed))
+        if not self.sites:
+            return
+        print("{:>8} {:>12}  site".format("nfail", "first@ns"))
+        for site, n in self.sites.most_common():
+            print("{:>8} {:>12.0f}  {}".format(
+                n, self.ns(self.first[site]), self.where(site)))
+        last = list(self.failures)[-nlast:]
+        print("last {} failures:".format(len(last)))
+        print("{:>12}  site".format("@ns"))
+        for steps, site in last:
+            print("{:>12.0f}  {}".format(self.ns(steps), self.where(site)))
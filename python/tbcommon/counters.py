@@ -0,0 +1,97 @@
+"""
+Background polling of free-running counter registers on the bus.
+
+A CounterMonitor reads a set of counter registers (e.g. mcu_logic's
+'badidle_*' link-error counters) in one rd_burst every 'period'
+clocks, and sleeps in between, so that it costs the simulation one
+bus burst per period rather than any Python work per clock.  From
+successive polls it works out how much each counter advanced, allowing
+for wraparound of the 'width'-bit registers, and keeps running totals,
+rates in Hz, and a time series of (time, increments) that can be saved
+with save_npz().
+
+A counter that advances by at most one per clock cannot wrap more than
+once between polls as long as 'period' is less than 2**width clocks.
+"""
+
+import numpy
+
+from .results import save_npz
+
+
+class CounterMonitor:
+
+    def __init__(self, tester, regs, period, width=16, clk_ns=10,
+                 name="counters"):
+        self.tester = tester
+        self.regs = list(regs)  # register names or addresses
+        self.names = [str(r) for r in self.regs]
+        self.period = period  # clocks between polls
+        self.mask = (1 << width) - 1
+        self.clk_ns = clk_ns
+        self.name = name
+        if period >= 1 << width:
+            print("{} : warning: period {} may hide wraparound".format(
+                name, period))
+        self.last = None  # counter values at the last poll
+        self.t_last = None  # simulation time (ns) of the last poll
+        self.t_first = None
+        self.totals = numpy.zeros(len(self.regs), dtype=numpy.int64)
+        self.series = []  # (time in ns, increments) per poll
+
+    async def poll(self):
+        """read all counters in one burst and update totals and series"""
+        t = self.tester
+        values = await t.rd_burst(self.regs, check=False, verbose=False,
+                                  hw=True)
+        now = t.ns()
+        if self.last is None:
+            self.t_first = now
+        else:
+            delta = [(v - p) & self.mask for v, p in zip(values, self.last)]
+            self.totals += delta
+            self.series.append((now, delta))
+        self.last = values
+        self.t_last = now
+        return values
+
+    async def run(self):
+        """poll every 'period' clocks, forever"""
+        while True:
+            await self.poll()
+            await self.tester.wclk(self.period)
+
+    def rates(self):
+        """average rate (Hz) of each counter since the first poll"""
+        if self.t_first is None or self.t_last == self.t_first:
+            return numpy.zeros(len(self.regs))
+        return self.totals / ((self.t_last - self.t_first) * 1e-9)
+
+    def records(self):
+        """the time series as a structured array, one row per poll
+        after the first, with each counter's increment and rate"""
+        dtype = [("t_ns", numpy.float64)]
+        for name in self.names:
+            dtype += [(name, numpy.int64), (name+"_hz", numpy.float64)]
+        r = numpy.zeros(len(self.series), dtype=dtype)
+        t_prev = self.t_first
+        for i, (now, delta) in enumerate(self.series):
+            r["t_ns"][i] = now
+            for name, d in zip(self.names, delta):
+                r[name][i] = d
+                r[name+"_hz"][i] = d / ((now - t_prev) * 1e-9)
+            t_prev = now
+        return r
+
+    def save(self, filename, meta=None):
+        """save the time series (see records) with save_npz"""
+        meta = dict(meta or {}, period=self.period, counters=self.names)
+        save_npz(self.records(), filename, meta=meta)
+
+    def report(self):
+        """print totals and average rates"""
+        print("{} : {} polls every {} clocks".format(
+            self.name, len(self.series) + (self.last is not None),
+            self.period))
+        for name, n, hz in zip(self.names, self.totals, self.rates()):
+            print("{:>14} {:10d} {:12.4g} Hz".format(name, n, hz))
@@ -0,0 +1,175 @@
+"""
+Waveform dump control: pay for dump I/O only where it will be looked at.
+
+Each bench's tb.v dumps with $dumpvars as before, but turns dumping on
+and off ($dumpon, $dumpoff) as its 'dump_on' reg changes, so that a
+DumpControl can open and close the dump from Python.  What is dumped
+and when is chosen at run time:
+
+  DUMP=all      (default) whole run, as before
+  DUMP=off      nothing; the Makefile also sets IVERILOG_DUMPER=none
+  DUMP=window   only between the times (ns) in DUMP_WINDOW, e.g.
+                DUMP_WINDOW=100000:200000,5e6:5.1e6
+  DUMP=trigger  around failing checks: from each failure until
+                DUMP_POST ns (default 1000) after it; and, for a rerun
+                of the same (deterministic) simulation, from DUMP_PRE
+                ns (default 1000) before to DUMP_POST ns after each
+                time listed in the file DUMP_TRIGGERS
+
+A dump cannot be written for time that has already passed, so capture
+before a failure needs a second run: set DUMP_TRIGGERS_OUT to have
+report_checks() save the failure times of the first one.
+
+DUMP_DEPTH=n (a +dumpdepth plusarg, see the Makefiles) limits the dump
+to signals within n levels of 'tb': DUMP_DEPTH=1 gives only tb.v's own
+signals, i.e. the DUT's ports.  DUMP_SCOPE="s1 s2 ..." (one +dumpscope
+plusarg each) dumps only the named scopes, e.g. DUMP_SCOPE="ml.coinc"
+in cocotb/ or DUMP_SCOPE="tb dt" in dynode_trigger/, each to DUMP_DEPTH
+levels.  $dumpvars needs its scopes at compile time, so each tb.v lists
+the instances that can be chosen; "tb" means tb.v's own signals.
+
+Each window costs one Timer wakeup at each end, and a failing check in
+trigger mode one more; nothing is done per clock.
+"""
+
+import cocotb
+import os
+
+from cocotb.triggers import Event, Timer
+
+MODES = ("all", "off", "window", "trigger")
+
+
+def parse_windows(text):
+    """[(t0, t1), ...] in ns from 't0:t1,t0:t1,...'"""
+    windows = []
+    for part in text.replace(" ", "").split(","):
+        if part:
+            t0, t1 = part.split(":")
+            windows.append((float(t0), float(t1)))
+    return windows
+
+
+def merge_windows(windows):
+    """sort 'windows' and merge those that overlap"""
+    merged = []
+    for t0, t1 in sorted(windows):
+        if merged and t0 <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], t1))
+        else:
+            merged.append((t0, t1))
+    return merged
+
+
+class DumpControl:
+
+    def __init__(self, tester, mode=None):
+        env = os.environ
+        self.tester = tester
+        self.mode = mode or env.get("DUMP", "all")
+        if self.mode not in MODES:
+            raise ValueError("DUMP={} is not one of {}".format(
+                self.mode, ", ".join(MODES)))
+        self.pre = float(env.get("DUMP_PRE", 1000))
+        self.post = float(env.get("DUMP_POST", 1000))
+        self.windows = []  # (t0, t1) in ns
+        if self.mode == "window":
+            self.windows = parse_windows(env.get("DUMP_WINDOW", ""))
+        if self.mode == "trigger" and env.get("DUMP_TRIGGERS"):
+            self.windows = [(t - self.pre, t + self.post)
+                            for t in self.load_triggers(env["DUMP_TRIGGERS"])]
+        self.windows = merge_windows(self.windows)
+        self.triggers = []  # times (ns) of failing checks
+        self.until = None  # end of the current post-trigger capture
+        self.event = Event("dump trigger")
+        self.state = None  # dump_on, as last set
+        self.ndumped = 0.0  # ns of simulation dumped, for report()
+
+    def set(self, on):
+        """turn dumping on or off now"""
+        if on != self.state:
+            self.tester.dut.dump_on <= int(on)
+            self.state = on
+
+    async def sleep_until(self, t_ns):
+        """wait until simulation time 't_ns' (if still to come)"""
+        dt = round(t_ns - self.tester.ns())
+        if dt > 0:
+            await Timer(dt, units="ns")
+
+    def in_window(self, now):
+        return any(t0 <= now < t1 for t0, t1 in self.windows)
+
+    async def run(self):
+        """open and close the dump at each window; in trigger mode,
+        also close each post-trigger capture"""
+        t = self.tester
+        if self.mode in ("all", "off"):
+            return
+        # The Makefile's +dumpoff should already have done this
+        self.set(False)
+        if self.mode == "trigger":
+            cocotb.fork(self.run_triggers())
+        for t0, t1 in self.windows:
+            if t1 <= t.ns():
+                continue
+            await self.sleep_until(t0)
+            start = t.ns()
+            self.set(True)
+            await self.sleep_until(t1)
+            self.ndumped += t.ns() - start
+            if self.until is None:
+                self.set(False)
+
+    async def run_triggers(self):
+        """close the dump DUMP_POST ns after the last failing check"""
+        t = self.tester
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            start = t.ns()
+            # A later failure may push 'until' back while we sleep
+            while self.until > t.ns():
+                await self.sleep_until(self.until)
+            self.ndumped += t.ns() - start
+            self.until = None
+            self.event.clear()  # set again by failures since woken
+            if not self.in_window(t.ns()):
+                self.set(False)
+
+    def trigger(self, now=None):
+        """capture from now until DUMP_POST ns from now"""
+        if now is None:
+            now = self.tester.ns()
+        self.set(True)
+        self.until = max(self.until or 0, now + self.post)
+        self.event.set()
+
+    def on_fail(self, steps):
+        """Checker listener: record the time of each failing check,
+        and in trigger mode capture from it"""
+        now = cocotb.utils.get_time_from_sim_steps(steps, units="ns")
+        # A storm of failures counts as one trigger per DUMP_POST ns
+        if not self.triggers or now >= self.triggers[-1] + self.post:
+            self.triggers.append(now)
+        if self.mode == "trigger":
+            self.trigger(now)
+
+    @staticmethod
+    def load_triggers(filename):
+        """failure times (ns) saved by save_triggers"""
+        with open(filename) as f:
+            return [float(w) for w in f.read().split()]
+
+    def save_triggers(self, filename):
+        """write the failure times seen so far, one per line (ns)"""
+        with open(filename, "w") as f:
+            for now in self.triggers:
+                f.write("{:.0f}\n".format(now))
+
+    def report(self):
+        """print how much of the run was dumped"""
+        if self.mode in ("all", "off"):
+            return
+        print("dump ({}) : {:.0f} ns dumped of {:.0f} ns, {} triggers".format(
+            self.mode, self.ndumped, self.tester.ns(), len(self.triggers)))
@@ -0,0 +1,56 @@
+"""
+Register-file 'bus' maps, so that bus transactions can check themselves.
+
+Each bench describes the registers that its design puts on the bus
+(see breg/bror in mcu_logic.v, bregpl/brorpl in dynode_trigger) as a
+RegMap of Reg entries, and assigns it to its Tester's REGMAP.  Then
+TesterBase.wr() and wr_burst() know which DUT signal should hold each
+written value, and rd() and rd_burst() know what each read should
+return, without a 'check=' argument at every call.  The same map says
+which registers TesterBase may serve from its shadow register file:
+read/write registers once written or read, and read-only registers
+with fixed contents, but never read-only registers that change.
+"""
+
+
+class Reg:
+
+    def __init__(self, name, addr, width=16, q=None, value=None,
+                 ro=False):
+        self.name = name
+        self.addr = addr
+        self.width = width
+        self.mask = (1 << width) - 1
+        # Dotted name (within dut) of the signal holding the contents
+        # of a read/write register, e.g. "ml.diffmax"
+        self.q = q
+        # Read-only ('bror') register; its fixed contents, if it has
+        # any (a counter, e.g., does not)
+        self.ro = ro
+        self.value = value
+
+    def __repr__(self):
+        return "Reg({!r}, 0x{:04x})".format(self.name, self.addr)
+
+
+class RegMap:
+
+    def __init__(self, regs):
+        self.regs = list(regs)
+        self.by_addr = {r.addr: r for r in self.regs}
+        self.by_name = {r.name: r for r in self.regs}
+
+    def __iter__(self):
+        return iter(self.regs)
+
+    def get(self, key):
+        """Reg for address or name 'key', or None if not in the map"""
+        if isinstance(key, str):
+            return self.by_name.get(key)
+        return self.by_addr.get(key)
+
+    def addr(self, key):
+        """bus address of address or register name 'key'"""
+        if isinstance(key, str):
+            return self.by_name[key].addr
+        return key
@@ -0,0 +1,79 @@
+"""
+Saving and streaming testbench results held in numpy structured arrays.
+
+A bench preallocates one row per event (or transaction, or sample) and
+fills it in place while the simulation runs.  save_npz() writes the
+whole array, plus a dict of run metadata, in compact binary form.
+During a long run, ChunkWriter appends rows to a '.part' stream as they
+are filled, so that a crash does not lose everything.  load_records()
+reads back either form.
+"""
+
+import json
+import numpy
+import os
+
+
+def save_npz(r, filename, meta=None):
+    """save results array 'r' and dict 'meta' of run metadata"""
+    meta = {} if meta is None else meta
+    numpy.savez(filename, events=r, meta=numpy.array(json.dumps(meta)))
+
+
+class ChunkWriter:
+    """append rows of a results array to a file as the run progresses
+
+    The file is a sequence of .npy records: first the metadata (as a
+    JSON string), then one record per chunk.  Every record is flushed
+    to disk as soon as it is written, so all complete chunks survive a
+    crash of the simulator.
+    """
+
+    def __init__(self, r, filename, meta=None, chunk=1000):
+        self.r = r
+        self.filename = filename
+        self.chunk = chunk
+        self.nwritten = 0
+        self.f = open(filename, "wb")
+        meta = {} if meta is None else meta
+        numpy.save(self.f, numpy.array(json.dumps(meta)))
+        self.f.flush()
+
+    def update(self, nfilled):
+        """write out whole chunks among the first 'nfilled' rows"""
+        while nfilled - self.nwritten >= self.chunk:
+            self.write(self.nwritten + self.chunk)
+
+    def write(self, end):
+        """write out rows [nwritten, end)"""
+        if end > self.nwritten:
+            numpy.save(self.f, self.r[self.nwritten:end])
+            self.f.flush()
+            self.nwritten = end
+
+    def close(self, remove=False):
+        """write out any remaining rows, then close (and maybe delete)"""
+        self.write(len(self.r))
+        self.f.close()
+        if remove:
+            os.remove(self.filename)
+
+
+def load_records(filename, dtype=None):
+    """return (results array, metadata dict) from save_npz/ChunkWriter;
+    'dtype' is used for the empty array if a stream has no chunks"""
+    if filename.endswith(".npz"):
+        with numpy.load(filename) as z:
+            return z["events"], json.loads(z["meta"][()])
+    chunks = []
+    with open(filename, "rb") as f:
+        meta = json.loads(numpy.load(f)[()])
+        while True:
+            try:
+                chunks.append(numpy.load(f))
+            except (EOFError, ValueError):
+                # end of file, or a chunk truncated by a crash
+                break
+    if chunks:
+        return numpy.concatenate(chunks), meta
+    return numpy.zeros(0, dtype=dtype), meta
@@ -0,0 +1,119 @@
+"""
+Streaming scoreboard: match responses to requests by timestamp.
+
+A bench calls expect(t) for each request it sends (e.g. a single
+trigger on clock t) and observe(t, accept) for each response it sees
+(e.g. PCOIN or NCOIN on clock t).  A response matches the oldest
+outstanding request if it arrived 'latency' clocks later, give or take
+'window' clocks.  A request left unanswered past that point is
+'missing'; a response matching no request is 'unexpected'.  lose(t)
+writes off the requests whose response would be due on clock t, e.g.
+while the MCU sends a special word instead.
+
+Outstanding request times are kept in a ring buffer of integers, so
+the cost per call does not depend on the latency, which can be as long
+as the hardware needs.  Successes are only counted (accept and reject
+counts, and a histogram of measured latencies); failures are also
+counted, and the first few printed, by the bench's Checker, under one
+site per scoreboard and kind of failure.
+"""
+
+from collections import Counter
+
+
+class Scoreboard:
+
+    def __init__(self, checker, name, latency, window=0, size=64):
+        self.checker = checker
+        self.name = name
+        self.latency = latency
+        self.window = window
+        # Ring buffer of request times; 'size' is always a power of 2
+        size = 1 << max(size-1, 1).bit_length()
+        self.ring = size*[0]
+        self.mask = size - 1
+        self.head = 0  # index of oldest outstanding request
+        self.tail = 0  # index at which to store the next request
+        self.naccept = 0
+        self.nreject = 0
+        self.nmasked = 0
+        self.nfail = Counter()  # failures per kind
+        self.latencies = Counter()  # histogram of matched latencies
+
+    def __len__(self):
+        """number of outstanding requests"""
+        return self.tail - self.head
+
+    def expect(self, t):
+        """record a request sent on clock 't'"""
+        if self.tail - self.head > self.mask:
+            self.grow()
+        self.ring[self.tail & self.mask] = t
+        self.tail += 1
+
+    def grow(self):
+        """double the size of the ring buffer, keeping its contents"""
+        ring, mask = self.ring, self.mask
+        self.ring = [ring[i & mask] for i in range(self.head, self.tail)]
+        self.ring += len(self.ring)*[0]
+        self.mask = len(self.ring) - 1
+        self.tail -= self.head
+        self.head = 0
+
+    def expire(self, t):
+        """fail outstanding requests that can no longer be answered by
+        a response on clock 't' or later"""
+        late = t - self.latency - self.window
+        ring, mask = self.ring, self.mask
+        while self.head < self.tail and ring[self.head & mask] < late:
+            self.fail("missing", t, ring[self.head & mask])
+            self.head += 1
+
+    def observe(self, t, accept):
+        """record a response seen on clock 't': accept (True) or
+        reject (False)"""
+        self.expire(t)
+        t0 = self.ring[self.head & self.mask] if len(self) else None
+        if t0 is None or t - t0 < self.latency - self.window:
+            # Too early even for the oldest outstanding request
+            self.fail("unexpected", t)
+            return False
+        dt = t - t0
+        self.head += 1
+        self.latencies[dt] += 1
+        if accept:
+            self.naccept += 1
+        else:
+            self.nreject += 1
+        self.checker.check(True)
+        return True
+
+    def lose(self, t):
+        """write off requests whose response is due on clock 't'"""
+        self.expire(t)
+        due = t - self.latency
+        ring, mask = self.ring, self.mask
+        while self.head < self.tail and ring[self.head & mask] <= due:
+            self.nmasked += 1
+            self.head += 1
+
+    def fail(self, kind, t, t0=None):
+        """count a failure of type 'kind' on clock 't', for the request
+        sent on clock 't0'; the Checker prints the first few"""
+        self.nfail[kind] += 1
+        # One site per kind, however the bench got here (observe,
+        # expire, or lose)
+        self.checker.check(
+            False, site="{} : {} response".format(self.name, kind),
+            detail="@clk {}{}".format(
+                t, "" if t0 is None else " (request @clk {})".format(t0)))
+
+    def report(self):
+        """print counts and the latency histogram"""
+        print("{} : {} accept, {} reject, {} masked, {} outstanding".format(
+            self.name, self.naccept, self.nreject, self.nmasked, len(self)))
+        if self.nfail:
+            print("{} : failures {}".format(self.name, dict(self.nfail)))
+        if self.latencies:
+            print("{} : latency histogram {}".format(
+                self.name, dict(sorted(self.latencies.items()))))
@@ -0,0 +1,269 @@
+"""
+Base class for the 'Tester' class in each bench's tb.py.
+
+This holds what every bench used to copy and paste: the check engine
+(see check.py), waveform dump control (dump.py), simulation time and
+clock helpers, the register-file 'bus' driver (wr, rd, and their burst
+forms, checked against each bench's REGMAP and served from a shadow
+register file where possible; see regmap.py), and cached signal
+decoding.  Making bench-side operations faster here makes them faster
+in every bench at once.
+"""
+
+import cocotb
+import os
+
+from cocotb.triggers import ClockCycles, FallingEdge, Lock, RisingEdge
+
+from .check import Checker
+from .dump import DumpControl
+
+
+class TesterBase:
+
+    # Register map of the design on the register-file bus (see regmap.py)
+    REGMAP = None
+
+    def __init__(self, dut):
+        self.dut = dut
+        self.verbose = False
+        self.checker = Checker()
+        self.handles = {}  # cache for handle()
+        self.lsbs = {}  # cache for rdfrac()
+        # Held for each burst, so that background monitors (e.g.
+        # CounterMonitor) can share the bus with the test itself
+        self.bus_lock = Lock("bus")
+        # Shadow register file: address -> last value written to (or
+        # read from) each read/write register in REGMAP
+        self.shadow = {}
+        # Scrub (see scrub) after this many reads served from the
+        # shadow; 0 means only when the bench calls scrub() itself
+        self.scrub_interval = int(os.environ.get("BUS_SCRUB", 0))
+        self.nshadow_reads = 0
+        # Waveform dump control (see dump.py), driven by the DUMP
+        # environment variables and by failing checks
+        self.dump = DumpControl(self)
+        self.checker.listeners.append(self.dump.on_fail)
+        if self.dump.mode in ("window", "trigger"):
+            cocotb.fork(self.dump.run())
+        # Edge triggers are reused for every one-clock wait
+        self.clk_rise = RisingEdge(dut.clk)
+        self.clk_fall = FallingEdge(dut.clk)
+
+    def check(self, expr):
+        """count 'expr' as a passed or failed check (see check.py)"""
+        return self.checker.check(expr, depth=2)
+
+    def report_checks(self):
+        """print check counts; raise TestFailure if any checks failed"""
+        self.checker.report()
+        self.dump.report()
+        if os.environ.get("DUMP_TRIGGERS_OUT"):
+            self.dump.save_triggers(os.environ["DUMP_TRIGGERS_OUT"])
+        if self.checker.nchecks_failed:
+            raise cocotb.result.TestFailure(
+                "failed {} checks".format(self.checker.nchecks_failed))
+
+    def ns(self):
+        """return current simulation time in nanoseconds"""
+        return cocotb.utils.get_sim_time(units="ns")
+
+    async def wclk(self, nclk=1, rising=True):
+        """shortcut for await ClockCycles(self.dut.clk, ...)"""
+        if nclk == 1:
+            await (self.clk_rise if rising else self.clk_fall)
+        else:
+            await ClockCycles(self.dut.clk, nclk, rising=rising)
+
+    def handle(self, name):
+        """look up (and cache) the handle for dotted 'name' within dut"""
+        h = self.handles.get(name)
+        if h is None:
+            h = self.dut
+            for part in name.split("."):
+                h = getattr(h, part)
+            self.handles[name] = h
+        return h
+
+    def rdint(self, name):
+        """read signal 'name' as an unsigned integer"""
+        return self.handle(name).value.integer
+
+    def rdsigned(self, name):
+        """read signal 'name' as a two's-complement signed integer"""
+        return self.handle(name).value.signed_integer
+
+    def rdfrac(self, name, nfrac=None):
+        """read signal 'name' as unsigned fixed-point with 'nfrac'
+        fraction bits (default: all bits are below the binary point)"""
+        key = (name, nfrac)
+        lsb = self.lsbs.get(key)
+        if lsb is None:
+            if nfrac is None: nfrac = len(self.handle(name))
+            lsb = self.lsbs[key] = 2.0 ** -nfrac
+        return self.handle(name).value.integer * lsb
+
+    def sample(self, *names):
+        """read several signals at once, as unsigned integers"""
+        return [self.handle(name).value.integer for name in names]
+
+    def bus_idle(self):
+        """release the register-file bus"""
+        h = self.handle
+        h("baddr") <= 0
+        h("bwrdata") <= 0
+        h("bwr") <= 0
+        h("bstrobe") <= 0
+
+    async def wr_burst(self, writes, check=True, verbose=None):
+        """write each (addr, data) in 'writes' on the register-file bus,
+        one per clock, then check each register whose contents signal
+        is known from REGMAP; 'addr' may also be a register name"""
+        h = self.handle
+        regmap = self.REGMAP
+        if verbose is None: verbose = self.verbose
+        written = {}
+        # Bus inputs set now are sampled on the next rising edge, so
+        # each write takes exactly one clock
+        async with self.bus_lock:
+            for addr, data in writes:
+                if regmap is not None: addr = regmap.addr(addr)
+                h("baddr") <= addr
+                h("bwrdata") <= data
+                h("bwr") <= 1
+                h("bstrobe") <= 1
+                await self.wclk()
+                written[addr] = data
+                if verbose:
+                    print("wr {:04x} := {:04x}".format(addr, data))
+            self.bus_idle()
+        if regmap is None:
+            return
+        for addr, data in written.items():
+            reg = regmap.get(addr)
+            if reg is not None and not reg.ro:
+                self.shadow[addr] = data & reg.mask
+        if not check:
+            return
+        # Registers load on the edge of their write; wait one more edge
+        # to see the last of them
+        await self.wclk()
+        for addr, data in written.items():
+            reg = regmap.get(addr)
+            if reg is not None and reg.q is not None:
+                self.check(self.rdint(reg.q) == data & reg.mask)
+
+    def shadow_value(self, addr):
+        """contents of register 'addr' as known without a bus cycle (a
+        read-only constant or the last value written or read), or None"""
+        reg = self.REGMAP.get(addr) if self.REGMAP is not None else None
+        if reg is None:
+            return None
+        if reg.ro:
+            return reg.value
+        return self.shadow.get(addr)
+
+    async def rd_burst(self, addrs, check=True, verbose=None, hw=False):
+        """read each address in 'addrs' and return the list of data
+        read; check each against the corresponding element of list
+        'check', or if 'check' is True, against what REGMAP says the
+        register holds
+
+        Registers whose contents are known (see shadow_value) are read
+        from the shadow register file, and their contents signal
+        checked directly, unless 'hw' is True; only the rest are read
+        on the bus, back to back, one per clock.  Against a 'check'
+        list, a read is served from the shadow only if the register
+        has a contents signal to check it by, so that every read
+        checks the design and not just the shadow."""
+        h = self.handle
+        regmap = self.REGMAP
+        if verbose is None: verbose = self.verbose
+        if regmap is not None:
+            addrs = [regmap.addr(addr) for addr in addrs]
+        result = [None if hw else self.shadow_value(addr) for addr in addrs]
+        if check and check is not True:
+            for i, addr in enumerate(addrs):
+                reg = regmap.get(addr) if regmap is not None else None
+                if reg is None or reg.q is None:
+                    result[i] = None
+        from_bus = [i for i, data in enumerate(result) if data is None]
+        rddata = h("brddata")
+        if from_bus:
+            async with self.bus_lock:
+                for i in from_bus:
+                    h("baddr") <= addrs[i]
+                    h("bwr") <= 0
+                    h("bstrobe") <= 1
+                    # 'brddata' is combinational in 'baddr', so it is
+                    # valid by the next rising edge
+                    await self.wclk()
+                    result[i] = rddata.value.integer
+                self.bus_idle()
+        self.nshadow_reads += len(addrs) - len(from_bus)
+        on_bus = set(from_bus)
+        for i, (addr, data) in enumerate(zip(addrs, result)):
+            if verbose:
+                print("rd {:04x} -> {:04x}{}".format(
+                    addr, data, "" if i in on_bus else " (shadow)"))
+            if check is not True:
+                if check:
+                    self.check(data == check[i])
+                if not check or i in on_bus:
+                    continue
+            reg = regmap.get(addr) if regmap is not None else None
+            if reg is None:
+                continue
+            if reg.q is not None:
+                self.check(data == self.rdint(reg.q))
+            elif reg.value is not None:
+                self.check(data == reg.value)
+            if i in on_bus and not reg.ro:
+                known = self.shadow.get(addr)
+                if known is not None:
+                    self.check(data == known)
+                self.shadow[addr] = data
+        if self.scrub_interval and self.nshadow_reads >= self.scrub_interval:
+            await self.scrub()
+        return result
+
+    async def scrub(self, verbose=None):
+        """read back every register in the shadow register file on the
+        bus, in one burst, and check it against the shadow; return the
+        number of mismatches"""
+        if verbose is None: verbose = self.verbose
+        self.nshadow_reads = 0
+        addrs = [reg.addr for reg in self.REGMAP or []
+                 if self.shadow_value(reg.addr) is not None]
+        data = await self.rd_burst(addrs, check=False, verbose=False,
+                                   hw=True)
+        nbad = 0
+        for addr, got in zip(addrs, data):
+            want = self.shadow_value(addr)
+            if got != want:
+                print("scrub {:04x} : shadow {:04x} bus {:04x}".format(
+                    addr, want, got))
+                nbad += 1
+            self.check(got == want)
+        if verbose:
+            print("scrubbed {} registers, {} mismatches".format(
+                len(addrs), nbad))
+        return nbad
+
+    async def wr(self, addr, data, check=None, verbose=None):
+        """write 'addr' := 'data' on register-file bus, and check that
+        signal 'check' (default: from REGMAP) then holds 'data'"""
+        await self.wr_burst([(addr, data)], check=check is None,
+                            verbose=verbose)
+        if check is not None:
+            await self.wclk()
+            self.check(check.value.integer == data)
+
+    async def rd(self, addr, check=None, verbose=None, hw=False):
+        """read from register-file bus at address 'addr' (see rd_burst
+        for 'hw'), and check the result against 'check' (default: from
+        REGMAP)"""
+        data, = await self.rd_burst(
+            [addr], check=True if check is None else [check],
+            verbose=verbose, hw=hw)
+        return data